@@ -0,0 +1,55 @@
+"""
+Catalog of the available synthesizers and effects.
+
+Used by MainModel (GUI) and by the headless renderer, so it must not depend on Qt.
+"""
+
+from .synths.PhysicModelSynths import *
+from .synths.AdditiveSynths import *
+from .synths.SampleSynths import *
+from .synths.FMSynths import *
+
+from .effects.Effects import *
+
+
+def create_synthesizers():
+    # Add synthesizers here !
+    return [
+        PureToneSynth(),
+        FMSynth(),
+        SaxoTenorSampleSynth(),
+        SaxoSopranoSampleSynth(),
+        PianoSampleSynth(),
+        FM_Bassoon(),
+        FMSynthSax(),
+        DFM_SAX(),
+        DFM_OBOE(),
+        DFM_FrenchHorn(),
+        DFM_Harpsichord(),
+        DFM_PipeOrgan(),
+        DFM_Trumpet(),
+        KSGuitar(),
+        KSDrum(),
+    ]
+
+
+def create_effects():
+    # Add effects here !
+    return [
+        NoEffect(),
+        # DelayEffect(),
+        SimpleEchoEffect(),
+        ReverbEffect(),
+        LowPass_ReverbEffect(),
+        FlangerEffect(),
+        ChorusEffect(),
+        ReberbRIR()
+    ]
+
+
+def find_by_name(elements, name):
+    ''' Returns the synthesizer or effect with the given name (case insensitive), raises ValueError if not found '''
+    for e in elements:
+        if e.name.lower() == name.lower():
+            return e
+    raise ValueError(f"'{name}' not found. Available: {[e.name for e in elements]}")
@@ -11,6 +11,8 @@ from .synths.FMSynths import *
 from .effects.EffectBaseClass import *
 from .effects.Effects import *
 
+from .Catalog import create_synthesizers, create_effects
+
 from .utils.ParamObject import ParameterList
 from .utils.AudioPlayer import AudioPlayer
 from .utils.Worker import Worker
@@ -26,7 +28,7 @@ class MainModel:
     def __init__(self):
         self.verify()
         self.fileImportWorker = Worker(function=self.import_single_file)
-        self.synthTrackManager = SynthTrackManager(framerate=44100)
+        self.synthTrackManager = SynthTrackManager(framerate=44100, backend="threads")
 
         self.synthTrackManager.synthTrackComplete.connect(self.on_song_synthesized)
 
@@ -34,40 +36,15 @@ class MainModel:
     def on_song_synthesized(self, trackName, track_data):
         self.synthesized_tracks[trackName] = track_data
 
-        self.audioPlayer.set_array(track_data["track_array"])
-
-
-    # Add synthesizers here !
-    synthesizers = [
-        PureToneSynth(),
-        FMSynth(),
-        SaxoTenorSampleSynth(),
-        SaxoSopranoSampleSynth(),
-        PianoSampleSynth(),
-        FM_Bassoon(),
-        FMSynthSax(),
-        DFM_SAX(),
-        DFM_OBOE(),
-        DFM_FrenchHorn(),
-        DFM_Harpsichord(),
-        DFM_PipeOrgan(),
-        DFM_Trumpet(),
-        KSGuitar(),
-        KSDrum(),
-    ]
-
-
-    # Add effects here !
-    effects = [
-        NoEffect(),
-        # DelayEffect(),
-        SimpleEchoEffect(),
-        ReverbEffect(),
-        # LowPass_ReverbEffect(),
-        FlangerEffect(),
-        ChorusEffect(),
-        ReberbRIR()
-    ]
+        # A streamed track is already loaded in the player (and may be playing)
+        stream = self.synthTrackManager.get_stream(trackName)
+        if stream is None or not self.audioPlayer.isStreaming(stream):
+            self.audioPlayer.set_array(track_data["track_array"])
+
+
+    # Add synthesizers and effects in Catalog.py !
+    synthesizers = create_synthesizers()
+    effects = create_effects()
 
     def clear_files(self):
         self.file_handler.clear()
@@ -0,0 +1,248 @@
+"""
+Micro-benchmark of every synthesizer and effect of the Catalog (no Qt, no audio device).
+
+Usage (from the repository root):
+    python -m backend.benchmark                                 # print the results
+    python -m backend.benchmark -o bench.json                   # also save them as JSON
+    python -m backend.benchmark --baseline bench.json           # compare against saved results
+    python -m backend.benchmark -k "DFM" -k "Reverb" -r 5       # only some entries, best of 5 runs
+
+Every synth renders the same matrix of notes (low/mid/high pitch x short/long duration) and every effect
+processes the same noise bursts (short/long) with its default parameters (switched on). For each entry it reports:
+- ns/sample: render time per output sample (best of --repeats runs)
+- RTF: real-time factor, render time / audio duration (below 1 renders faster than real time)
+- peak: peak memory allocated while rendering (tracemalloc, measured on a separate run)
+- digest: hash of the output samples. Stochastic synths are seeded, so a changed digest means the output changed
+- control error: for synths with a "Control Rate" parameter (audio rate by default), max difference between the mid
+  short and long notes rendered at CONTROL_RATE and at audio rate (Control Rate = 1), relative to the peak of each note
+
+With --baseline, entries slower than --threshold times the baseline are reported as regressions
+and the exit code is 1.
+"""
+
+import argparse
+import hashlib
+import json
+import platform
+import time
+import tracemalloc
+
+import numpy as np
+
+from backend.Catalog import create_synthesizers, create_effects
+from backend.utils import RenderConfig
+
+
+FRAMERATE = 44100
+
+# Matrix of notes rendered by every synth
+PITCHES = {"low": 40, "mid": 60, "high": 84}
+DURATIONS = {"short": 0.25, "long": 2.0}
+# Control Rate whose error against audio rate is reported
+CONTROL_RATE = 32
+AMPLITUDE = 0.8
+
+
+def measure(function, repeats, setup=None):
+    '''
+    Runs function() repeats times, returns (output, best time [s], peak allocation [bytes]).
+    - setup: called (untimed) before every run, e.g. to clear caches that would make the repeats faster
+    '''
+    if setup is not None:
+        setup()
+    tracemalloc.start()
+    tracemalloc.reset_peak()
+    output = function()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    best = float("inf")
+    for _ in range(repeats):
+        if setup is not None:
+            setup()
+        t0 = time.perf_counter()
+        output = function()
+        best = min(best, time.perf_counter() - t0)
+    return output, best, peak
+
+
+def cell_result(output, seconds, peak):
+    output = np.asarray(output)
+    samples = max(output.size, 1)
+    return {
+        "samples": int(output.size),
+        "seconds": seconds,
+        "ns_per_sample": seconds * 1e9 / samples,
+        "rtf": seconds / (samples / FRAMERATE),
+        "peak_bytes": int(peak),
+        "digest": hashlib.sha1(np.ascontiguousarray(output).tobytes()).hexdigest()[:16],
+    }
+
+
+def summarize(cells):
+    ''' Totals of an entry: ns/sample and RTF over every output sample, max peak allocation '''
+    seconds = sum(cell["seconds"] for cell in cells.values())
+    samples = max(sum(cell["samples"] for cell in cells.values()), 1)
+    return {
+        "ns_per_sample": seconds * 1e9 / samples,
+        "rtf": seconds / (samples / FRAMERATE),
+        "peak_bytes": max(cell["peak_bytes"] for cell in cells.values()),
+        "cells": cells,
+    }
+
+
+def benchmark_synth(synth, repeats):
+    synth.set_sample_rate(FRAMERATE)
+    synth(PITCHES["mid"], AMPLITUDE, DURATIONS["short"], seed=0)     # warm up (lazy loads, first call caches)
+
+    cells = {}
+    for i, (pitch_name, note) in enumerate(PITCHES.items()):
+        for j, (duration_name, duration) in enumerate(DURATIONS.items()):
+            seed = (i, j)
+            # The Karplus-Strong bank would serve every repeat after the first one
+            output, seconds, peak = measure(lambda: synth(note, AMPLITUDE, duration, seed=seed), repeats, getattr(synth, "clear_bank", None))
+            cells[f"{pitch_name}/{duration_name}"] = cell_result(output, seconds, peak)
+    result = summarize(cells)
+    if "Control Rate" in synth.params.keys():
+        result["control_error"] = control_rate_error(synth)
+    return result
+
+
+def control_rate_error(synth, control=CONTROL_RATE):
+    ''' Max error of the mid notes at control rate against audio rate, relative to the peak of each note '''
+    default = synth.params["Control Rate"]
+    error = 0.0
+    try:
+        for duration in DURATIONS.values():
+            synth.params["Control Rate"] = control
+            output = synth(PITCHES["mid"], AMPLITUDE, duration, seed=0)
+            synth.params["Control Rate"] = 1
+            reference = synth(PITCHES["mid"], AMPLITUDE, duration, seed=0)
+            peak = np.max(np.abs(reference))
+            if peak > 0:
+                error = max(error, float(np.max(np.abs(np.float64(output) - reference)) / peak))
+    finally:
+        synth.params["Control Rate"] = default
+    return error
+
+
+def test_signal(duration):
+    ''' Noise burst with a decaying envelope, the input of the effects '''
+    n = int(duration * FRAMERATE)
+    rng = np.random.default_rng(0)
+    return RenderConfig.as_render_dtype(0.5 * rng.uniform(-1, 1, n) * np.exp(-3 * np.arange(n) / n))
+
+
+def benchmark_effect(effect, repeats):
+    # Effects are inactive by default, they would return the input unchanged
+    if "active" in effect.params.keys():
+        effect.params["active"] = True
+    effect.set_sample_rate(FRAMERATE)
+    effect(test_signal(DURATIONS["short"]))    # warm up
+
+    cells = {}
+    for duration_name, duration in DURATIONS.items():
+        sound = test_signal(duration)
+        output, seconds, peak = measure(lambda: effect(sound.copy()), repeats)
+        cells[duration_name] = cell_result(output, seconds, peak)
+    return summarize(cells)
+
+
+def run_benchmarks(filters=None, repeats=3, log=print):
+    ''' Benchmarks the synths and effects whose name contains any of the filters (None: all), returns the results dict '''
+    def selected(name):
+        return not filters or any(f.lower() in name.lower() for f in filters)
+
+    results = {
+        "meta": {
+            "dtype": RenderConfig.get_render_dtype().name,
+            "framerate": FRAMERATE,
+            "repeats": repeats,
+            "numpy": np.__version__,
+            "python": platform.python_version(),
+            "machine": platform.machine(),
+        },
+        "synths": {},
+        "effects": {},
+    }
+    for kind, elements, benchmark in [("synths", create_synthesizers(), benchmark_synth), ("effects", create_effects(), benchmark_effect)]:
+        for element in elements:
+            if not selected(element.name):
+                continue
+            try:
+                results[kind][element.name] = benchmark(element, repeats)
+            except Exception as e:
+                log(f"{element.name}: failed ({e})")
+                continue
+            log(format_row(element.name, results[kind][element.name]))
+    return results
+
+
+def format_row(name, result, baseline=None):
+    row = f"  {name:<32} {result['ns_per_sample']:>10.1f} ns/sample  RTF {result['rtf']:>8.4f}  peak {result['peak_bytes'] / 2**20:>8.2f} MB"
+    if "control_error" in result:
+        row += f"  control error @{CONTROL_RATE} {result['control_error']:.1e}"
+    if baseline is not None:
+        row += f"  x{result['ns_per_sample'] / baseline['ns_per_sample']:.2f} vs baseline"
+    return row
+
+
+def compare(results, baseline, threshold):
+    ''' Prints the results against a baseline, returns the names of the entries slower than threshold times the baseline '''
+    if baseline["meta"].get("dtype") != results["meta"]["dtype"]:
+        print(f"Warning: baseline rendered in {baseline['meta'].get('dtype')}, this run in {results['meta']['dtype']}")
+
+    regressions = []
+    for kind in ["synths", "effects"]:
+        if len(results[kind]) == 0:
+            continue
+        print(f"{kind.capitalize()}:")
+        for name, result in results[kind].items():
+            base = baseline.get(kind, {}).get(name)
+            if base is None:
+                print(format_row(name, result) + "  (new)")
+                continue
+            print(format_row(name, result, base))
+            if result["ns_per_sample"] > threshold * base["ns_per_sample"]:
+                regressions.append(name)
+            changed = [cell for cell, data in result["cells"].items() if cell in base["cells"] and data["digest"] != base["cells"][cell]["digest"]]
+            if changed:
+                print(f"      output changed: {', '.join(changed)}")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m backend.benchmark", description="Benchmark every synthesizer and effect")
+    parser.add_argument("-k", "--filter", action="append", help="only the synths/effects whose name contains this text (can be repeated)")
+    parser.add_argument("-r", "--repeats", type=int, default=3, help="timed runs of each note, the best one is kept (default: 3)")
+    parser.add_argument("-d", "--dtype", choices=["float32", "float64"], default="float32", help="render dtype")
+    parser.add_argument("-o", "--output", help="save the results to this JSON file")
+    parser.add_argument("--baseline", help="JSON file saved with -o to compare against")
+    parser.add_argument("--threshold", type=float, default=1.25, help="slowdown vs the baseline reported as a regression (default: 1.25)")
+    args = parser.parse_args(argv)
+    RenderConfig.set_render_dtype(args.dtype)
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+
+    print(f"Benchmarking ({args.dtype}, best of {args.repeats})...")
+    results = run_benchmarks(args.filter, args.repeats, log=print if baseline is None else (lambda message: None))
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"Results saved to '{args.output}'")
+
+    if baseline is not None:
+        regressions = compare(results, baseline, args.threshold)
+        if regressions:
+            print(f"Regressions (>{args.threshold:.2f}x): {', '.join(regressions)}")
+            return 1
+        print("No regressions")
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
@@ -2,9 +2,15 @@ import numpy as np
 import wave
 import io
 
+from backend.utils.RenderConfig import as_render_dtype, add_into
+
 # DO NOT MODIFY THIS CLASS
 class EffectBaseClass():
     """ Base class for all sound effects"""
+
+    # True if process(k * sound) == k * process(sound) for any gain k
+    amplitude_linear = False
+
     def __init__(self):
         self.name = None
         self.sample_rate = 44100
@@ -14,7 +20,30 @@ class EffectBaseClass():
 
     def __call__(self, sound):
         """ This method is called when the synth is used as a function"""
-        return self.process(sound)
+        return as_render_dtype(self.process(sound))
+
+    def tail_length(self, n_samples):
+        """ Number of samples added by process() to a sound of n_samples (negative if it shortens it).
+        Effects that change the length of the sound must override it, so the track buffer can be sized exactly """
+        return 0
+
+    def render_into(self, out, sound):
+        """ Adds the processed sound to out, a view of at least sound.size + tail_length() samples,
+        and returns the number of samples written.
+        The default processes the sound with __call__ and adds it. Effects can override it to skip the
+        temporaries of process() (see add_into()) """
+        return self.add_into(out, self(sound))
+
+    def add_into(self, out, wave_array):
+        """ Adds a processed sound (in any float dtype) to out as __call__ would return it and returns its number of samples """
+        self.check_fits(out, wave_array.size)
+        add_into(out, wave_array)
+        return wave_array.size
+
+    def check_fits(self, out, n_samples):
+        """ Raises ValueError if a processed sound of n_samples does not fit in out """
+        if n_samples > out.size:
+            raise ValueError(f"{self.name}: sound of {n_samples} samples does not fit in {out.size} samples (wrong tail_length()?)")
 
     def process(self, sound):
         raise NotImplementedError("process() must be implemented in Synth subclass")
\ No newline at end of file
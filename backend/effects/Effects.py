@@ -3,10 +3,112 @@ import numpy as np
 import scipy.signal as signal
 
 from .EffectBaseClass import EffectBaseClass
+from backend.utils.RenderConfig import add_into
 
 from .RIR_data import *
 
+
+COMB_LFILTER_MAX_DELAY = 64     # shorter delays are filtered with lfilter, longer ones block by block
+
+def comb_blocks(x, delay, gain, length, loop_filter=None):
+    """
+    Yields (start, block): consecutive blocks of the length samples of the feedback comb filter
+    y[i] = x[i] + gain * y[i - delay] (y is 0 before 0, x is 0 past its end).
+    loop_filter: (b, a) coefficients of a filter in the feedback path, then y[i] = x[i] + gain * w[i - delay]
+    with w = lfilter(b, a, y).
+    Long delays are computed one delay-long block at a time, without loop_filter with the same operations as the
+    sample loop, so the result is identical. Only two blocks are kept: a block is overwritten after the next one is yielded.
+    Short delays use lfilter with sparse coefficients, in a single block
+    """
+    x = np.asarray(x)
+    if delay == 0:
+        block = np.zeros(length)
+        block[:x.size] = x[:length]
+        yield 0, block
+        return
+
+    if delay < COMB_LFILTER_MAX_DELAY:
+        # Y = X + gain z^-delay B/A Y  ->  Y (A - gain z^-delay B) = A X
+        b_loop, a_loop = loop_filter if loop_filter is not None else ([1.0], [1.0])
+        b_loop, a_loop = np.asarray(b_loop, dtype=np.float64), np.asarray(a_loop, dtype=np.float64)
+        a = np.zeros(delay + max(b_loop.size, a_loop.size))
+        a[:a_loop.size] = a_loop
+        a[delay : delay + b_loop.size] -= gain * b_loop
+        block = np.zeros(length)
+        block[:x.size] = x[:length]
+        yield 0, signal.lfilter(a_loop, a, block)
+        return
+
+    block, previous = np.empty(delay), np.zeros(delay)
+    if loop_filter is not None:
+        b_loop, a_loop = loop_filter
+        filtered, previous_filtered = np.empty(delay), np.zeros(delay)
+        state = np.zeros(max(len(b_loop), len(a_loop)) - 1)
+
+    for start in range(0, length, delay):
+        n = min(delay, length - start)
+        feedback = previous if loop_filter is None else previous_filtered
+        np.multiply(feedback[:n], gain, out=block[:n])
+        source = x[start : start + n]
+        block[:source.size] += source
+        if loop_filter is not None:
+            filtered[:n], state = signal.lfilter(b_loop, a_loop, block[:n], zi=state)
+            filtered, previous_filtered = previous_filtered, filtered
+        yield start, block[:n]
+        block, previous = previous, block
+
+
+def feedback_comb(x, delay, gain, length, loop_filter=None, out=None):
+    """
+    Feedback comb filter of comb_blocks(), returned in a new float64 array of length samples.
+    out: if given, the output is added to out (in the render dtype, see RenderConfig.add_into) block by block
+    instead, without keeping it whole, and out is returned
+    """
+    y = np.empty(length) if out is None else out
+    for start, block in comb_blocks(x, delay, gain, length, loop_filter):
+        if out is None:
+            y[start : start + block.size] = block
+        else:
+            add_into(out[start:], block)
+    return y
+
+
+class CombEffect():
+    """
+    process() and render_into() of the effects that are a feedback comb filter: the output is the sound delayed
+    by offset samples through feedback_comb(), with the parameters of comb_parameters()
+    """
+
+    def comb_parameters(self, n_samples):
+        """ (offset, delay, gain, length, loop_filter) of the comb for a sound of n_samples, offset + length samples in total """
+        raise NotImplementedError("comb_parameters() must be implemented in CombEffect subclass")
+
+    def tail_length(self, n_samples):
+        if not self.params["active"]:
+            return 0
+        offset, delay, gain, length, loop_filter = self.comb_parameters(n_samples)
+        return offset + length - n_samples
+
+    def process(self, sound):
+        if not self.params["active"]:
+            return sound
+        offset, delay, gain, length, loop_filter = self.comb_parameters(len(sound))
+        y = feedback_comb(sound, delay, gain, length, loop_filter)
+        return np.concatenate((np.zeros(offset), y)) if offset > 0 else y
+
+    def render_into(self, out, sound):
+        """ Adds the comb filter output straight into out, keeping only two delay-long blocks of it """
+        if not self.params["active"]:
+            return self.add_into(out, sound)
+        offset, delay, gain, length, loop_filter = self.comb_parameters(len(sound))
+        self.check_fits(out, offset + length)
+        feedback_comb(sound, delay, gain, length, loop_filter, out=out[offset : offset + length])
+        return offset + length
+
+
 class NoEffect(EffectBaseClass):
+    amplitude_linear = True
+
     def __init__(self):
         super().__init__()
         self.name = "No Effect" # Este nombre es el que se muestra en la interfaz
@@ -19,7 +121,9 @@ class NoEffect(EffectBaseClass):
         return sound
 
 
-class DelayEffect(EffectBaseClass):
+class DelayEffect(CombEffect, EffectBaseClass):
+    amplitude_linear = True
+
     def __init__(self):
         super().__init__()
         self.name = "Delay Effect" # Este nombre es el que se muestra en la interfaz
@@ -31,27 +135,22 @@ class DelayEffect(EffectBaseClass):
             NumParam("feedback", interval=(0.01, 1), value=0.99, step=0.01, text="Feedback [0, 1]"),
         )
 
-    def process(self, sound):
-        """ Apply a delay effect to the sound """
+    def comb_parameters(self, n_samples):
+        """ Delay effect: the sound is delayed and repeated with feedback gain """
         delay_time = self.params["delay"]
         feedback = self.params["feedback"]
-        active = self.params["active"]
-        if not active:
-            return sound
 
-        # Add zeros at the end of the sound array to allow for the delay effect
-        sound = np.append(sound, np.zeros(int(5 * delay_time * self.sample_rate * (1/(1 - feedback*0.9)))))
+        # Zeros at the end of the sound allow for the delay effect
+        padding = int(5 * delay_time * self.sample_rate * (1/(1 - feedback*0.9)))
 
         delay_samples = int(delay_time * self.sample_rate)
-        delayed_sound = np.zeros(len(sound) + delay_samples)
 
-        # Apply delay effect
-        for i in range(len(sound)):
-            delayed_sound[i + delay_samples] += sound[i] + feedback * delayed_sound[i]
-
-        return delayed_sound
+        # delayed_sound[i + delay_samples] = sound[i] + feedback * delayed_sound[i]
+        return delay_samples, delay_samples, feedback, n_samples + padding, None
     
-class SimpleEchoEffect(EffectBaseClass):
+class SimpleEchoEffect(CombEffect, EffectBaseClass):
+    amplitude_linear = True
+
     def __init__(self):
         super().__init__()
         self.name = "Simple Echo Effect" # Este nombre es el que se muestra en la interfaz
@@ -63,33 +162,20 @@ class SimpleEchoEffect(EffectBaseClass):
             NumParam("atenuation", interval=(0, 0.99), value=0.5, step=0.01, text="Atenuation"),
         )
     
-    def process(self, sound):
-        """ Apply a delay effect to the sound """
-        delay_time = float(len(sound)/self.sample_rate)
+    def comb_parameters(self, n_samples):
+        """ Echo of the whole sound: sound_out[i] = sound[i] + sound_out[i - delay_samples]*atenuation """
+        delay_time = float(n_samples/self.sample_rate)
         atenuation = float(self.params["atenuation"])
         duratio = float(self.params["Duration"])
-        active = self.params["active"]
-        if not active:
-            return sound
         
         delay_samples = int(delay_time * self.sample_rate) +1 
         
-        #amplio el array
-        new_sound = np.append(np.zeros(delay_samples), sound)
-        new_sound = np.append(new_sound, np.zeros(int(duratio*delay_samples)))
-        
-        
-        sound_out = np.zeros(len(new_sound)+delay_samples)
-        
-        
-        for i in range(delay_samples, len(sound_out)):
-            sound_out[i] = new_sound[i-delay_samples] + sound_out[i - delay_samples]*atenuation
-        echo_effect = sound_out[(2*delay_samples):]
-        
-        
-        return echo_effect
+        #amplio el array con las repeticiones
+        return 0, delay_samples, atenuation, n_samples + int(duratio*delay_samples), None
     
-class ReverbEffect(EffectBaseClass):
+class ReverbEffect(CombEffect, EffectBaseClass):
+    amplitude_linear = True
+
     def __init__(self):
         super().__init__()
         self.name = "Reverb Effect" # Este nombre es el que se muestra en la interfaz
@@ -102,33 +188,20 @@ class ReverbEffect(EffectBaseClass):
             NumParam("atenuation", interval=(0, 0.99), value=0.5, step=0.01, text="Atenuation"),
         )
     
-    def process(self, sound):
-        """ Apply a delay effect to the sound """
+    def comb_parameters(self, n_samples):
+        """ sound_out[i] = sound[i] + sound_out[i - delay_samples]*atenuation """
         delay_time = float(self.params["delay"])
         atenuation = float(self.params["atenuation"])
         duratio = float(self.params["Duration"])
-        active = self.params["active"]
-        if not active:
-            return sound
         
         delay_samples = int(delay_time * self.sample_rate) +1 
         
-        #amplio el array
-        new_sound = np.append(np.zeros(delay_samples), sound)
-        new_sound = np.append(new_sound, np.zeros(int(duratio*delay_samples)))
-        
-        
-        sound_out = np.zeros(len(new_sound)+delay_samples)
-        
-        
-        for i in range(delay_samples, len(sound_out)):
-            sound_out[i] = new_sound[i-delay_samples] + sound_out[i - delay_samples]*atenuation
-        reverb_effect = sound_out[(2*delay_samples):]
-        
-        
-        return reverb_effect
+        #amplio el array con las repeticiones
+        return 0, delay_samples, atenuation, n_samples + int(duratio*delay_samples), None
+
+class LowPass_ReverbEffect(CombEffect, EffectBaseClass):
+    amplitude_linear = True
 
-class LowPass_ReverbEffect(EffectBaseClass):
     def __init__(self):
         super().__init__()
         self.name = "Lowpass Reverb Effect" # Este nombre es el que se muestra en la interfaz
@@ -138,52 +211,36 @@ class LowPass_ReverbEffect(EffectBaseClass):
             BoolParam("active", value=False, text="Active"),
             NumParam("delay", interval=(0, 1.2), value=0.5, step=0.01, text="Delay time [s]"),
             NumParam("Duration", interval=(0, 8), value=1, step=0.1, text="Durantion [repetitions]"),
-            # NumParam("atenuation", interval=(0, 0.99), value=0.5, step=0.01, text="Atenuation"),
+            NumParam("atenuation", interval=(0, 0.99), value=0.5, step=0.01, text="Atenuation"),
             NumParam("Fb", interval=(25, 1000), value=500, step=1, text="Fb"),
         )
     
     
-    def process(self, sound):
-        """ Apply a delay effect to the sound """
+    def comb_parameters(self, n_samples):
+        """ Reverb whose repetitions go through a low pass filter of cutoff Fb, each one darker than the previous:
+        sound_out[i] = sound[i] + atenuation*lowpass(sound_out)[i - delay_samples] """
         delay_time = float(self.params["delay"])
         fb = float(self.params["Fb"])
         duratio = float(self.params["Duration"])
-        # atenuation = float(self.params["atenuation"])
-        active = self.params["active"]
-        if not active:
-            return sound
+        atenuation = float(self.params["atenuation"])
         
         delay_samples = int(delay_time * self.sample_rate) +1 
         
-        #amplio el array
-        new_sound = np.append(np.zeros(delay_samples), sound)
-        new_sound = np.append(new_sound, np.zeros(int(duratio*delay_samples)))
-        n = int(np.ceil((4*self.sample_rate) / fb))
-        
-        sound_out = np.zeros(len(new_sound)+delay_samples)
-        impulse_lowpass = self.low_pass_filter(fb, n)
-        
-        for i in range(delay_samples, len(sound_out)):
-            b = np.convolve(sound_out, impulse_lowpass, mode='valid')
-            sound_out[i] = new_sound[i] + b[i - delay_samples]
-        reverb_effect = sound_out[(2*delay_samples):]
-        
-        return reverb_effect
+        #amplio el array con las repeticiones
+        return 0, delay_samples, atenuation, n_samples + int(duratio*delay_samples), self.low_pass_filter(fb)
 
     #pasa bajos
-    def low_pass_filter(self, fb, n):
+    def low_pass_filter(self, fb):
+        """ (b, a) of the first order low pass (1 + A(z))/2, A(z) = (a1 + z^-1)/(1 + a1 z^-1) the all pass of cutoff fb """
         a1 = (np.tan(np.pi*fb/self.sample_rate)-1)/(np.tan(np.pi*fb/self.sample_rate)+1)
-        x = np.zeros(n)
-        x[0] = 1
-        y = np.zeros(len(x))
-        for i in range(1, len(x)):
-            y[i] = a1*x[i] + x[i-1] - a1*y[i-1]
-        low_pass_output = y
-
-        return low_pass_output
+        b = np.array([1 + a1, 1 + a1]) / 2
+        a = np.array([1, a1])
+        return b, a
     
 
 class FlangerEffect(EffectBaseClass):
+    amplitude_linear = True
+
     def __init__(self):
         super().__init__()
         self.name = "Flanger Effect" # Este nombre es el que se muestra en la interfaz
@@ -222,6 +279,8 @@ class FlangerEffect(EffectBaseClass):
         return flanger_effect
     
 class ChorusEffect(EffectBaseClass):
+    amplitude_linear = True
+
     def __init__(self):
         super().__init__()
         self.name = "Chorus Effect" # Este nombre es el que se muestra en la interfaz
@@ -283,6 +342,8 @@ class ChorusEffect(EffectBaseClass):
     
 
 class ReberbRIR(EffectBaseClass):
+    amplitude_linear = True
+
     def __init__(self):
         super().__init__()
         self.name = "RIR Reberb" # Este nombre es el que se muestra en la interfaz
@@ -301,6 +362,22 @@ class ReberbRIR(EffectBaseClass):
         )   
         
 
+    def tail_length(self, n_samples):
+        if not self.params["active"]:
+            return 0
+        n0 = int(self.params["t0"] * self.sample_rate)
+        n1 = self.rir_len - int(self.params["t1"] * self.sample_rate) - 1
+        rir_samples = n1 - n0
+
+        mode = self.params["mode"]
+        if mode == "full":
+            return rir_samples - 1
+        elif mode == "valid":
+            return max(n_samples, rir_samples) - min(n_samples, rir_samples) + 1 - n_samples
+        elif self.params["lib"] == "numpy":     # numpy "same" returns the longest of both
+            return max(n_samples, rir_samples) - n_samples
+        return 0
+
     def process(self, sound):
         """ Apply no effect to the sound"""
 
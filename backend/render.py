@@ -0,0 +1,157 @@
+"""
+Headless MIDI to WAV renderer (no Qt, no audio device).
+
+Usage (from the repository root):
+    python -m backend.render song.mid -o song.wav -i "DFM Sax Synthesizer" -e "Reverb Effect"
+    python -m backend.render song.mid -m 0="Piano Samples" -m 9="Karplus-Strong Drum:Simple Echo Effect"
+    python -m backend.render --list
+
+Every channel is rendered with the default instrument/effect unless it is mapped with -m CHANNEL=INSTRUMENT[:EFFECT].
+The notes of every channel are rendered in parallel in a single process pool and mixed like the Track Mixer does.
+"""
+
+import argparse
+import time
+import wave
+from concurrent.futures import as_completed
+
+import numpy as np
+
+from backend.handlers.MIDIHandler import MIDIFilesHandler
+from backend.Catalog import create_synthesizers, create_effects, find_by_name
+from backend.utils.ProcessPool import create_process_pool, submit_task, default_worker_count
+from backend.utils.TrackRenderer import TrackRenderer, render_note_batch
+from backend.utils import RenderConfig
+
+
+FRAMERATE = 44100
+
+
+def render_channel_batch(channel, task_ids, notes, amplitudes, durations, seeds, channel_tools):
+    ''' Process pool task: renders a batch of notes of a channel, returns (channel, [(task_id, wave_array), ...]) '''
+    instrument, effect = channel_tools[channel]
+    return channel, render_note_batch(task_ids, notes, amplitudes, durations, seeds, instrument, effect)
+
+
+def parse_mapping(mappings, synthesizers, effects, default_instrument, default_effect):
+    ''' Parses the -m CHANNEL=INSTRUMENT[:EFFECT] arguments, returns a dict channel -> (instrument, effect) '''
+    channel_tools = {}
+    for mapping in mappings:
+        if "=" not in mapping:
+            raise ValueError(f"Bad mapping '{mapping}', expected CHANNEL=INSTRUMENT[:EFFECT]")
+        channel, tools = mapping.split("=", 1)
+        instrument_name, _, effect_name = tools.partition(":")
+        instrument = find_by_name(synthesizers, instrument_name) if instrument_name else default_instrument
+        effect = find_by_name(effects, effect_name) if effect_name else default_effect
+        channel_tools[int(channel)] = (instrument, effect)
+    return channel_tools
+
+
+def render_midi(path, channel_tools, default_tools, channels=None, volume=1.0, max_workers=None, seed=0):
+    '''
+    Renders the channels of a MIDI file and returns (mix_array, {channel: track_array})
+    - channel_tools: dict channel -> (instrument, effect), other channels use default_tools
+    - channels: channels to render (None: all)
+    - max_workers: processes used to render (1: render in this process)
+    - seed: seed of the stochastic synths (channel c uses seed + c), None for a different render every time
+    '''
+    midi_handler = MIDIFilesHandler()
+    if not midi_handler.import_file(path):
+        raise ValueError(f"Could not import '{path}'")
+    midi_data = midi_handler.parseMidiNotes(path)
+
+    renderers = {}
+    tools = {}
+    for channel in midi_data.channels():
+        if channels is not None and channel not in channels:
+            continue
+        notes = midi_data.getChannelNotes(channel)
+        if len(notes) == 0:
+            continue
+        tools[channel] = channel_tools.get(channel, default_tools)
+        instrument, effect = tools[channel]
+        print(f"Channel {channel:>2} {midi_data.channel_data[channel]['title']:<30} {len(notes):>5} notes -> {instrument.name} / {effect.name}")
+        renderers[channel] = TrackRenderer(FRAMERATE, instrument, notes, volume, effect, seed=seed + channel if seed is not None else None)
+
+    if max_workers == 1:
+        for renderer in renderers.values():
+            renderer.render(max_workers=1)
+    else:
+        with create_process_pool(render_channel_batch, (tools,), max_workers) as executor:
+            futures = [submit_task(executor, (channel, *task)) for channel, renderer in renderers.items() for task in renderer.tasks]
+            for future in as_completed(futures):
+                channel, note_synth_packs = future.result()
+                renderers[channel].mix_results(note_synth_packs)
+
+    tracks = {channel: renderer.finish() for channel, renderer in renderers.items()}
+    mix_array = RenderConfig.zeros(max([track.size for track in tracks.values()], default=0))
+    for track in tracks.values():
+        mix_array[:track.size] += track
+    return mix_array, tracks
+
+
+def write_wav(path, array, framerate=FRAMERATE):
+    ''' Writes a mono 16 bit WAV file (samples are clipped to [-1, 1]) '''
+    array = np.int16(np.clip(array, -1.0, 1.0) * 32767)
+    with wave.open(path, 'wb') as wo:
+        wo.setnchannels(1)
+        wo.setsampwidth(2)
+        wo.setframerate(framerate)
+        wo.writeframes(array.tobytes())
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m backend.render", description="Render a MIDI file to WAV without the GUI")
+    parser.add_argument("midi", nargs="?", help="MIDI file to render")
+    parser.add_argument("-o", "--output", help="output WAV file (default: <midi name>.wav)")
+    parser.add_argument("-i", "--instrument", help="default instrument for every channel (default: first one of --list)")
+    parser.add_argument("-e", "--effect", help="default effect for every channel (default: first one of --list)")
+    parser.add_argument("-m", "--map", action="append", default=[], metavar="CHANNEL=INSTRUMENT[:EFFECT]", help="instrument/effect of a channel")
+    parser.add_argument("-c", "--channels", type=int, nargs="+", help="render only these channels")
+    parser.add_argument("-v", "--volume", type=float, default=1.0, help="volume of every channel (0-1)")
+    parser.add_argument("-n", "--normalize", action="store_true", help="scale the mix so its peak is 0.98")
+    parser.add_argument("-w", "--workers", type=int, default=None, help=f"rendering processes (default: {default_worker_count()}, 1: no pool)")
+    parser.add_argument("-d", "--dtype", choices=["float32", "float64"], default="float32", help="render dtype")
+    parser.add_argument("-s", "--seed", type=int, default=0, help="seed of the stochastic instruments (default: 0)")
+    parser.add_argument("--random", action="store_true", help="do not seed the stochastic instruments")
+    parser.add_argument("--list", action="store_true", help="list the available instruments and effects")
+    args = parser.parse_args(argv)
+    RenderConfig.set_render_dtype(args.dtype)
+
+    synthesizers = create_synthesizers()
+    effects = create_effects()
+
+    if args.list:
+        print("Instruments:\n  " + "\n  ".join(s.name for s in synthesizers))
+        print("Effects:\n  " + "\n  ".join(e.name for e in effects))
+        return 0
+    if args.midi is None:
+        parser.error("a MIDI file is required")
+
+    try:
+        default_tools = (find_by_name(synthesizers, args.instrument) if args.instrument else synthesizers[0],
+                         find_by_name(effects, args.effect) if args.effect else effects[0])
+        channel_tools = parse_mapping(args.map, synthesizers, effects, *default_tools)
+    except ValueError as e:
+        parser.error(str(e))
+    output = args.output or args.midi.rsplit(".", 1)[0] + ".wav"
+
+    t0 = time.perf_counter()
+    seed = None if args.random else args.seed
+    mix_array, _ = render_midi(args.midi, channel_tools, default_tools, args.channels, args.volume, args.workers, seed)
+    elapsed = time.perf_counter() - t0
+
+    peak = np.max(np.abs(mix_array)) if mix_array.size > 0 else 0.0
+    if args.normalize and peak > 0:
+        mix_array = mix_array * (0.98 / peak)
+    elif peak > 1.0:
+        print(f"Warning: mix peak is {peak:.2f}, samples will be clipped (use --normalize or --volume)")
+
+    write_wav(output, mix_array)
+    duration = mix_array.size / FRAMERATE
+    print(f"Wrote '{output}': {duration:.2f} s rendered in {elapsed:.2f} s ({duration / max(elapsed, 1e-9):.1f}x real time)")
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
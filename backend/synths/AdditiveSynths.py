@@ -5,8 +5,20 @@ from scipy import signal
 from .EnvelopeModulators import LinearADSR, ModFunction
 from .SynthBaseClass import SynthBaseClass
 
-class PureToneSynth(SynthBaseClass):
+
+class GenerateRenderInto():
+    """ render_into() of the synths whose generate() takes an out array: the note is generated into one
+    float64 buffer (the phase is computed in it) and added to out in the render dtype, without the copy of __call__ """
+
+    def render_into(self, out, note, amp, duration, seed=None):
+        wave_array = self.generate(self.note_input(note), amp, duration, out=np.empty(self.note_length(note, duration)))
+        return self.add_into(out, wave_array)
+
+
+class PureToneSynth(GenerateRenderInto, SynthBaseClass):
     """ Simple pure tone synthesizer"""
+    amplitude_linear = True
+
     def __init__(self):
         super().__init__()
 
@@ -23,12 +35,17 @@ class PureToneSynth(SynthBaseClass):
         )
 
 
-    def generate(self, freq, amp, duration):
+    def note_length(self, note, duration):
+        R = self.params["R"]
+        return int((duration + R) * self.sample_rate)
+
+    def generate(self, freq, amp, duration, out=None):
         """ 
         Generate a pure tone with the given frequency, amplitude and duration
         - freq: tone frequency [Hz]
         - amp: tone amplitude [0, 1]
         - duration: on-off note duration [s]  
+        - out: float64 array of note_length() samples where the note is written (a new array if None)
         """
         wtype = self.params["waveform"]
         wave = None
@@ -52,13 +69,20 @@ class PureToneSynth(SynthBaseClass):
 
         t = adsr.time()
 
-        out = amp * wave(2 * np.pi * freq * t)
+        out = np.multiply(2 * np.pi * freq, t, out=out)     # phase, replaced by the wave
+        if wtype == "Sine":
+            np.sin(out, out=out)
+        else:
+            out[...] = wave(out)
+        out *= amp
 
-        return out * adsr.envelope()
+        return adsr.apply(out)
     
 
-class GuitarAdditive(SynthBaseClass):
+class GuitarAdditive(GenerateRenderInto, SynthBaseClass):
     """ Simple pure tone synthesizer"""
+    amplitude_linear = True
+
     def __init__(self):
         super().__init__()
 
@@ -74,12 +98,17 @@ class GuitarAdditive(SynthBaseClass):
         )
 
 
-    def generate(self, freq, amp, duration):
+    def note_length(self, note, duration):
+        R = self.params["R"]
+        return int((duration + R) * self.sample_rate)
+
+    def generate(self, freq, amp, duration, out=None):
         """ 
         Generate a pure tone with the given frequency, amplitude and duration
         - freq: tone frequency [Hz]
         - amp: tone amplitude [0, 1]
         - duration: on-off note duration [s]  
+        - out: float64 array of note_length() samples where the note is written (a new array if None)
         """        
         partials = [   # [freq, amp]
             (130.66, 0.1811),
@@ -105,12 +134,20 @@ class GuitarAdditive(SynthBaseClass):
         
         t = adsr.time()
 
-        out = np.zeros(len(t))
+        if out is None:
+            out = np.zeros(len(t))
+        else:
+            out[...] = 0.0
 
+        partial = np.empty(len(t))
         for f, a in partials:
-            out += a * np.sin(2 * np.pi * f * t)
+            np.multiply(2 * np.pi * f, t, out=partial)
+            np.sin(partial, out=partial)
+            partial *= a
+            out += partial
 
-        return amp * out * adsr.envelope()
+        out *= amp
+        return adsr.apply(out)
 
 
 
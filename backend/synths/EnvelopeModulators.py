@@ -1,4 +1,36 @@
 import numpy as np
+from functools import lru_cache
+
+from backend.utils.RenderConfig import as_render_dtype, get_render_dtype
+from backend.utils.TimeAxis import time_axis
+
+
+def control_rate(curve, t, decimation, *args):
+    """ Evaluates a slowly varying curve(t, *args) at control rate: every decimation samples of t (evenly spaced)
+    and at the last one, linearly interpolated to every sample. Returns the curve in the render dtype
+    decimation 1 (or notes shorter than two control periods) evaluates curve on every sample
+    """
+    decimation = int(decimation)
+    n = t.size
+    if decimation <= 1 or n < 2 * decimation:
+        return as_render_dtype(curve(t, *args))
+
+    blocks = (n - 1) // decimation
+    knots = np.empty(blocks + 2)
+    knots[:blocks + 1] = curve(t[:blocks * decimation + 1:decimation], *args)
+    knots[blocks + 1] = curve(t[-1:], *args)[0]
+    knots = as_render_dtype(knots)
+
+    output = np.empty(n, dtype=knots.dtype)
+    ramp = as_render_dtype(np.arange(decimation) / decimation)
+    body = output[:blocks * decimation].reshape(blocks, decimation)
+    np.multiply((knots[1:blocks + 1] - knots[:blocks])[:, np.newaxis], ramp, out=body)
+    body += knots[:blocks, np.newaxis]
+
+    # The last knot is the last sample, the tail is shorter than a control period
+    tail = n - blocks * decimation
+    output[blocks * decimation:] = knots[blocks] + (knots[blocks + 1] - knots[blocks]) * (np.arange(tail) / max(tail - 1, 1))
+    return output
 
 
 #   FUNCTION MODULATOR
@@ -6,6 +38,7 @@ class ModFunction():
     def __init__(self, type="linear", n=1.0):
         if n < 0.1 or n > 20:
             raise ValueError("ModFunction n must be between 0.1 and 20")
+        self.key = (type, float(n))     # identifies the function in the envelope template cache
         
         match type:
             case "linear":
@@ -39,6 +72,34 @@ class ModFunction():
 
 
 
+@lru_cache(maxsize=128)
+def adsr_templates(attack_key, decay_key, release_key, k, A, D, R, sample_rate, dtype_name):
+    """
+    Cached (head, tail) segments of a LinearADSR, sampled at n / sample_rate in the render dtype:
+    - head: attack (0 to k) followed by decay (k to 1)
+    - tail: release (1 to 0)
+    The functions are validated here once, envelopes only copy the segments
+    """
+    attack_function, decay_function, release_function = ModFunction(*attack_key), ModFunction(*decay_key), ModFunction(*release_key)
+    n_attack = int(np.ceil(A * sample_rate))
+    n_head = max(int(np.ceil((A + D) * sample_rate)), n_attack)
+    t = time_axis(n_head, sample_rate)
+
+    head = np.empty(n_head)
+    if n_attack > 0:
+        head[:n_attack] = attack_function.mod(np.minimum(t[:n_attack], A), x1=A, y1=k)
+    if n_head > n_attack:
+        head[n_attack:] = decay_function.mod(np.clip(t[n_attack:], A, A + D), x0=A, x1=A+D, y0=k*1, y1=1)
+
+    n_release = int(np.ceil(R * sample_rate))
+    tail = release_function.mod(np.minimum(time_axis(n_release, sample_rate), R), x0=0.0, x1=R, y0=1, y1=0) if n_release > 0 else np.empty(0)
+
+    head, tail = as_render_dtype(head), as_render_dtype(tail)
+    head.flags.writeable = False
+    tail.flags.writeable = False
+    return head, tail
+
+
 class LinearADSR():
     def __init__(self, k, A, D, R, modType="polyFlatTop",n=3.0):
         self.k = k
@@ -53,69 +114,70 @@ class LinearADSR():
 
 
     def set_tone_duration(self, tone_duration, sample_rate=44100):
+        self.sample_rate = sample_rate
         points = int((tone_duration + self.release) * sample_rate)
-        self.t = np.linspace(0, tone_duration + self.release, points, endpoint=False)
+        self.t = time_axis(points, sample_rate)
 
         if tone_duration < self.attack + self.decay:
             tone_duration = self.attack + self.decay
         self.sustain = tone_duration - self.attack - self.decay        
+        self.release_time = self.attack + self.decay + self.sustain
 
     def set_total_time(self, total_time, sample_rate=44100):
+        self.sample_rate = sample_rate
         points = int(total_time * sample_rate)
-        self.t = np.linspace(0, total_time, points, endpoint=False)
+        self.t = time_axis(points, sample_rate)
 
         if total_time < self.attack + self.decay + self.release:
             raise Exception("LinearADSR: Total time must be greater than A+D+R")
         self.sustain = total_time - self.attack - self.decay - self.release
+        self.release_time = self.attack + self.decay + self.sustain
 
     def time(self):
         return self.t
 
-    def envelope(self):
-        """ Generate the ADSR envelope for a given time array t and note duration
-        t: numpy array of time values
-        duration: total duration of the note in seconds (from on to off)
+    def segments(self):
+        """ (head, tail, head_end, release_start, release_end) of the envelope over time()
+        The release starts at A + D + S: a note shorter than A + D finishes its decay before releasing
         """
-        # Calculate the sustain phase duration
-
         if self.sustain is None:
             raise Exception("LinearADSR: You must call 'set_tone_duration(d)' or 'set_total_time(t)' before calling envelope()")
 
-        k = self.k
-        A = self.attack
-        D = self.decay
-        S = self.sustain
-        R = self.release
-        t = self.t
-        
-        # Create an output array of the same shape as t
-        output = np.zeros_like(t)
+        head, tail = adsr_templates(self.attackFunction.key, self.decayFunction.key, self.releaseFunction.key,
+                                    float(self.k), float(self.attack), float(self.decay), float(self.release),
+                                    self.sample_rate, get_render_dtype().name)
+        n = self.t.size
+        release_start = min(int(np.searchsorted(self.t, self.release_time)), n)
+        release_end = min(release_start + tail.size, n)
+        head_end = min(head.size, release_start)
+        return head, tail, head_end, release_start, release_end
 
-        # Attack phase
-        if A > 0.0:
-            attack_mask = t < A
-            output[attack_mask] = self.attackFunction.mod(t[attack_mask], x1=A, y1=k)
-        
-        # Decay phase
-        if D > 0.0:
-            decay_mask = (t >= A) & (t < A + D)
-            output[decay_mask] = self.decayFunction.mod(t[decay_mask], x0=A, x1=A+D, y0=k*1, y1=1)            
-        
-        # Sustain phase
-        if S > 0.0:
-            sustain_mask = (t >= A + D) & (t < A + D + S)
-            output[sustain_mask] = 1.0
-        
-        # Release phase
-        if R > 0.0:
-            release_mask = (t >= A + D + S) & (t < A + D + S + R)
-            output[release_mask] = self.releaseFunction.mod(t[release_mask], x0=A+D+S, x1=A+D+S+R, y0=1, y1=0)
-                
+    def envelope(self):
+        """ Generate the ADSR envelope over time() (in the render dtype)
+        The attack + decay head and the release tail are cached templates (see adsr_templates), so an envelope
+        is two copies and a constant sustain fill. The envelope is 0 after the release
+        """
+        head, tail, head_end, release_start, release_end = self.segments()
+        n = self.t.size
+
+        output = np.empty(n, dtype=head.dtype)
+        output[:head_end] = head[:head_end]
+        output[head_end:release_start] = 1.0
+        output[release_start:release_end] = tail[:release_end - release_start]
+        output[release_end:] = 0.0
         return output
-    
 
-    
-    
+    def apply(self, wave):
+        """ Multiplies wave by the envelope in place and returns it (same values as wave * envelope())
+        wave: array over time() in its last axis. The sustain (1) is not touched, samples after the release are zeroed
+        """
+        head, tail, head_end, release_start, release_end = self.segments()
+        wave[..., :head_end] *= head[:head_end]
+        wave[..., release_start:release_end] *= tail[:release_end - release_start]
+        wave[..., release_end:self.t.size] = 0.0
+        return wave
+
+
 class WoodwindEnvelope():
     def __init__(self, amp, k, A, D, R):
         self.A = amp
@@ -5,18 +5,95 @@ import numpy as np
 from .EnvelopeModulators import LinearADSR
 from .EnvelopeModulators import WoodwindEnvelope
 from .EnvelopeModulators import WoodwindModEnvelope
+from .EnvelopeModulators import control_rate
 from scipy.signal import sawtooth
-
-def FM_senoidal(t, fp, fm, amplitude, m):
-    return amplitude * np.sin(2 * np.pi * fp * t - (np.pi /2) +  m * np.sin(2 * np.pi * fm * t - (np.pi /2)))
+from backend.utils.RenderConfig import render_sin, as_render_dtype, get_render_dtype
+from backend.utils.TimeAxis import time_axis
+from fractions import Fraction
+from functools import lru_cache
+from math import lcm
+
+def FM_senoidal(t, fp, fm, amplitude, m, out=None):
+    """ amplitude * sin(2 pi fp t - pi/2 + m sin(2 pi fm t - pi/2)), written into out if given (render dtype) """
+    phase = np.multiply(2 * np.pi * fm, t)
+    phase -= np.pi / 2
+    modulation = render_sin(phase)
+    modulation *= m
+    np.multiply(2 * np.pi * fp, t, out=phase)
+    phase -= np.pi / 2
+    phase += modulation
+    out = render_sin(phase, out=out)
+    out *= amplitude
+    return out
 
 def DFM(t, f1, f2, amplitude, I1, I2, attack_time, k):
     tau = attack_time/4
-    return amplitude * np.sin( I1 * np.sin(2 * np.pi * f1 * (1-k* np.exp(-t/tau)) * t) +  I2 * np.sin(2 * np.pi * f2 *(1-k * np.exp(-t/tau)) * t) )
+    return amplitude * render_sin( I1 * render_sin(2 * np.pi * f1 * (1-k* np.exp(-t/tau)) * t) +  I2 * render_sin(2 * np.pi * f2 *(1-k * np.exp(-t/tau)) * t) )
 
 def DFM_1(t, f1, f2, amplitude, I1, I2):
 
-    return amplitude * np.sin( I1 * np.sin(2 * np.pi * f1 * t) +  I2 * np.sin(2 * np.pi * f2 * t) )
+    return amplitude * render_sin( I1 * render_sin(2 * np.pi * f1 * t) +  I2 * render_sin(2 * np.pi * f2 * t) )
+
+
+# Period tiling of the DFM sums (see DFM_sum)
+POINTS_PER_PERIOD = 1 << 14         # min table samples per fundamental period, linear interpolation keeps the error below 1e-6
+MAX_RATIO_DENOMINATOR = 8           # multipliers are harmonic if they are ratios p/q with q up to this
+MAX_TABLE_PERIODS = 8               # longer periods (e.g. ratios 1/5 and 1/7 together) are evaluated exactly
+
+def harmonic_period(multipliers):
+    """ Number of fundamental periods after which every multiplier * f repeats, None if a multiplier is not a simple ratio """
+    periods = 1
+    for N in multipliers:
+        ratio = Fraction(N).limit_denominator(MAX_RATIO_DENOMINATOR)
+        if abs(float(ratio) - N) > 1e-9:
+            return None
+        periods = lcm(periods, ratio.denominator)
+    return periods
+
+def period_table_size(periods):
+    """ Table samples for a period of periods fundamental periods: a power of two with at least POINTS_PER_PERIOD per fundamental period """
+    return 1 << (periods * POINTS_PER_PERIOD - 1).bit_length()
+
+@lru_cache(maxsize=64)
+def DFM_period_table(components, periods):
+    """ (values, slopes) of one period of the DFM sum sampled at period_table_size(periods) points, computed in float64 """
+    size = period_table_size(periods)
+    phase = 2 * np.pi * periods * np.arange(size + 1) / size
+    table = sum(amplitude * np.sin(I1 * np.sin(N1 * phase) + I2 * np.sin(N2 * phase)) for amplitude, N1, N2, I1, I2 in components)
+    return as_render_dtype(table[:-1]), as_render_dtype(np.diff(table))
+
+def DFM_sum(t, freq, components, out=None):
+    """
+    Sum of DFM_1(t, N1 * freq, N2 * freq, amplitude, I1, I2) for each (amplitude, N1, N2, I1, I2) of components.
+    If every multiplier is a simple ratio the sum is periodic: one period is computed and tiled over t
+    with a table lookup, instead of evaluating the nested sines on every sample.
+    float64 renders and periods longer than MAX_TABLE_PERIODS keep the exact evaluation
+    - out: array in the render dtype where the sum is written (a new array if None)
+    """
+    components = tuple(tuple(float(x) for x in component) for component in components)
+    periods = harmonic_period([N for _, N1, N2, _, _ in components for N in (N1, N2)])
+    if periods is None or periods > MAX_TABLE_PERIODS or get_render_dtype() == np.float64:
+        wave = sum(DFM_1(t, N1 * freq, N2 * freq, amplitude, I1, I2) for amplitude, N1, N2, I1, I2 in components)
+        if out is None:
+            return wave
+        out[...] = wave
+        return out
+
+    values, slopes = DFM_period_table(components, periods)
+    size = values.size
+    position = t * (freq * size / periods)
+    index = position.astype(np.int64)
+    position -= index
+    if out is None:
+        out = np.empty(position.shape, dtype=values.dtype)
+    np.copyto(out, position, casting="same_kind")      # fraction of the table step
+    del position
+    index &= size - 1
+    table = np.take(slopes, index, mode="clip")
+    out *= table
+    np.take(values, index, out=table, mode="clip")
+    out += table
+    return out
 
 
 def GenerateModIndex(I1, I2, attack, decay, release, k1, k2d,s1):
@@ -27,7 +104,19 @@ def GenerateModIndex(I1, I2, attack, decay, release, k1, k2d,s1):
     return modIndex
 
 
-class FMSynth(SynthBaseClass):
+class GroupRenderInto():
+    """ render_into() of the synths whose generate_group() takes an out array: the note is generated in the
+    render dtype straight into one buffer and added to out (no float64 intermediate and no copy in __call__) """
+
+    def render_into(self, out, note, amp, duration, seed=None):
+        wave_array = np.empty((1, self.note_length(note, duration)), dtype=get_render_dtype())
+        self.generate_group(np.array([self.note_input(note)]), np.array([amp]), duration, out=wave_array)
+        return self.add_into(out, wave_array[0])
+
+
+class FMSynth(GroupRenderInto, SynthBaseClass):
+
+    amplitude_linear = True
 
     def __init__(self):
         super().__init__()
@@ -53,11 +142,26 @@ class FMSynth(SynthBaseClass):
             NumParam("d2", interval=(0, 1), value=0.1, step=0.001, text="Decay time, envelope "),
             NumParam("s2", interval=(0, 10), value=1, step=0.1, text="Sustain slope, envelope "),
             NumParam("r2", interval=(0, 1), value=0.05, step=0.01, text="Release time, envelope "),
-            NumParam("k2", interval=(0, 1), value=0.95, step=0.01, text="Sustain constant, envelope ")
+            NumParam("k2", interval=(0, 1), value=0.95, step=0.01, text="Sustain constant, envelope "),
+            NumParam("Control Rate", interval=(1, 128), value=1, step=1, text="Control rate decimation (1: audio rate)")
         )
 
+    def note_length(self, note, duration):
+        a2 = float(self.params["a2"])
+        d2 = float(self.params["d2"])
+        r2 = float(self.params["r2"])
+        if duration < (a2+d2+r2):
+            duration = a2+d2+r2
+        return int(duration * self.sample_rate)
+
     def generate(self, freq, amp, duration):
-        # Add your synthesizer code here
+        return self.generate_group(np.array([freq]), np.array([amp]), duration)[0]
+
+    def generate_group(self, freqs, amps, duration, out=None):
+        """ Generates one note per row, all of them with the same duration
+        out: array of (notes, note_length()) samples in the render dtype where the notes are written (a new array if None) """
+        freq = freqs[:, np.newaxis]
+        amp = amps[:, np.newaxis]
 
         I1 = float(self.params["I1"])       #Modulation index limits
         I2 = float(self.params["I2"])
@@ -75,6 +179,7 @@ class FMSynth(SynthBaseClass):
         s2 = float(self.params["s2"])
         r2 = float(self.params["r2"])
         k2 = float(self.params["k2"])
+        control = int(self.params["Control Rate"])     #Curves are evaluated every control samples
 
         N1 = float(self.params["N1"])         #Modulation-carrier frequency relations
         N2 = float(self.params["N2"])
@@ -98,16 +203,19 @@ class FMSynth(SynthBaseClass):
         #t = np.linspace(0, total_time, int(total_time * self.sample_rate), False)
 
         if I1>I2:
-            modulationIndex =I1 -modIndex(t,duration) 
+            modulationIndex =I1 -control_rate(modIndex, t, control, duration) 
         else:
-            modulationIndex = I1 + modIndex(t,duration) 
+            modulationIndex = I1 + control_rate(modIndex, t, control, duration) 
 
-        fmwave = amp * FM_senoidal(t,fp, fm, 1, modulationIndex)
+        fmwave = FM_senoidal(t,fp, fm, 1, modulationIndex, out=out)
+        fmwave *= amp
 
 
-        return fmwave * adsr.envelope()
+        return adsr.apply(fmwave)
     
-class FM_Bassoon(SynthBaseClass):
+class FM_Bassoon(GroupRenderInto, SynthBaseClass):
+
+    amplitude_linear = True
 
     def __init__(self):
         super().__init__()
@@ -133,11 +241,26 @@ class FM_Bassoon(SynthBaseClass):
             NumParam("d2", interval=(0, 1), value=0.1, step=0.001, text="Decay time, envelope "),
             NumParam("s2", interval=(0, 10), value=1, step=0.1, text="Sustain slope, envelope "),
             NumParam("r2", interval=(0, 1), value=0.05, step=0.01, text="Release time, envelope "),
-            NumParam("k2", interval=(0, 1), value=0.95, step=0.01, text="Sustain constant, envelope ")
+            NumParam("k2", interval=(0, 1), value=0.95, step=0.01, text="Sustain constant, envelope "),
+            NumParam("Control Rate", interval=(1, 128), value=1, step=1, text="Control rate decimation (1: audio rate)")
         )
 
+    def note_length(self, note, duration):
+        a2 = float(self.params["a2"])
+        d2 = float(self.params["d2"])
+        r2 = float(self.params["r2"])
+        if duration < (a2+d2+r2):
+            duration = a2+d2+r2
+        return int(duration * self.sample_rate)
+
     def generate(self, freq, amp, duration):
-        # Add your synthesizer code here
+        return self.generate_group(np.array([freq]), np.array([amp]), duration)[0]
+
+    def generate_group(self, freqs, amps, duration, out=None):
+        """ Generates one note per row, all of them with the same duration
+        out: array of (notes, note_length()) samples in the render dtype where the notes are written (a new array if None) """
+        freq = freqs[:, np.newaxis]
+        amp = amps[:, np.newaxis]
 
         I1 = float(self.params["I1"])       #Modulation index limits
         I2 = float(self.params["I2"])
@@ -155,6 +278,7 @@ class FM_Bassoon(SynthBaseClass):
         s2 = float(self.params["s2"])
         r2 = float(self.params["r2"])
         k2 = float(self.params["k2"])
+        control = int(self.params["Control Rate"])     #Curves are evaluated every control samples
 
         N1 = float(self.params["N1"])         #Modulation-carrier frequency relations
         N2 = float(self.params["N2"])
@@ -178,15 +302,18 @@ class FM_Bassoon(SynthBaseClass):
         #t = np.linspace(0, total_time, int(total_time * self.sample_rate), False)
 
         if I1>I2:
-            modulationIndex =I1 -modIndex(t,duration) 
+            modulationIndex =I1 -control_rate(modIndex, t, control, duration) 
         else:
-            modulationIndex = I1 + modIndex(t,duration) 
+            modulationIndex = I1 + control_rate(modIndex, t, control, duration) 
+
+        fmwave = FM_senoidal(t,fp, fm, 1, modulationIndex, out=out)
+        fmwave *= amp
 
-        fmwave = amp * FM_senoidal(t,fp, fm, 1, modulationIndex)
 
+        return adsr.apply(fmwave)
+class FMSynthSax(GroupRenderInto, SynthBaseClass):
 
-        return fmwave * adsr.envelope()
-class FMSynthSax(SynthBaseClass):
+    amplitude_linear = True
 
     def __init__(self):
         super().__init__()
@@ -217,8 +344,22 @@ class FMSynthSax(SynthBaseClass):
             NumParam("k2", interval=(0, 1), value=0.95, step=0.01, text="Sustain constant, envelope ")
         )
 
+    def note_length(self, note, duration):
+        a2 = float(self.params["a2"])
+        d2 = float(self.params["d2"])
+        r2 = float(self.params["r2"])
+        if duration < (a2+d2+r2):
+            duration = a2+d2+r2
+        return int(duration * self.sample_rate)
+
     def generate(self, freq, amp, duration):
-        # Add your synthesizer code here
+        return self.generate_group(np.array([freq]), np.array([amp]), duration)[0]
+
+    def generate_group(self, freqs, amps, duration, out=None):
+        """ Generates one note per row, all of them with the same duration
+        out: array of (notes, note_length()) samples in the render dtype where the notes are written (a new array if None) """
+        freq = freqs[:, np.newaxis]
+        amp = amps[:, np.newaxis]
 
         I1 = float(self.params["I1"])       #Modulation index limits
         I2 = float(self.params["I2"])
@@ -252,19 +393,18 @@ class FMSynthSax(SynthBaseClass):
         
         #total_time = duration + r2                    # Total time is the note duration + Release time
 
-        f1 = N1 * freq                  #frecuencia de la primera modulante
-        f2 = N2 *freq                   #frecuencia de la segunda modulante
-        
         modIndex = GenerateModIndex(I1, I2, a1, d1, r1, k1, k2d, s1) 
         #t = np.linspace(0, total_time, int(total_time * self.sample_rate), False)
 
         
-        fmwave = DFM_1(t,f1, f2, 1, I1, I2)
-
+        fmwave = DFM_sum(t, freq, [(1, N1, N2, I1, I2)], out=out)
+        fmwave *= amp
 
-        return fmwave *amp *adsr.envelope()
+        return adsr.apply(fmwave)
     
-class DFM_SAX(SynthBaseClass):
+class DFM_SAX(GroupRenderInto, SynthBaseClass):
+
+    amplitude_linear = True
 
     def __init__(self):
         super().__init__()
@@ -301,8 +441,23 @@ class DFM_SAX(SynthBaseClass):
             NumParam("k2", interval=(0, 1), value=0.95, step=0.01, text="Sustain constant, envelope ")
         )
 
+    def note_length(self, note, duration):
+        a2 = float(self.params["a2"])
+        d2 = float(self.params["d2"])
+        r2 = float(self.params["r2"])
+        if duration < (a2+d2+r2):
+            duration = a2+d2+r2
+        return int(duration * self.sample_rate)
+
     def generate(self, freq, amp, duration):
-        # Add your synthesizer code here
+        return self.generate_group(np.array([freq]), np.array([amp]), duration)[0]
+
+    def generate_group(self, freqs, amps, duration, out=None):
+        """ Generates one note per row, all of them with the same duration
+        out: array of (notes, note_length()) samples in the render dtype where the notes are written (a new array if None) """
+        freq = freqs[:, np.newaxis]
+        amp = amps[:, np.newaxis]
+
         k = float(self.params["k"])
         I11 = float(self.params["I11"])       
         I12 = float(self.params["I12"])
@@ -345,32 +500,15 @@ class DFM_SAX(SynthBaseClass):
         #envelope = WoodwindEnvelope(amp, 1/k2, a2, d2, r2)          # Sustain time is calculated internally
         #total_time = duration + r2                    # Total time is the note duration + Release time
 
-        f11 = N11 * freq                  #frecuencia de la primera modulante
-        f12 = N12 *freq                   #frecuencia de la segunda modulante
-        
-        f21 = N21 * freq                  #frecuencia de la primera modulante
-        f22 = N22 *freq                   #frecuencia de la segunda modulante
-        
-        f31 = N31 *freq                   #frecuencia de la primer modulante
-        f32 = N32 *freq                   #frecuencia de la segunda modulante
-
-        #t = np.linspace(0, total_time, int(total_time * self.sample_rate), False)
-        amp1 = W1/normaPesos
-        DFM1 = DFM_1(t,f11, f12, amp1, I11, I12)
-
-        amp2 = W2/normaPesos
-        DFM2 = DFM_1(t,f21, f22, amp2, I21, I22)
-
-        amp3 = W3/normaPesos
-        DFM3 = DFM_1(t,f31, f32, amp3, I31, I32)
-
-        
-        fmwave = amp * (DFM1 + DFM2 + DFM3)
+        fmwave = DFM_sum(t, freq, [(W1/normaPesos, N11, N12, I11, I12),
+                                         (W2/normaPesos, N21, N22, I21, I22),
+                                         (W3/normaPesos, N31, N32, I31, I32)], out=out)
+        fmwave *= amp
 
 
-        return fmwave * adsr.envelope()
+        return adsr.apply(fmwave)
     
-class DFM_OBOE(SynthBaseClass):
+class DFM_OBOE(GroupRenderInto, SynthBaseClass):
 
     def __init__(self):
         super().__init__()
@@ -399,11 +537,28 @@ class DFM_OBOE(SynthBaseClass):
             NumParam("d2", interval=(0, 1), value=0.1, step=0.001, text="Decay time, envelope "),
             NumParam("s2", interval=(0, 10), value=1, step=0.1, text="Sustain slope, envelope "),
             NumParam("r2", interval=(0, 1), value=0.05, step=0.01, text="Release time, envelope "),
-            NumParam("k2", interval=(0, 1), value=0.95, step=0.01, text="Sustain constant, envelope ")
+            NumParam("k2", interval=(0, 1), value=0.95, step=0.01, text="Sustain constant, envelope "),
+            NumParam("Control Rate", interval=(1, 128), value=1, step=1, text="Control rate decimation (1: audio rate)")
         )
 
+    def note_length(self, note, duration):
+        a2 = float(self.params["a2"])
+        d2 = float(self.params["d2"])
+        r2 = float(self.params["r2"])
+        if duration < (a2+d2+r2):
+            duration = a2+d2+r2
+        total_time = duration + r2
+        return int(total_time * self.sample_rate)
+
     def generate(self, freq, amp, duration):
-        # Add your synthesizer code here
+        return self.generate_group(np.array([freq]), np.array([amp]), duration)[0]
+
+    def generate_group(self, freqs, amps, duration, out=None):
+        """ Generates one note per row, all of them with the same duration
+        out: array of (notes, note_length()) samples in the render dtype where the notes are written (a new array if None) """
+        freq = freqs[:, np.newaxis]
+        amp = amps[:, np.newaxis]
+
         k = float(self.params["k"])
         I11 = float(self.params["I11"])       
         I12 = float(self.params["I12"])
@@ -417,6 +572,7 @@ class DFM_OBOE(SynthBaseClass):
         s2 = float(self.params["s2"])
         r2 = float(self.params["r2"])
         k2 = float(self.params["k2"])
+        control = int(self.params["Control Rate"])     #Curves are evaluated every control samples
 
         N11 = float(self.params["N11"])         #Modulator frequencies. (multipliers)
         N12 = float(self.params["N12"])  
@@ -433,31 +589,20 @@ class DFM_OBOE(SynthBaseClass):
             duration = a2+d2+r2
         
 
-        envelope = WoodwindEnvelope(amp, 1/k2, a2, d2, r2)          # Sustain time is calculated internally
+        envelope = WoodwindEnvelope(1, 1/k2, a2, d2, r2)          # Sustain time is calculated internally
         total_time = duration + r2                    # Total time is the note duration + Release time
 
-        f11 = N11 * freq                  #frecuencia de la primera modulante
-        f12 = N12 *freq                   #frecuencia de la segunda modulante
-        
-        f21 = N21 * freq                  #frecuencia de la primera modulante
-        f22 = N22 *freq                   #frecuencia de la segunda modulante
-        
-
-        t = np.linspace(0, total_time, int(total_time * self.sample_rate), False)
-        amp1 = W1/normaPesos
-        DFM1 = DFM_1(t,f11, f12, amp1, I11, I12)
-
-        amp2 = W2/normaPesos
-        DFM2 = DFM_1(t,f21, f22, amp2, I21, I22)
-
-
-        
-        fmwave = amp * (DFM1 + DFM2)
+        t = time_axis(int(total_time * self.sample_rate), self.sample_rate)
+        fmwave = DFM_sum(t, freq, [(W1/normaPesos, N11, N12, I11, I12),
+                                         (W2/normaPesos, N21, N22, I21, I22)], out=out)
+        fmwave *= amp
 
 
-        return fmwave * envelope(t, duration)
+        fmwave *= amp      # amp is applied twice (wave and envelope amplitude)
+        fmwave *= control_rate(envelope, t, control, duration)
+        return fmwave
 
-class DFM_FrenchHorn(SynthBaseClass):
+class DFM_FrenchHorn(GroupRenderInto, SynthBaseClass):
 
     def __init__(self):
         super().__init__()
@@ -486,11 +631,28 @@ class DFM_FrenchHorn(SynthBaseClass):
             NumParam("d2", interval=(0, 1), value=0.1, step=0.001, text="Decay time, envelope "),
             NumParam("s2", interval=(0, 10), value=1, step=0.1, text="Sustain slope, envelope "),
             NumParam("r2", interval=(0, 1), value=0.05, step=0.01, text="Release time, envelope "),
-            NumParam("k2", interval=(0, 1), value=0.95, step=0.01, text="Sustain constant, envelope ")
+            NumParam("k2", interval=(0, 1), value=0.95, step=0.01, text="Sustain constant, envelope "),
+            NumParam("Control Rate", interval=(1, 128), value=1, step=1, text="Control rate decimation (1: audio rate)")
         )
 
+    def note_length(self, note, duration):
+        a2 = float(self.params["a2"])
+        d2 = float(self.params["d2"])
+        r2 = float(self.params["r2"])
+        if duration < (a2+d2+r2):
+            duration = a2+d2+r2
+        total_time = duration + r2
+        return int(total_time * self.sample_rate)
+
     def generate(self, freq, amp, duration):
-        # Add your synthesizer code here
+        return self.generate_group(np.array([freq]), np.array([amp]), duration)[0]
+
+    def generate_group(self, freqs, amps, duration, out=None):
+        """ Generates one note per row, all of them with the same duration
+        out: array of (notes, note_length()) samples in the render dtype where the notes are written (a new array if None) """
+        freq = freqs[:, np.newaxis]
+        amp = amps[:, np.newaxis]
+
         k = float(self.params["k"])
         I11 = float(self.params["I11"])       
         I12 = float(self.params["I12"])
@@ -504,6 +666,7 @@ class DFM_FrenchHorn(SynthBaseClass):
         s2 = float(self.params["s2"])
         r2 = float(self.params["r2"])
         k2 = float(self.params["k2"])
+        control = int(self.params["Control Rate"])     #Curves are evaluated every control samples
 
         N11 = float(self.params["N11"])         #Modulator frequencies. (multipliers)
         N12 = float(self.params["N12"])  
@@ -520,31 +683,22 @@ class DFM_FrenchHorn(SynthBaseClass):
             duration = a2+d2+r2
         
 
-        envelope = WoodwindEnvelope(amp, 1/k2, a2, d2, r2)          # Sustain time is calculated internally
+        envelope = WoodwindEnvelope(1, 1/k2, a2, d2, r2)          # Sustain time is calculated internally
         total_time = duration + r2                    # Total time is the note duration + Release time
 
-        f11 = N11 * freq                  #frecuencia de la primera modulante
-        f12 = N12 *freq                   #frecuencia de la segunda modulante
-        
-        f21 = N21 * freq                  #frecuencia de la primera modulante
-        f22 = N22 *freq                   #frecuencia de la segunda modulante
-        
-
-        t = np.linspace(0, total_time, int(total_time * self.sample_rate), False)
-        amp1 = W1/normaPesos
-        DFM1 = DFM_1(t,f11, f12, amp1, I11, I12)
-
-        amp2 = W2/normaPesos
-        DFM2 = DFM_1(t,f21, f22, amp2, I21, I22)
-
-
-        
-        fmwave = amp * (DFM1 + DFM2)
+        t = time_axis(int(total_time * self.sample_rate), self.sample_rate)
+        fmwave = DFM_sum(t, freq, [(W1/normaPesos, N11, N12, I11, I12),
+                                         (W2/normaPesos, N21, N22, I21, I22)], out=out)
+        fmwave *= amp
 
 
-        return fmwave * envelope(t, duration)
+        fmwave *= amp      # amp is applied twice (wave and envelope amplitude)
+        fmwave *= control_rate(envelope, t, control, duration)
+        return fmwave
     
-class DFM_Harpsichord(SynthBaseClass):
+class DFM_Harpsichord(GroupRenderInto, SynthBaseClass):
+
+    amplitude_linear = True
 
     def __init__(self):
         super().__init__()
@@ -581,8 +735,18 @@ class DFM_Harpsichord(SynthBaseClass):
             NumParam("k2", interval=(0.0001, 30), value=10, step=0.01, text="Sustain constant, envelope ")
         )
 
+    def note_length(self, note, duration):
+        return int(duration * self.sample_rate)
+
     def generate(self, freq, amp, duration):
-        # Add your synthesizer code here
+        return self.generate_group(np.array([freq]), np.array([amp]), duration)[0]
+
+    def generate_group(self, freqs, amps, duration, out=None):
+        """ Generates one note per row, all of them with the same duration
+        out: array of (notes, note_length()) samples in the render dtype where the notes are written (a new array if None) """
+        freq = freqs[:, np.newaxis]
+        amp = amps[:, np.newaxis]
+
         k = float(self.params["k"])
         I11 = float(self.params["I11"])       
         I12 = float(self.params["I12"])
@@ -623,32 +787,17 @@ class DFM_Harpsichord(SynthBaseClass):
         
         t = adsr.time()
 
-        f11 = N11 * freq                  #frecuencia de la primera modulante
-        f12 = N12 *freq                   #frecuencia de la segunda modulante
-        
-        f21 = N21 * freq                  #frecuencia de la primera modulante
-        f22 = N22 *freq                   #frecuencia de la segunda modulante
-        
-        f31 = N31 *freq                   #frecuencia de la primer modulante
-        f32 = N32 *freq                   #frecuencia de la segunda modulante
+        fmwave = DFM_sum(t, freq, [(W1/normaPesos, N11, N12, I11, I12),
+                                            (W2/normaPesos, N21, N22, I21, I22),
+                                            (W3/normaPesos, N31, N32, I31, I32)], out=out)
+        fmwave *= amp/k2
 
-       
-        amp1 = W1/normaPesos
-        DFM1 = DFM_1(t,f11, f12, amp1, I11, I12)
 
-        amp2 = W2/normaPesos
-        DFM2 = DFM_1(t,f21, f22, amp2, I21, I22)
-
-        amp3 = W3/normaPesos
-        DFM3 = DFM_1(t,f31, f32, amp3, I31, I32)
-
-        
-        fmwave = amp/k2 * (DFM1 + DFM2 + DFM3)
-
-
-        return fmwave * adsr.envelope()
+        return adsr.apply(fmwave)
     
-class DFM_PipeOrgan(SynthBaseClass):
+class DFM_PipeOrgan(GroupRenderInto, SynthBaseClass):
+
+    amplitude_linear = True
 
     def __init__(self):
         super().__init__()
@@ -682,11 +831,28 @@ class DFM_PipeOrgan(SynthBaseClass):
             NumParam("d2", interval=(0, 1), value=0.1, step=0.001, text="Decay time, envelope "),
             NumParam("s2", interval=(0, 10), value=1, step=0.1, text="Sustain slope, envelope "),
             NumParam("r2", interval=(0, 1), value=0.05, step=0.01, text="Release time, envelope "),
-            NumParam("k2", interval=(0, 1), value=0.95, step=0.01, text="Sustain constant, envelope ")
+            NumParam("k2", interval=(0, 1), value=0.95, step=0.01, text="Sustain constant, envelope "),
+            NumParam("Control Rate", interval=(1, 128), value=1, step=1, text="Control rate decimation (1: audio rate)")
         )
 
+    def note_length(self, note, duration):
+        a2 = float(self.params["a2"])
+        d2 = float(self.params["d2"])
+        r2 = float(self.params["r2"])
+        if duration < (a2+d2+r2):
+            duration = a2+d2+r2
+        total_time = duration + r2
+        return int(total_time * self.sample_rate)
+
     def generate(self, freq, amp, duration):
-        # Add your synthesizer code here
+        return self.generate_group(np.array([freq]), np.array([amp]), duration)[0]
+
+    def generate_group(self, freqs, amps, duration, out=None):
+        """ Generates one note per row, all of them with the same duration
+        out: array of (notes, note_length()) samples in the render dtype where the notes are written (a new array if None) """
+        freq = freqs[:, np.newaxis]
+        amp = amps[:, np.newaxis]
+
         k = float(self.params["k"])
         I11 = float(self.params["I11"])       
         I12 = float(self.params["I12"])
@@ -703,6 +869,7 @@ class DFM_PipeOrgan(SynthBaseClass):
         s2 = float(self.params["s2"])
         r2 = float(self.params["r2"])
         k2 = float(self.params["k2"])
+        control = int(self.params["Control Rate"])     #Curves are evaluated every control samples
 
         N11 = float(self.params["N11"])         #Modulator frequencies. (multipliers)
         N12 = float(self.params["N12"])  
@@ -726,32 +893,19 @@ class DFM_PipeOrgan(SynthBaseClass):
         envelope = WoodwindEnvelope(1, 1/k2, a2, d2, r2)          # Sustain time is calculated internally
         total_time = duration + r2                    # Total time is the note duration + Release time
 
-        f11 = N11 * freq                  #frecuencia de la primera modulante
-        f12 = N12 *freq                   #frecuencia de la segunda modulante
-        
-        f21 = N21 * freq                  #frecuencia de la primera modulante
-        f22 = N22 *freq                   #frecuencia de la segunda modulante
-        
-        f31 = N31 *freq                   #frecuencia de la primer modulante
-        f32 = N32 *freq                   #frecuencia de la segunda modulante
-
-        t = np.linspace(0, total_time, int(total_time * self.sample_rate), False)
-        amp1 = W1/normaPesos
-        DFM1 = DFM_1(t,f11, f12, amp1, I11, I12)
+        t = time_axis(int(total_time * self.sample_rate), self.sample_rate)
+        fmwave = DFM_sum(t, freq, [(W1/normaPesos, N11, N12, I11, I12),
+                                         (W2/normaPesos, N21, N22, I21, I22),
+                                         (W3/normaPesos, N31, N32, I31, I32)], out=out)
+        fmwave *= amp
 
-        amp2 = W2/normaPesos
-        DFM2 = DFM_1(t,f21, f22, amp2, I21, I22)
 
-        amp3 = W3/normaPesos
-        DFM3 = DFM_1(t,f31, f32, amp3, I31, I32)
-
-        
-        fmwave = amp * (DFM1 + DFM2 + DFM3)
-
-
-        return fmwave * envelope(t, duration)
+        fmwave *= control_rate(envelope, t, control, duration)
+        return fmwave
     
-class DFM_Trumpet(SynthBaseClass):
+class DFM_Trumpet(GroupRenderInto, SynthBaseClass):
+
+    amplitude_linear = True
 
     def __init__(self):
         super().__init__()
@@ -785,11 +939,28 @@ class DFM_Trumpet(SynthBaseClass):
             NumParam("d2", interval=(0, 1), value=0.1, step=0.001, text="Decay time, envelope "),
             NumParam("s2", interval=(0, 10), value=1, step=0.1, text="Sustain slope, envelope "),
             NumParam("r2", interval=(0, 1), value=0.05, step=0.01, text="Release time, envelope "),
-            NumParam("k2", interval=(0, 1), value=0.95, step=0.01, text="Sustain constant, envelope ")
+            NumParam("k2", interval=(0, 1), value=0.95, step=0.01, text="Sustain constant, envelope "),
+            NumParam("Control Rate", interval=(1, 128), value=1, step=1, text="Control rate decimation (1: audio rate)")
         )
 
+    def note_length(self, note, duration):
+        a2 = float(self.params["a2"])
+        d2 = float(self.params["d2"])
+        r2 = float(self.params["r2"])
+        if duration < (a2+d2+r2):
+            duration = a2+d2+r2
+        total_time = duration + r2
+        return int(total_time * self.sample_rate)
+
     def generate(self, freq, amp, duration):
-        # Add your synthesizer code here
+        return self.generate_group(np.array([freq]), np.array([amp]), duration)[0]
+
+    def generate_group(self, freqs, amps, duration, out=None):
+        """ Generates one note per row, all of them with the same duration
+        out: array of (notes, note_length()) samples in the render dtype where the notes are written (a new array if None) """
+        freq = freqs[:, np.newaxis]
+        amp = amps[:, np.newaxis]
+
         k = float(self.params["k"])
         I11 = float(self.params["I11"])       
         I12 = float(self.params["I12"])
@@ -806,6 +977,7 @@ class DFM_Trumpet(SynthBaseClass):
         s2 = float(self.params["s2"])
         r2 = float(self.params["r2"])
         k2 = float(self.params["k2"])
+        control = int(self.params["Control Rate"])     #Curves are evaluated every control samples
 
         N11 = float(self.params["N11"])         #Modulator frequencies. (multipliers)
         N12 = float(self.params["N12"])  
@@ -829,28 +1001,13 @@ class DFM_Trumpet(SynthBaseClass):
         envelope = WoodwindEnvelope(1, 1/k2, a2, d2, r2)          # Sustain time is calculated internally
         total_time = duration + r2                    # Total time is the note duration + Release time
 
-        f11 = N11 * freq                  #frecuencia de la primera modulante
-        f12 = N12 *freq                   #frecuencia de la segunda modulante
-        
-        f21 = N21 * freq                  #frecuencia de la primera modulante
-        f22 = N22 *freq                   #frecuencia de la segunda modulante
-        
-        f31 = N31 *freq                   #frecuencia de la primer modulante
-        f32 = N32 *freq                   #frecuencia de la segunda modulante
-
-        t = np.linspace(0, total_time, int(total_time * self.sample_rate), False)
-        amp1 = W1/normaPesos
-        DFM1 = DFM_1(t,f11, f12, amp1, I11, I12)
-
-        amp2 = W2/normaPesos
-        DFM2 = DFM_1(t,f21, f22, amp2, I21, I22)
-
-        amp3 = W3/normaPesos
-        DFM3 = DFM_1(t,f31, f32, amp3, I31, I32)
-
-        
-        fmwave = amp * (DFM1 + DFM2 + DFM3)
+        t = time_axis(int(total_time * self.sample_rate), self.sample_rate)
+        fmwave = DFM_sum(t, freq, [(W1/normaPesos, N11, N12, I11, I12),
+                                         (W2/normaPesos, N21, N22, I21, I22),
+                                         (W3/normaPesos, N31, N32, I31, I32)], out=out)
+        fmwave *= amp
 
 
-        return fmwave * envelope(t, duration)
+        fmwave *= control_rate(envelope, t, control, duration)
+        return fmwave
     
\ No newline at end of file
@@ -1,13 +1,151 @@
+import zlib
 import numpy as np
 from scipy import signal
 from backend.utils.ParamObject import NumParam, ChoiceParam, BoolParam, ParameterList
+from backend.utils.NoteRenderCache import NoteRenderCache
+from backend.utils.RenderConfig import as_render_dtype
 
 from .EnvelopeModulators import LinearADSR, ModFunction
 from .SynthBaseClass import SynthBaseClass
 
 
+# Max samples solved per step of karplus_strong(), bounds the 2**n scale factors below the float64 range
+KS_MAX_STEP = 768
+# Shorter wavetables are run sample by sample, the overhead of each vectorized step would dominate
+KS_MIN_STEP = 40
+
+
+def karplus_strong(wavetable, stretches, signs=None):
+    """
+    Vectorized Karplus-Strong loop, returns len(stretches) samples (float64).
+    With P = wavetable.size, each output sample is
+        y[k] = y[k-P]                                   if stretches[k] == 1
+        y[k] = sign[k] * 0.5 * (y[k-1] + y[k-P])        otherwise
+    where y[k-P] is the wavetable for k < P, y[-1] = 0 and sign is +1 unless signs (+1/-1 per sample) are given.
+
+    That is y[k] = a[k] y[k-1] + b[k] y[k-P]. In a step of at most P samples every y[k-P] is already known,
+    so the step is a first order recurrence y[k] = a[k] y[k-1] + u[k], solved at once with a cumulative sum:
+        y[k] = (carry + sum of u[j] F[j] for j <= k) / F[k]
+    where F[k] = 1 / (a[0] ... a[k]) of the step. The sum restarts (and the carry is dropped) where a == 0.
+    Everything that does not depend on y is computed for the whole note before the loop
+    """
+    P = wavetable.size
+    n = stretches.size
+    if P < KS_MIN_STEP:
+        return karplus_strong_samples(wavetable, stretches, signs)
+    L = max(1, min(P, KS_MAX_STEP))
+    steps = -(-n // L)
+
+    # Coefficients, padded to (steps, L)
+    stretched = np.ones(steps * L, dtype=bool)
+    stretched[:n] = stretches != 0
+    stretched = stretched.reshape(steps, L)
+    if signs is None:
+        S = 1.0
+        b = np.where(stretched, 1.0, 0.5)
+    else:
+        sign = np.ones(steps * L)
+        sign[:n] = signs
+        sign = sign.reshape(steps, L)
+        S = np.cumprod(np.where(stretched, 1.0, sign), axis=1)     # sign of a[0] ... a[k]
+        b = np.where(stretched, 1.0, 0.5 * sign)
+
+    cnt = np.cumsum(~stretched, axis=1, dtype=np.int32)
+    inv_F = np.ldexp(S, -cnt)
+    w = b * np.ldexp(S, cnt)
+    # Position in Q (see below) of the sum to subtract from each sample: 1 + index of its last restart, 0 if none
+    index = np.maximum.accumulate(np.where(stretched, np.arange(1, L + 1), 0), axis=1)
+
+    # y[k] is stored at buffer[P + k], so buffer[k] = y[k-P]
+    buffer = np.empty(P + steps * L)
+    buffer[:P] = wavetable
+    v = np.empty(L)
+    g = np.empty(L)
+    Q = np.zeros(L + 2)         # Q[0] = -carry, Q[1 + j] = sum of v[:j]
+    for i in range(steps):
+        s = i * L
+        np.multiply(w[i], buffer[s : s + L], out=v)
+        np.add.accumulate(v, out=Q[2:])
+        Q[0] = -buffer[P + s - 1] if s > 0 else 0.0
+        Q.take(index[i], out=g)
+        np.subtract(Q[2:], g, out=g)
+        np.multiply(g, inv_F[i], out=buffer[P + s : P + s + L])
+
+    return buffer[P : P + n]
+
+
+def karplus_strong_samples(wavetable, stretches, signs=None):
+    """ Same as karplus_strong(), one sample at a time (for very short wavetables) """
+    table = [float(x) for x in wavetable]
+    stretches = stretches.tolist()
+    signs = signs.tolist() if signs is not None else [1.0] * len(stretches)
+    samples = [0.0] * len(stretches)
+    prev_value = 0.0
+    curr_sample = 0
+    for k, stretch in enumerate(stretches):
+        if stretch:
+            prev_value = table[curr_sample]
+        else:
+            prev_value = signs[k] * 0.5 * (table[curr_sample] + prev_value)
+            table[curr_sample] = prev_value
+        samples[k] = prev_value
+        curr_sample += 1
+        if curr_sample == len(table):
+            curr_sample = 0
+    return np.array(samples)
+
+
+class KSVariantBank():
+    """
+    Bank of pre-rendered Karplus-Strong strings, mixed into the KS guitar (the drum is not proportional to its amp).
+    The string of each pitch (the output before the envelope, at unit amplitude) is rendered in a few variants
+    with fixed seeds. Each note takes one of them, chosen with its own rng, truncated to its length. Repeated notes
+    become buffer copies but still vary between variants.
+    A variant is rendered again when a longer note needs it: the same seed renders the same start, so the notes
+    truncated before do not change.
+    """
+    bank_max_bytes = 64 * 1024 * 1024
+
+    def __init__(self):
+        super().__init__()
+        # Created here so the render copies of the synth (see __copy__) share it
+        self.variant_bank = NoteRenderCache(self.bank_max_bytes)
+
+    def bank_string(self, key, variants, n_samples, rng, render):
+        ''' Returns n_samples of a variant of the string of key, render(n_samples, rng) renders the string '''
+        variant = int(rng.integers(variants))
+        string = self.variant_bank.get((key, variant))
+        if string is None or string.size < n_samples:
+            seed = (zlib.crc32(repr(key).encode()), variant)
+            string = as_render_dtype(render(n_samples, np.random.default_rng(seed)))
+            self.variant_bank.put((key, variant), string)
+        return string[:n_samples]
+
+    def clear_bank(self):
+        ''' Empties the bank, also for the copies that share it '''
+        self.variant_bank.clear()
+
+    def __copy__(self):
+        # Render snapshots share the bank of the synth of the GUI
+        synth_copy = self.__class__.__new__(self.__class__)
+        synth_copy.__dict__.update(self.__dict__)
+        return synth_copy
+
+    def __getstate__(self):
+        # The bank is not sent to the worker processes, each one fills its own
+        state = self.__dict__.copy()
+        state["variant_bank"] = None
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.variant_bank = NoteRenderCache(self.bank_max_bytes)
+
+
 class KSDrum(SynthBaseClass):
     """ Your synthesizer here"""
+    stochastic = True
+
     def __init__(self):
         super().__init__()
         self.name = "Karplus-Strong Drum"
@@ -27,25 +165,33 @@ class KSDrum(SynthBaseClass):
         dist = amp * np.ones(size)
         return dist - np.mean(dist)
 
-    def generate(self, note, amp, duration):
+    def note_length(self, note, duration):
+        duration += self.params["extraTime"]
+        return int(duration * self.sample_rate)
+
+    def generate(self, note, amp, duration, rng=None):
         """ 
         Generate a Karplus-Strong guitar string sound
         - freq: tone frequency [Hz]
         - amp: tone amplitude [0, 1]
         - duration: on-off note duration [s]  
+        - rng: np.random.Generator of the note (None: unseeded)
         """
+        if rng is None:
+            rng = np.random.default_rng()
 
         # print(f"KS Drum: {note} {amp} {duration}")
 
         stretch = self.params["Stretch Factor"]
 
-        wavetable = self.init_wavetable(amp, stretch, note)
-
         duration += self.params["extraTime"]
         n_samples = int(duration * self.sample_rate)
         probability = self.params["Probability"]
 
-        out = self.karplus_strong(wavetable, n_samples, stretch, probability)
+        # Not taken from the KSVariantBank: the zero mean wavetable of the drum only sounds through the rounding
+        # of amp * ones - mean, so its output is not proportional to amp
+        wavetable = self.init_wavetable(amp, stretch, note)
+        out = self.karplus_strong(wavetable, n_samples, stretch, probability, rng)
 
         t = duration
         r_coef = self.params["r_factor"]
@@ -56,36 +202,22 @@ class KSDrum(SynthBaseClass):
 
         adsr.set_total_time(t, self.sample_rate)
 
-        return out * adsr.envelope() * 1e16
-
-    def karplus_strong(self, wavetable, n_samples, stretch_factor, probability):
-
-        samples = []
-
-        curr_sample = 0
-        prev_value = 0
+        return adsr.apply(out) * 1e16
 
-        while len(samples) < n_samples:
+    def karplus_strong(self, wavetable, n_samples, stretch_factor, probability, rng):
+        # Random draws of every sample
+        stretches = rng.random(n_samples) < 1 - 1/stretch_factor
+        drum_signs = rng.random(n_samples) < probability
+        return karplus_strong(wavetable, stretches, 2.0 * drum_signs - 1)
 
-            stretch = np.random.binomial(1, 1 - 1/stretch_factor)
-
-            drum_sign = np.random.binomial(1, probability)
-            sign = float(drum_sign == 1) * 2 - 1
-
-            if stretch == 0:
-                wavetable[curr_sample] = sign * 0.5 * (wavetable[curr_sample] + prev_value)
-            
-            samples.append(wavetable[curr_sample])
-            prev_value = samples[-1]
-            curr_sample = (curr_sample + 1) % wavetable.size
-
-        return np.array(samples)
 
 
 
-
-class KSGuitar(SynthBaseClass):
+class KSGuitar(KSVariantBank, SynthBaseClass):
     """ Simple Karplus-Strong Guitar String Synthesizer"""
+    amplitude_linear = True
+    stochastic = True
+
     def __init__(self):
         super().__init__()
 
@@ -100,56 +232,56 @@ class KSGuitar(SynthBaseClass):
             ChoiceParam("modType", options=["cos", "sin", "log", "polyFlatTop", "poly", "exp"], value="sin", text="Env Mod function"),
             NumParam("modN", interval=(0.1, 20), value=3, step=0.1, text="Mod function N"),
             NumParam("extraTime", interval=(0.0, 2.0), value=0.1, step=0.01, text="Extra Time"),
+            NumParam("Variants", interval=(0, 8), value=4, step=1, text="Bank Variants (0: off)"),
         )
 
-    def init_wavetable(self, amp, stretch, noise_type, freq):
+    def init_wavetable(self, amp, stretch, noise_type, freq, rng):
         """ Initialize the wavetable """
         size = int( self.sample_rate / freq - 1/(2*stretch))
         match noise_type:
             case "Normal":
-                dist = (amp * np.random.normal(0,1,size)).astype(np.float32)
+                dist = (amp * rng.normal(0,1,size)).astype(np.float32)
             case "Uniform":
-                dist = (amp * np.random.uniform(-1, 1, size)).astype(np.float32)
+                dist = (amp * rng.uniform(-1, 1, size)).astype(np.float32)
             case "2-Level":
-                dist = (amp * 2 * np.random.randint(0, 2, size) - 1).astype(np.float32)
+                dist = (amp * 2 * rng.integers(0, 2, size) - 1).astype(np.float32)
         
         return dist - np.mean(dist)
         
-    def karplus_strong(self, wavetable, n_samples, stretch_factor):
-
-        samples = []
+    def karplus_strong(self, wavetable, n_samples, stretch_factor, rng):
+        # Random draws of every sample
+        stretches = rng.random(n_samples) < 1 - 1/stretch_factor
+        return karplus_strong(wavetable, stretches)
 
-        curr_sample = 0
-        prev_value = 0
-
-        while len(samples) < n_samples:
-
-            stretch = np.random.binomial(1, 1 - 1/stretch_factor)
-            if stretch == 0:
-                wavetable[curr_sample] = 0.5 * (wavetable[curr_sample] + prev_value)
-            
-            samples.append(wavetable[curr_sample])
-            prev_value = samples[-1]
-            curr_sample = (curr_sample + 1) % wavetable.size
-
-        return np.array(samples)
+    def note_length(self, note, duration):
+        duration += self.params["extraTime"]
+        return int(duration * self.sample_rate)
 
-    def generate(self, freq, amp, duration):
+    def generate(self, freq, amp, duration, rng=None):
         """ 
         Generate a Karplus-Strong guitar string sound
         - freq: tone frequency [Hz]
         - amp: tone amplitude [0, 1]
         - duration: on-off note duration [s]  
+        - rng: np.random.Generator of the note (None: unseeded)
         """
+        if rng is None:
+            rng = np.random.default_rng()
+
         noise_type = self.params["Initial Noise"]
         stretch = self.params["Stretch Factor"]
 
-        wavetable = self.init_wavetable(amp, stretch, noise_type, freq)
-
         duration += self.params["extraTime"]
         n_samples = int(duration * self.sample_rate)
 
-        out = self.karplus_strong(wavetable, n_samples, stretch)
+        variants = int(self.params["Variants"])
+        if variants > 0:
+            key = (freq, stretch, noise_type, self.sample_rate)
+            render = lambda n_samples, rng: self.karplus_strong(self.init_wavetable(1.0, stretch, noise_type, freq, rng), n_samples, stretch, rng)
+            out = amp * self.bank_string(key, variants, n_samples, rng, render)
+        else:
+            wavetable = self.init_wavetable(amp, stretch, noise_type, freq, rng)
+            out = self.karplus_strong(wavetable, n_samples, stretch, rng)
 
         t = duration
         r_coef = self.params["r_factor"]
@@ -160,4 +292,4 @@ class KSGuitar(SynthBaseClass):
 
         adsr.set_total_time(t, self.sample_rate)
 
-        return out * adsr.envelope()
\ No newline at end of file
+        return adsr.apply(out)
\ No newline at end of file
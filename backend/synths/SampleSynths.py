@@ -11,31 +11,67 @@ saxo_tenor_samples_path = "backend/synths/samples/saxo_tenor"
 saxo_soprano_samples_path = "backend/synths/samples/saxo_soprano"
 
 class SampleSynthBaseClass(SynthBaseClass):
+    amplitude_linear = True
+
     def __init__(self, instrument, path):
         super().__init__()
         self.instrument = instrument
         self.name = instrument + " Samples"
         self.params = ParameterList()
-        
-        print("Loading available samples...")
-        self.samples = self.load_samples(path)
-
+        self.path = path
         self.sample_rate = 44100
 
-        # compute intermediate notes using pitch shifting
-        print(f"Computing intermediate notes for {instrument}...")
+        # Samples are loaded on first use and intermediate notes are pitch shifted on demand, in the render workers,
+        # so creating the synth is cheap (e.g. when only another instrument is going to be used).
+        # The dicts are filled in place, so the render copies of the synth share them
+        self.samples = {}           # note -> sample (recorded or pitch shifted)
+        self.sample_lengths = {}    # recorded note -> number of samples at sample_rate, read from the wav headers
 
-        min_note = min(self.samples.keys())
-        max_note = max(self.samples.keys())
-        for note in range(min_note - 2, max_note + 2):
-            if note not in self.samples:
-                self.compute_note(note)
+    def sample_files(self, path):
+        ''' Returns {note: wav file} of the recorded samples '''
+        files = {}
+        for file in os.listdir(path):
+            if file.endswith(".wav"):
+                name = file.split(".")[0]
+                if name.isdigit():
+                    note = int(name)
+                else:
+                    note = noteNameToMidi[name]
+                files[note] = f"{path}/{file}"
+        return files
+
+    def read_lengths(self):
+        ''' Reads the length of the recorded samples from the wav headers, without loading them '''
+        if len(self.sample_lengths) == 0:
+            lengths = {}
+            for note, file in self.sample_files(self.path).items():
+                with wave.open(file, "rb") as wave_read:
+                    length = wave_read.getnframes() * wave_read.getnchannels()
+                    sample_rate = wave_read.getframerate()
+                # Same length as the resampling of load_samples()
+                lengths[note] = length if sample_rate == self.sample_rate else int(length * self.sample_rate / sample_rate)
+            self.sample_lengths.update(lengths)
+
+    def closest_recorded(self, note):
+        self.read_lengths()
+        return min(self.sample_lengths.keys(), key=lambda n: abs(note - n))
+
+    def load(self):
+        self.read_lengths()
+        if any(note not in self.samples for note in self.sample_lengths):
+            print(f"Loading available samples for {self.instrument}...")
+            self.samples.update(self.load_samples(self.path))
 
     def compute_note(self, note):
+        sample = self.samples.get(note)
+        if sample is not None:
+            return sample
+        self.load()
         if note in self.samples:
             return self.samples[note]
         else:
-            closest_note = min(self.samples.keys(), key=lambda n: abs(note - n))
+            # Shift from the closest recorded sample, so the result does not depend on which notes were computed before
+            closest_note = self.closest_recorded(note)
             shift = note - closest_note
             sample = self.samples[closest_note]
             sample = effects.pitch_shift(sample, sr=self.sample_rate, n_steps=shift, res_type="kaiser_best")
@@ -46,31 +82,36 @@ class SampleSynthBaseClass(SynthBaseClass):
     def load_samples(self, path):
         print(f"Loading samples from {path}")
         samples = {}
-        for file in os.listdir(path):
-            if file.endswith(".wav"):
-                name = file.split(".")[0]
-                if name.isdigit():
-                    note = int(name)
-                else:
-                    note = noteNameToMidi[name]
-                wave_read = wave.open(f"{path}/{file}", "rb")
-                array = np.frombuffer(wave_read.readframes(wave_read.getnframes()), dtype=np.int16)
-                sample_rate = wave_read.getframerate()
+        for note, file in self.sample_files(path).items():
+            wave_read = wave.open(file, "rb")
+            array = np.frombuffer(wave_read.readframes(wave_read.getnframes()), dtype=np.int16)
+            sample_rate = wave_read.getframerate()
 
-                # Resample to 44100 Hz
-                if sample_rate != self.sample_rate:
-                    array = signal.resample(array, int(len(array) * self.sample_rate / sample_rate))
+            # Resample to 44100 Hz
+            if sample_rate != self.sample_rate:
+                array = signal.resample(array, int(len(array) * self.sample_rate / sample_rate))
 
-                array = array.astype(np.float32) / 32768.0
-                samples[note] = np.array(array)
+            array = array.astype(np.float32) / 32768.0
+            samples[note] = np.array(array)
         return samples
 
+    def sample_length(self, note):
+        ''' Length of the sample of a note without computing it: pitch_shift() keeps the length of the recorded sample '''
+        return self.sample_lengths[self.closest_recorded(note)]
+
+
+    def note_length(self, note, duration):
+        length = self.sample_length(self.note_input(note))     # note names are accepted, as in __call__
+        sample_duration = length / self.sample_rate
+        if np.abs(sample_duration - duration) < 0.05:
+            return length
+        elif duration < 0.002:
+            return int(duration * self.sample_rate)
+        # Same length as librosa.effects.time_stretch
+        return int(round(length / (sample_duration / duration)))
 
     def generate(self, note, amp, duration):
-        if note in self.samples:
-            sample = self.samples[note]
-        else:
-            sample = self.compute_note(note)
+        sample = self.compute_note(note)
 
         sample_duration = len(sample) / self.sample_rate
         if np.abs(sample_duration - duration) < 0.05:
@@ -82,7 +123,8 @@ class SampleSynthBaseClass(SynthBaseClass):
 
         max_value = np.max(np.abs(sample))
         
-        sample = sample * amp / max_value
+        if max_value > 0:
+            sample = sample * amp / max_value
 
         return sample
 
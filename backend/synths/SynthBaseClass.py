@@ -3,6 +3,8 @@ import wave
 import io
 import inspect
 
+from backend.utils.RenderConfig import as_render_dtype, add_into
+
 noteNameToMidi = {
     "C0": 12,"C#0": 13,"Csharp0": 13,"Db0": 13,"D0": 14,"D#0": 15,"Dsharp0": 15,"Eb0": 15,"E0": 16,"F0": 17,"F#0": 18,"Fsharp0": 18,"Gb0": 18,"G0": 19,"G#0": 20,"Gsharp0": 20,"Ab0": 20,"A0": 21,"A#0": 22,"Asharp0": 22,"Bb0": 22,"B0": 23,"C1": 24,"C#1": 25,"Csharp1": 25,"Db1": 25,"D1": 26,"D#1": 27,"Dsharp1": 27,"Eb1": 27,"E1": 28,"F1": 29,"F#1": 30,"Fsharp1": 30,"Gb1": 30,"G1": 31,"G#1": 32,"Gsharp1": 32,"Ab1": 32,"A1": 33,"A#1": 34,"Asharp1": 34,"Bb1": 34,"B1": 35,"C2": 36,"C#2": 37,"Csharp2": 37,"Db2": 37,"D2": 38,"D#2": 39,"Dsharp2": 39,"Eb2": 39,"E2": 40,"F2": 41,"F#2": 42,"Fsharp2": 42,"Gb2": 42,"G2": 43,"G#2": 44,"Gsharp2": 44,"Ab2": 44,"A2": 45,"A#2": 46,"Asharp2": 46,"Bb2": 46,"B2": 47,"C3": 48,"C#3": 49,"Csharp3": 49,"Db3": 49,"D3": 50,"D#3": 51,"Dsharp3": 51,"Eb3": 51,"E3": 52,"F3": 53,"F#3": 54,"Fsharp3": 54,"Gb3": 54,"G3": 55,"G#3": 56,"Gsharp3": 56,"Ab3": 56,"A3": 57,"A#3": 58,"Asharp3": 58,"Bb3": 58,"B3": 59,"C4": 60,"C#4": 61,"Csharp4": 61,"Db4": 61,"D4": 62,"D#4": 63,"Dsharp4": 63,"Eb4": 63,"E4": 64,"F4": 65,"F#4": 66,"Fsharp4": 66,"Gb4": 66,"G4": 67,"G#4": 68,"Gsharp4": 68,"Ab4": 68,"A4": 69,"A#4": 70,"Asharp4": 70,"Bb4": 70,"B4": 71,"C5": 72,"C#5": 73,"Csharp5": 73,"Db5": 73,"D5": 74,"D#5": 75,"Dsharp5": 75,"Eb5": 75,"E5": 76,"F5": 77,"F#5": 78,"Fsharp5": 78,"Gb5": 78,"G5": 79,"G#5": 80,"Gsharp5": 80,"Ab5": 80,"A5": 81,"A#5": 82,"Asharp5": 82,"Bb5": 82,"B5": 83,"C6": 84,"C#6": 85,"Csharp6": 85,"Db6": 85,"D6": 86,"D#6": 87,"Dsharp6": 87,"Eb6": 87,"E6": 88,"F6": 89,"F#6": 90,"Fsharp6": 90,"Gb6": 90,"G6": 91,"G#6": 92,"Gsharp6": 92,"Ab6": 92,"A6": 93,"A#6": 94,"Asharp6": 94,"Bb6": 94,"B6": 95,"C7": 96,"C#7": 97,"Csharp7": 97,"Db7": 97,"D7": 98,"D#7": 99,"Dsharp7": 99,"Eb7": 99,"E7": 100,"F7": 101,"F#7": 102,"Fsharp7": 102,"Gb7": 102,"G7": 103,"G#7": 104,"Gsharp7": 104,"Ab7": 104,"A7": 105,"A#7": 106,"Asharp7": 106,"Bb7": 106,"B7": 107,"C8": 108,"C#8": 109,"Csharp8": 109,"Db8": 109,"D8": 110,"D#8": 111,"Dsharp8": 111,"Eb8": 111,"E8": 112,"F8": 113,"F#8": 114,"Fsharp8": 114,"Gb8": 114,"G8": 115,"G#8": 116,"Gsharp8": 116,"Ab8": 116,"A8": 117,"A#8": 118,"Asharp8": 118,"Bb8": 118,"B8": 119,"C9": 120,"C#9": 121,"Csharp9": 121,"Db9": 121,"D9": 122,"D#9": 123,"Dsharp9": 123,"Eb9": 123,"E9": 124,"F9": 125,"F#9": 126,"Fsharp9": 126,"Gb9": 126,"G9": 127
 }
@@ -11,6 +13,16 @@ noteNameToMidi = {
 # DO NOT MODIFY THIS CLASS
 class SynthBaseClass():
     """ Base class for all sound synthesizers"""
+
+    # True if two calls with the same arguments can return different sounds (e.g. random noise).
+    # Stochastic synths must implement generate(..., rng=None) and draw every random number from rng (a np.random.Generator).
+    # A note rendered with a seed is reproducible, so it can be cached. Without one it is never served from the note render cache
+    stochastic = False
+
+    # True if generate(x, amp, d) == amp * generate(x, 1, d), i.e. amp is a pure output multiplier.
+    # Amplitude-linear synths are rendered once at unit amplitude and scaled while mixing
+    amplitude_linear = False
+
     def __init__(self):
         self.name = None
         self.sample_rate = 44100
@@ -20,28 +32,78 @@ class SynthBaseClass():
         self.sample_rate = sample_rate
 
 
-    def __call__(self, note, amp, duration):
-        """ This method is called when the synth is used as a function"""
+    def __call__(self, note, amp, duration, seed=None):
+        """ This method is called when the synth is used as a function.
+        seed: seed of the random generator of stochastic synths (int or tuple of ints, None: not reproducible) """
 
-        # debug_str = ""
+        kwargs = {"rng": np.random.default_rng(seed)} if self.stochastic else {}
+        return as_render_dtype(self.generate(self.note_input(note), amp, duration, **kwargs))
+
+    def note_input(self, note):
+        """ Value given to generate() for a note (MIDI number or name): the note itself or its frequency, see generate_input() """
         if isinstance(note, str):
-            # debug_str = f"note: {note} "
             note = noteNameToMidi[note]
         note = int(note)
-        freq = 440 * 2**((note - 69) / 12)
 
-        # debug_str += f"{note} {freq:.2f} Hz"
-        # print(debug_str)
+        # check if generate method has "note" argument
+        if self.generate_input() == "note":
+            return note
+        return 440 * 2**((note - 69) / 12)
 
-        arg_names = inspect.getfullargspec(self.generate).args
+    def generate_input(self):
+        """ Returns "note" or "freq", the kind of value expected by generate(). Inspected once per class """
+        cls = type(self)
+        if "_generate_input" not in cls.__dict__:
+            arg_names = inspect.getfullargspec(self.generate).args
+            if "note" in arg_names:
+                cls._generate_input = "note"
+            elif "freq" in arg_names:
+                cls._generate_input = "freq"
+            else:
+                raise Exception("generate method must have 'note' or 'freq' as an argument")
+        return cls._generate_input
 
-        # check if generate method has "note" argument
-        if "note" in arg_names:
-            return self.generate(note, amp, duration)
-        elif "freq" in arg_names:
-            return self.generate(freq, amp, duration)
-        else:
-            raise Exception("generate method must have 'note' or 'freq' as an argument")
+    def generate_batch(self, notes, amps, durations, seeds=None):
+        """ Generates many notes at once, returns a list of sound arrays in the same order.
+        If the synth implements generate_group(inputs, amps, duration), every note with the same duration
+        is rendered in a single 2-D pass (one row per note). Otherwise each note is generated on its own.
+        seeds: seed of each note for stochastic synths (None: not reproducible) """
+        if not hasattr(self, "generate_group") or self.stochastic:
+            if seeds is None:
+                seeds = [None] * len(notes)
+            return [self(note, amp, duration, seed) for note, amp, duration, seed in zip(notes, amps, durations, seeds)]
+
+        inputs = [self.note_input(note) for note in notes]
+
+        groups = {}
+        for i, duration in enumerate(durations):
+            groups.setdefault(duration, []).append(i)
+
+        out = [None] * len(notes)
+        for duration, indexes in groups.items():
+            waves = as_render_dtype(self.generate_group(np.array([inputs[i] for i in indexes]), np.array([amps[i] for i in indexes]), duration))
+            for i, wave_array in zip(indexes, waves):
+                out[i] = wave_array
+        return out
+
+    def render_into(self, out, note, amp, duration, seed=None):
+        """ Adds the note to out, a view of at least note_length() samples (e.g. a slice of the track buffer),
+        and returns the number of samples written.
+        The default renders the note with __call__ and adds it. Synths can override it to render
+        with NumPy out= arguments, without the temporaries of generate() (see add_into()) """
+        return self.add_into(out, self(note, amp, duration, seed))
+
+    def add_into(self, out, wave_array):
+        """ Adds a note (in any float dtype) to out as __call__ would return it and returns its number of samples """
+        if wave_array.size > out.size:
+            raise ValueError(f"{self.name}: note of {wave_array.size} samples does not fit in {out.size} samples (wrong note_length()?)")
+        add_into(out, wave_array)
+        return wave_array.size
+
+    def note_length(self, note, duration):
+        """ Number of samples returned when the synth is called with this note and duration.
+        Synths that add a release or extra time must override it, so the track buffer can be sized exactly """
+        return int(duration * self.sample_rate)
 
     def generate(self, note, amp, duration):
         raise NotImplementedError("generate(self, *args) must be implemented in Synth subclass")
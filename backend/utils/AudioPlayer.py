@@ -5,6 +5,9 @@ import wave
 import io
 import time
 
+from backend.utils.TrackStream import TrackStream
+from backend.utils.RenderConfig import as_render_dtype
+
 import platform
 from ctypes import *
 from contextlib import contextmanager
@@ -93,7 +96,8 @@ class AudioPlaybackThread(QThread):
                 stream.close()
             p.terminate()
 
-            if self.is_stopped or data is None or len(data) == 0:
+            # A streamed wave object returns no data when it is interrupted by a pause
+            if self.is_stopped or ((data is None or len(data) == 0) and not self.is_paused):
                 # print("\t\tFINISHED")
                 self.wo.rewind()
                 self.finished.emit()
@@ -127,6 +131,7 @@ class AudioPlaybackThread(QThread):
         self.paused_at_frame = self.total_frames_read
         with QMutexLocker(self.mutex):
             self.is_paused = True
+        self.interrupt_stream()
 
 
     def start(self):
@@ -148,6 +153,12 @@ class AudioPlaybackThread(QThread):
 
             if not self.running:
                 self.currentTimeUpdated.emit(self.total_frames_read)
+        self.interrupt_stream()
+
+    def interrupt_stream(self):
+        ''' Wakes up run() if it is waiting for frames of a TrackStream that are still being rendered '''
+        if isinstance(self.wo, TrackStream):
+            self.wo.interrupt()
 
 
 
@@ -283,7 +294,7 @@ class AudioPlayer(QObject):
                 wo.rewind()
                 arr = np.frombuffer(wo.readframes(wo.getnframes()), dtype=np.int16)
                 time = np.linspace(0, len(arr) / wo.getframerate(), len(arr))
-                return time, np.clip(arr / 32767.0, -1.0, 1.0)
+                return time, np.clip(as_render_dtype(arr) / 32767.0, -1.0, 1.0)
         except Exception as e:
             self.errorOccurred.emit(str(e))
             return None, None
@@ -314,7 +325,21 @@ class AudioPlayer(QObject):
         self.playback_thread.wo.rewind()
         arr = np.frombuffer(self.playback_thread.wo.readframes(self.nframes), dtype=np.int16)
         time = np.linspace(0, len(arr) / self.framerate, len(arr))
-        return time, np.clip(arr / 32767.0, -1.0, 1.0)
+        return time, np.clip(as_render_dtype(arr) / 32767.0, -1.0, 1.0)
+
+
+    def set_stream(self, track_stream):
+        ''' Plays a TrackStream, frames are played as soon as they are rendered '''
+        self.set_wave_object(track_stream)
+
+
+    def isStreaming(self, track_stream=None):
+        ''' True if the current wave object is a TrackStream (or the given one) '''
+        if self.playback_thread is None:
+            return False
+        if track_stream is not None:
+            return self.playback_thread.wo is track_stream
+        return isinstance(self.playback_thread.wo, TrackStream)
 
 
     def set_wave_object(self, wave_obj):
@@ -0,0 +1,106 @@
+"""
+In-memory cache of synthesized notes.
+
+Each rendered note is stored under a key built from everything that defines its samples:
+- instrument name and the values of its ParameterList
+- note, amplitude and duration
+- effect name and the values of its ParameterList
+- render dtype
+- seed of the note (stochastic synths)
+
+The cache is bounded by a byte budget. When it is exceeded, the least recently used notes are evicted.
+"""
+
+from collections import OrderedDict
+import threading
+
+from backend.utils.RenderConfig import get_render_dtype
+
+
+class NoteRenderCache():
+    """ LRU cache of note waveforms bounded by a byte budget """
+    def __init__(self, max_bytes=256 * 1024 * 1024):
+        self.max_bytes = int(max_bytes)
+        self.size_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def params_key(params):
+        """ Hashable representation of the values of a ParameterList (its snapshot) """
+        return params.snapshot()
+
+    def note_key(self, instrument, note, amplitude, duration, effect=None, seed=None):
+        """ Returns the key of a note rendered with the given instrument, effect and seed """
+        effect_key = None
+        if effect is not None:
+            effect_key = (effect.name, self.params_key(effect.params))
+        return (instrument.name, self.params_key(instrument.params), note, amplitude, duration, effect_key, get_render_dtype().name, seed)
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __contains__(self, key):
+        with self.lock:
+            return key in self.entries
+
+    def get(self, key):
+        """ Returns the cached waveform (read-only) or None. Updates the hit/miss counters """
+        with self.lock:
+            wave_array = self.entries.get(key)
+            if wave_array is None:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return wave_array
+
+    def put(self, key, wave_array):
+        """ Stores a waveform, evicting the least recently used ones if the budget is exceeded """
+        if wave_array is None or wave_array.nbytes > self.max_bytes:
+            return
+        wave_array.flags.writeable = False
+
+        with self.lock:
+            if key in self.entries:
+                self.size_bytes -= self.entries.pop(key).nbytes
+            self.entries[key] = wave_array
+            self.size_bytes += wave_array.nbytes
+
+            while self.size_bytes > self.max_bytes:
+                _, evicted = self.entries.popitem(last=False)
+                self.size_bytes -= evicted.nbytes
+
+    def set_max_bytes(self, max_bytes):
+        """ Changes the byte budget, evicting entries if needed """
+        with self.lock:
+            self.max_bytes = int(max_bytes)
+            while self.size_bytes > self.max_bytes and len(self.entries) > 0:
+                _, evicted = self.entries.popitem(last=False)
+                self.size_bytes -= evicted.nbytes
+
+    def clear(self):
+        """ Removes every entry and resets the counters """
+        with self.lock:
+            self.entries.clear()
+            self.size_bytes = 0
+            self.hits = 0
+            self.misses = 0
+
+    def hit_rate(self):
+        """ Returns the fraction of lookups that were hits (0-1) """
+        total = self.hits + self.misses
+        return self.hits / total if total > 0 else 0.0
+
+    def stats(self):
+        """ Returns a dict with the cache counters """
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hit_rate(),
+            "entries": len(self.entries),
+            "size_bytes": self.size_bytes,
+            "max_bytes": self.max_bytes,
+        }
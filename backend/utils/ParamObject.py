@@ -11,6 +11,10 @@ Each one can be accessed and modified by its name key using the [] operator of t
 
 The parameter list is used to automatically generate a GUI for the user to interact with the parameters.
 
+ParameterList.snapshot() returns a ParameterSnapshot: a frozen, hashable copy of the values, read with the same [] operator
+(or as attributes). Renders read their parameters from a snapshot, so GUI changes do not affect them, and the snapshot
+is the key of the parameters in the render caches. Every change made with the [] operator increments ParameterList.version
+
 Each parameter will be displayed as:
 - NumParam      ->  NumberInput (Slider + TextInput)
 - ChoiceParam   ->  DropDownMenu
@@ -19,7 +23,6 @@ Each parameter will be displayed as:
 
  """
 
-import sympy as sp
 import numpy as np
 
 class ParameterBase():
@@ -78,10 +81,65 @@ class BoolParam(ParameterBase):
             self.value = value
 
 
+class ParameterSnapshot():
+    """ Frozen values of a ParameterList (see ParameterList.snapshot) """
+    def __init__(self, items):
+        items = tuple(items)
+        object.__setattr__(self, "_items", items)
+        object.__setattr__(self, "_values", dict(items))
+        object.__setattr__(self, "_hash", hash(items))
+
+    def __len__(self):
+        return len(self._items)
+
+    def keys(self):
+        return self._values.keys()
+
+    def items(self):
+        return self._items
+
+    def __getitem__(self, key):
+        if key not in self._values:
+            raise KeyError("Parameter not found")
+        return self._values[key]
+
+    def __getattr__(self, name):
+        # Only called for names that are not attributes, i.e. the parameters
+        if name.startswith("_") or name not in self._values:
+            raise AttributeError(f"Parameter {name} not found")
+        return self._values[name]
+
+    def __setitem__(self, key, value):
+        raise TypeError("Parameter snapshots are read-only")
+
+    def __setattr__(self, name, value):
+        raise TypeError("Parameter snapshots are read-only")
+
+    def __eq__(self, other):
+        return isinstance(other, ParameterSnapshot) and self._items == other._items
+
+    def __hash__(self):
+        return self._hash
+
+    def __reduce__(self):
+        return (ParameterSnapshot, (self._items,))
+
+    def __repr__(self):
+        return f"ParameterSnapshot({dict(self._items)})"
+
+    def snapshot(self):
+        return self
+
+    def getFunction(self, eq, var, const = {}):
+        return ParameterList.getFunction(self, eq, var, const)
+
+
 class ParameterList():
     """ List of parameters with unique names"""
     def __init__(self, *args):
         self.internal_parameter_list = {}
+        self.version = 0                    # incremented on every change made with the [] operator
+        self.last_snapshot = None
         
         # look for repeated names
         names = [p.name for p in list(args)]
@@ -114,7 +172,16 @@ class ParameterList():
         # if not isinstance(value, type(self.internal_parameter_list[key].v)):
         #     raise ValueError(f"Parameter {key} type mismatch. Expected {type(self.internal_parameter_list[key].step)}, got {type(value)}")
         self.internal_parameter_list[key].value = value
+        self.version += 1
 
+    def snapshot(self):
+        '''
+        Returns a ParameterSnapshot of the current values. Snapshots are hashable and read-only,
+        the same snapshot is returned until a value changes
+        '''
+        if self.last_snapshot is None or self.last_snapshot[0] != self.version:
+            self.last_snapshot = (self.version, ParameterSnapshot((p.name, p.value) for p in self))
+        return self.last_snapshot[1]
 
 
     def getFunction(self, eq, var, const = {}):
@@ -124,6 +191,7 @@ class ParameterList():
         - var: name of the variable to be used in the equation (is not needed to be present in the equation)
         - const: dictionary with constant values (optional)
         '''
+        import sympy as sp     # imported here, it is slow to import and only equations need it
         eqstr = self[eq]
         try:
             eq = sp.sympify(eqstr)
@@ -0,0 +1,128 @@
+"""
+Helpers to run a function over many tasks using every core of the machine.
+
+The function and the arguments shared by every task (e.g. instrument and effect)
+are shipped once per worker process through the pool initializer, so each task
+only pickles its own arguments and its result.
+
+A pool can also be shared by several jobs with different shared arguments (contexts).
+Each context is shipped once per worker process: a task sent without its context to a
+process that does not have it returns NeedContext, and must be submitted again with it.
+A context also holds the RenderConfig settings of its job (see render_context()), applied before each
+of its tasks, so the settings changed after the pool was created are not ignored.
+
+This module does not depend on Qt, so it can be used from headless tools.
+"""
+
+import os
+import importlib
+import multiprocessing
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+
+from backend.utils import RenderConfig
+
+
+# State of the current worker process, set by the pool initializer
+_process_state = {
+    "function": None,
+    "shared_args": (),
+    "contexts": OrderedDict(),      # context_key -> (render settings, shared args) of a job, least recently used first
+}
+
+# Max contexts kept by each worker process
+MAX_CONTEXTS = 8
+
+
+class NeedContext():
+    ''' Result of a context task run by a process that does not have the context yet '''
+    pass
+
+
+def _init_process_worker(function, shared_args, render_settings):
+    RenderConfig.apply_settings(render_settings)
+    _process_state["function"] = function
+    _process_state["shared_args"] = tuple(shared_args)
+
+
+def _run_task(task_args):
+    return _process_state["function"](*task_args, *_process_state["shared_args"])
+
+
+def _run_context_task(context_key, context, task_args):
+    contexts = _process_state["contexts"]
+    if context is not None:
+        contexts[context_key] = context
+        while len(contexts) > MAX_CONTEXTS:
+            contexts.popitem(last=False)
+    elif context_key not in contexts:
+        return NeedContext()
+    contexts.move_to_end(context_key)
+    render_settings, shared_args = contexts[context_key]
+    RenderConfig.apply_settings(render_settings)
+    return _process_state["function"](*task_args, *shared_args)
+
+
+def default_worker_count():
+    ''' Number of worker processes to use by default (one per core) '''
+    return os.cpu_count() or 1
+
+
+def create_process_pool(function, shared_args=(), max_workers=None):
+    '''
+    Creates a ProcessPoolExecutor whose workers will call function(*task_args, *shared_args).
+    - function: must be picklable (module level function or static method)
+    - shared_args: arguments appended to every task, shipped once per worker
+    - max_workers: number of processes (defaults to the number of cores)
+    '''
+    if not callable(function):
+        raise Exception("Function must be callable")
+    if max_workers is None:
+        max_workers = default_worker_count()
+
+    # 'spawn' is safe with running Qt threads and behaves the same in every OS
+    return ProcessPoolExecutor(
+        max_workers=max_workers,
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=_init_process_worker,
+        initargs=(function, tuple(shared_args), RenderConfig.get_settings()),
+    )
+
+
+def _start_worker(modules):
+    for module in modules:
+        importlib.import_module(module)
+    return os.getpid()
+
+
+def start_workers(executor, max_workers=None, modules=()):
+    '''
+    Starts the worker processes of a pool created with create_process_pool() without waiting for them.
+    Processes are otherwise spawned by the first tasks, so the first render pays for their startup
+    - modules: names of the modules that each worker imports in advance (e.g. those of the synths it will unpickle)
+    '''
+    for _ in range(max_workers or default_worker_count()):
+        executor.submit(_start_worker, tuple(modules))
+
+
+def submit_task(executor, task_args):
+    ''' Submits a single task to a pool created with create_process_pool() '''
+    return executor.submit(_run_task, task_args)
+
+
+def render_context(shared_args):
+    ''' Context of a job for submit_context_task(): its shared args and the current RenderConfig settings '''
+    return (RenderConfig.get_settings(), tuple(shared_args))
+
+
+def submit_context_task(executor, context_key, task_args, context=None):
+    '''
+    Submits a task that runs function(*task_args, *shared_args) in a pool created with create_process_pool(function).
+    - context: render_context() of the job. If None and the process does not have it, the result is a NeedContext instance
+    '''
+    return executor.submit(_run_context_task, context_key, context, task_args)
+
+
+def needs_context(result):
+    ''' True if the task must be submitted again with its context '''
+    return isinstance(result, NeedContext)
@@ -0,0 +1,75 @@
+"""
+Global settings of the audio rendering pipeline.
+
+render dtype: floating point type of every rendered array (synth and effect outputs, track buffers,
+note cache, mixer and player). float32 (default) halves the memory of the synthesized tracks and
+runs the transcendental functions of the synths much faster. float64 can be selected for reference renders.
+
+Process pools created with ProcessPool.create_process_pool() copy these settings to their workers.
+
+This module does not depend on Qt, so it can be used from headless tools.
+"""
+
+import numpy as np
+
+
+render_dtypes = [np.float32, np.float64]
+
+_settings = {
+    "dtype": np.dtype(np.float32),
+}
+
+
+def get_render_dtype():
+    ''' Returns the numpy dtype of the rendered audio '''
+    return _settings["dtype"]
+
+
+def set_render_dtype(dtype):
+    ''' Sets the numpy dtype of the rendered audio (float32 or float64) '''
+    dtype = np.dtype(dtype)
+    if dtype not in [np.dtype(d) for d in render_dtypes]:
+        raise ValueError(f"Render dtype must be one of {[np.dtype(d).name for d in render_dtypes]}")
+    _settings["dtype"] = dtype
+
+
+def get_settings():
+    ''' Returns a copy of the settings (used to configure worker processes) '''
+    return dict(_settings)
+
+
+def apply_settings(settings):
+    ''' Applies settings returned by get_settings() '''
+    _settings.update(settings)
+
+
+def as_render_dtype(array):
+    ''' Returns the array in the render dtype (not copied if it already is) '''
+    return np.asarray(array, dtype=_settings["dtype"])
+
+
+def zeros(n):
+    ''' np.zeros in the render dtype '''
+    return np.zeros(n, dtype=_settings["dtype"])
+
+
+def add_into(out, array):
+    ''' Adds array to the first array.size samples of out, converted to the render dtype first
+    (same values as out[:array.size] += as_render_dtype(array), without the converted copy) '''
+    view = out[:array.size]
+    np.add(view, array, out=view, dtype=_settings["dtype"])
+
+
+def render_sin(x, out=None):
+    '''
+    np.sin evaluated in the render dtype.
+    In float32 the argument (a float64 phase) is first reduced to [0, 2pi), so long and high notes
+    keep the accuracy of float64 while the sine itself runs with the float32 vectorized kernels
+    - out: array in the render dtype where the result is written (a new array if None)
+    '''
+    if _settings["dtype"] == np.float64:
+        return np.sin(x, out=out)
+    cycles = np.multiply(x, 1 / (2 * np.pi))
+    cycles -= np.floor(cycles)
+    cycles *= 2 * np.pi
+    return np.sin(cycles, out=out, dtype=np.float32)
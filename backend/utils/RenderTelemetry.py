@@ -0,0 +1,97 @@
+"""
+Timings of the render of a track.
+
+Every note synthesized by a worker reports the time spent in the instrument and in the effect.
+Notes that are not synthesized are counted by where they came from:
+- cache: taken from the NoteRenderCache
+- repeated: identical to another note of the track, rendered once and mixed again
+- reused: kept from the previous render of the track (incremental re-render)
+
+summary() returns the aggregates stored in synth_track_data["telemetry"].
+
+This module does not depend on Qt, so it can be used from headless tools.
+"""
+
+import time
+import numpy as np
+
+
+class RenderTelemetry():
+    def __init__(self, framerate, instrument_name="", effect_name=""):
+        self.framerate = framerate
+        self.instrument_name = instrument_name
+        self.effect_name = effect_name
+        self.notes = []             # (note, duration, samples, instrument_seconds, effect_seconds) of each synthesized note
+        self.cached_notes = 0
+        self.repeated_notes = 0
+        self.reused_notes = 0
+        self.start_time = time.perf_counter()
+        self.end_time = None
+        self.track_samples = 0
+
+
+    def add_note(self, note, duration, samples, instrument_seconds, effect_seconds):
+        self.notes.append((note, duration, samples, instrument_seconds, effect_seconds))
+
+
+    def finish(self, track_samples):
+        ''' Stops the clock of the render '''
+        self.end_time = time.perf_counter()
+        self.track_samples = track_samples
+
+
+    def summary(self, slowest=5):
+        ''' Returns a dict with the aggregates of the render (times in seconds) '''
+        end_time = self.end_time if self.end_time is not None else time.perf_counter()
+        wall_seconds = end_time - self.start_time
+        audio_seconds = self.track_samples / self.framerate
+
+        instrument_times = np.array([n[3] for n in self.notes])
+        effect_times = np.array([n[4] for n in self.notes])
+
+        def percentile(times, q):
+            return float(np.percentile(times, q)) if times.size > 0 else 0.0
+
+        by_time = sorted(self.notes, key=lambda n: n[3] + n[4], reverse=True)[:slowest]
+        return {
+            "instrument": self.instrument_name,
+            "effect": self.effect_name,
+            "wall_seconds": wall_seconds,
+            "audio_seconds": audio_seconds,
+            "rtf": wall_seconds / audio_seconds if audio_seconds > 0 else 0.0,
+            "instrument_seconds": float(instrument_times.sum()),
+            "effect_seconds": float(effect_times.sum()),
+            "instrument_p50": percentile(instrument_times, 50),
+            "instrument_p95": percentile(instrument_times, 95),
+            "effect_p50": percentile(effect_times, 50),
+            "effect_p95": percentile(effect_times, 95),
+            "synthesized_notes": len(self.notes),
+            "cached_notes": self.cached_notes,
+            "repeated_notes": self.repeated_notes,
+            "reused_notes": self.reused_notes,
+            "slowest_notes": [
+                {"note": note, "duration": duration, "samples": samples, "instrument_seconds": inst_s, "effect_seconds": effect_s}
+                for note, duration, samples, inst_s, effect_s in by_time
+            ],
+        }
+
+
+def format_summary(summary):
+    ''' Text of a summary() for the GUI '''
+    synth_seconds = summary["instrument_seconds"] + summary["effect_seconds"]
+    effect_share = summary["effect_seconds"] / synth_seconds * 100 if synth_seconds > 0 else 0.0
+    lines = [
+        f"Tiempo total: {summary['wall_seconds']:.2f} s para {summary['audio_seconds']:.2f} s de audio (RTF {summary['rtf']:.3f})",
+        f"Instrumento ({summary['instrument']}): {summary['instrument_seconds']:.2f} s, "
+        f"p50 {summary['instrument_p50'] * 1e3:.1f} ms, p95 {summary['instrument_p95'] * 1e3:.1f} ms por nota",
+        f"Efecto ({summary['effect']}): {summary['effect_seconds']:.2f} s ({effect_share:.0f}%), "
+        f"p50 {summary['effect_p50'] * 1e3:.1f} ms, p95 {summary['effect_p95'] * 1e3:.1f} ms por nota",
+        f"Notas: {summary['synthesized_notes']} sintetizadas, {summary['cached_notes']} de caché, "
+        f"{summary['repeated_notes']} repetidas, {summary['reused_notes']} del render anterior",
+    ]
+    if summary["slowest_notes"]:
+        lines.append("Notas más lentas:")
+        for n in summary["slowest_notes"]:
+            lines.append(f"  nota {n['note']} ({n['duration']:.2f} s): instrumento {n['instrument_seconds'] * 1e3:.1f} ms, "
+                         f"efecto {n['effect_seconds'] * 1e3:.1f} ms")
+    return "\n".join(lines)
@@ -1,116 +1,279 @@
 from PyQt5.QtCore import pyqtSignal, QObject
-from backend.utils.Worker import Worker
+from backend.utils.Worker import Worker, WorkerPool, ProcessPoolWorker
+from backend.utils.NoteRenderCache import NoteRenderCache
+from backend.utils.TrackStream import TrackStream
+from backend.utils.TrackRenderer import TrackRenderer, render_note_batch, track_seed
+from backend.utils.ProcessPool import create_process_pool, start_workers, default_worker_count
+
+from functools import partial
+import threading
+import copy
+
+
+class TrackJob():
+    ''' State of a track being synthesized '''
+    def __init__(self, name, worker, renderer, synth_track_data, stream=None):
+        self.name = name
+        self.worker = worker
+        self.renderer = renderer
+        self.synth_track_data = synth_track_data
+        self.stream = stream
+        self.last_progress = 0
+        self.failed = False     # a task raised an error, the track may be missing notes
 
-import numpy as np
 
 class SynthTrackManager(QObject):
     errorOccurred = pyqtSignal(str)
-    progressUpdate = pyqtSignal(int)
+    progressUpdate = pyqtSignal(int)                    # overall progress of the tracks being synthesized
+    trackProgressUpdate = pyqtSignal(str, int)          # (track_name, progress)
     synthTrackComplete = pyqtSignal(str, dict)
+    synthTrackStreamStarted = pyqtSignal(str, object)   # (track_name, TrackStream) emitted when a streaming render begins
+    allTracksComplete = pyqtSignal()
+
+    # Available execution backends for render_note_batch tasks
+    #   "thread":   one background QThread per track (Worker)
+    #   "threads":  pool of threads per track (WorkerPool), all tracks share one slot per core. No pickling, scales when synths release the GIL
+    #   "process":  pool of processes, one per core, shared by all tracks (ProcessPoolWorker). Its processes are started
+    #               when the backend is selected. They import the __main__ module of the app, main.py only imports Qt and the GUI when run directly
+    backends = ["thread", "threads", "process"]
 
-    def __init__(self, framerate):
+    def __init__(self, framerate, backend="thread", max_workers=None, cache_bytes=256 * 1024 * 1024, batch_size=16, stream_block_size=8192,
+                 result_rate=30, progress_step=1, incremental=True, deterministic=True):
         super().__init__()
-        self.framerate = framerate        
-        self.worker = None
-        self.synth_track_data = None
-        self.track_array = None
-        self.sending_progress = False
+        self.framerate = framerate
+        self.process_pool = None
+        self.thread_slots = None
+        self.jobs = {}                  # track_name -> TrackJob of the tracks being synthesized
+        self.set_backend(backend, max_workers)
+        self.batch_size = batch_size    # max notes per worker task, notes of equal duration are batched together
+        self.cache = NoteRenderCache(cache_bytes) if cache_bytes else None
+        self.incremental = incremental  # re-renders of a track only synthesize the notes that changed since its last render
+        self.rendered = {}              # track_name -> TrackRenderer of the last finished render of the track
+        self.deterministic = deterministic  # stochastic synths render each note with a seed from (track name, note index)
+        self.result_rate = result_rate          # max times per second that worker results are handed to the GUI thread
+        self.progress_step = progress_step      # min progress change (%) to emit progressUpdate
+        self.last_progress = 0
+        self.stream_block_size = stream_block_size
+
+
+    def set_backend(self, backend, max_workers=None):
+        ''' Selects the execution backend used by the next synthesize_track() calls '''
+        if backend not in self.backends:
+            raise ValueError(f"Backend must be one of {self.backends}")
+        if self.is_busy() and (backend != self.backend or max_workers != self.max_workers):
+            raise Exception("The backend cannot be changed while tracks are being synthesized")
+        if self.process_pool is not None and (backend != "process" or max_workers != self.max_workers):
+            self.process_pool.shutdown(wait=False, cancel_futures=True)
+            self.process_pool = None
+        self.backend = backend
+        self.max_workers = max_workers
+        self.thread_slots = threading.Semaphore(max_workers or default_worker_count())
+        if backend == "process":
+            self.get_process_pool()
+
+
+    def get_process_pool(self):
+        ''' Process pool shared by every track, its workers are started when it is created (once per session) '''
+        if self.process_pool is None:
+            self.process_pool = create_process_pool(render_note_batch, max_workers=self.max_workers)
+            start_workers(self.process_pool, self.max_workers, modules=["backend.Catalog"])      # every synth and effect
+        return self.process_pool
+
+
+    def shutdown(self):
+        ''' Cancels every track and stops the worker processes '''
+        self.cancel()
+        if self.process_pool is not None:
+            self.process_pool.shutdown(wait=False, cancel_futures=True)
+            self.process_pool = None
+
+
+    def create_worker(self, trackName, instrument, effect):
+        ''' Returns (worker, shared_args): shared_args must be appended to each task for the thread backends '''
+        if self.backend == "process":
+            worker = ProcessPoolWorker(function=render_note_batch, task_key=trackName, shared_args=(instrument, effect),
+                                       max_workers=self.max_workers, executor=self.get_process_pool())
+            return worker, ()
+        if self.backend == "threads":
+            worker = WorkerPool(function=render_note_batch, task_key=trackName, num_threads=self.max_workers, slots=self.thread_slots)
+            return worker, (instrument, effect)
+        return Worker(function=render_note_batch, task_key=trackName), (instrument, effect)
+
 
     @staticmethod
-    def synthWorkerFunction(n0, note, amplitude, duration, instrument, effect=None):
-        wave_array = instrument(note, amplitude, duration)
-        if effect is not None:
-            wave_array = effect(wave_array)
-        return n0, wave_array
-    
+    def snapshot(tool):
+        ''' Copy of a synth or effect that reads a frozen snapshot of its parameters, so GUI changes do not affect a running render '''
+        if tool is None:
+            return None
+        tool_copy = copy.copy(tool)
+        tool_copy.params = tool.params.snapshot()
+        return tool_copy
+
 
-    def is_busy(self):
-        return self.worker is not None and self.worker.isRunning()
-    
+    def is_busy(self, trackName=None):
+        ''' True if the track (or any track if None) is being synthesized '''
+        if trackName is not None:
+            return trackName in self.jobs
+        return len(self.jobs) > 0
 
-    def synthesize_track(self, trackName, instrument, note_array, volume, effect=None):
+
+    def get_stream(self, trackName):
+        ''' TrackStream of a track being synthesized in streaming mode (None otherwise) '''
+        job = self.jobs.get(trackName)
+        return job.stream if job is not None else None
+
+
+    def forget(self, trackName=None):
+        ''' Drops the last render of a track (or of every track if None), its next render synthesizes every note '''
+        if trackName is None:
+            self.rendered.clear()
+        else:
+            self.rendered.pop(trackName, None)
+
+
+    def progress(self):
+        ''' Overall progress (0-100) of the tracks being synthesized '''
+        if len(self.jobs) == 0:
+            return 100
+        return sum(job.worker.progress() for job in self.jobs.values()) // len(self.jobs)
+
+
+    def synthesize_track(self, trackName, instrument, note_array, volume, effect=None, stream=False):
+        '''
+        Renders the notes of a track in the background, synthTrackComplete is emitted when done.
+        Several tracks can be synthesized at the same time, a track that is already being synthesized is restarted.
+        - stream: if True, notes are rendered in time order and finished blocks are pushed to a TrackStream
+                  (sent with synthTrackStreamStarted) so the track can be played while it is being rendered
+        If the track was rendered before with the same instrument and effect parameters, only the notes that
+        were added, removed or moved are synthesized (see TrackRenderer)
+        If deterministic is set, stochastic synths render the same track every time
+        '''
+        if trackName in self.jobs:
+            # The restarted track is still being synthesized, allTracksComplete must not hide its progress
+            self.cancel(trackName, notify=False)
+
+        # The render uses a snapshot of the parameters
+        instrument = self.snapshot(instrument)
+        effect = self.snapshot(effect)
 
         # OUTPUT
-        self.synth_track_data = {
+        synth_track_data = {
             "description": "Write description here",
             "track_array": None,
             "instrument": instrument.name,
             "effect": effect.name if effect is not None else "None",
             "framerate": self.framerate,
+            "telemetry": None,
         }
 
-        self.worker = Worker(function=self.synthWorkerFunction, task_key=trackName)
+        worker, shared_args = self.create_worker(trackName, instrument, effect)
+
+        # When streaming, notes are rendered in time order so the blocks at the start are finished first
+        previous = self.rendered.get(trackName) if self.incremental else None
+        renderer = TrackRenderer(self.framerate, instrument, note_array, volume, effect,
+                                 cache=self.cache, batch_size=self.batch_size, time_ordered=stream, previous=previous,
+                                 seed=track_seed(trackName) if self.deterministic else None)
+        for task_args in renderer.tasks:
+            worker.add_task((*task_args, *shared_args))
 
-        total_song_frames = int(note_array[-1].duration * self.framerate)
-        timeLimiter = 9999.0
-        lastTime = 0.0
-        n0 = 0
-        for note in note_array:
-            # d = n.time_on - lastTime
-            # lastTime = n.time_on
-            delay = note.time_on - lastTime
-            lastTime = note.time_on
+        job = TrackJob(trackName, worker, renderer, synth_track_data)
+        self.jobs[trackName] = job
 
-            if note.time_off is not None and note.time_off > timeLimiter:
-                print("Reached time limit!")
-                break
+        if stream:
+            job.stream = TrackStream(renderer.track_end, self.framerate, self.stream_block_size)
+            self.advance_stream(job)
+            self.synthTrackStreamStarted.emit(trackName, job.stream)
 
-            amp = note.amplitude * volume
-            
-            total_song_frames += int(delay * 1.01 * self.framerate)
+        # Results are coalesced by the worker so the GUI event loop is not flooded with one signal per task
+        worker.set_batch_interval(1.0 / self.result_rate if self.result_rate else None)
+        worker.taskComplete.connect(partial(self.on_note_synthesized, job))
+        worker.resultsReady.connect(partial(self.on_notes_synthesized, job))
+        worker.finished.connect(partial(self.on_track_synthesized, job))
+        worker.onError.connect(partial(self.on_worker_error, job))
 
-            n0 += int(delay * self.framerate)
-            self.worker.add_task((n0, note.note, amp, note.duration, instrument, effect))
+        self.last_progress = self.progress()
+        worker.start()
 
 
-        # print(f"Song Length (Samples): {total_song_frames}")
-        
-        self.track_array = np.zeros(total_song_frames + self.framerate * 1)
+    def cancel(self, trackName=None, notify=True):
+        '''
+        Cancels a track (or every track if None)
+        - notify: emit allTracksComplete if no track is left (False when the track is about to be restarted)
+        '''
+        names = [trackName] if trackName is not None else list(self.jobs.keys())
+        for name in names:
+            job = self.jobs.pop(name, None)
+            if job is None:
+                continue
+            job.worker.cancel()
+            job.worker.wait()
+            if job.stream is not None:
+                job.stream.close()
+        if notify and len(self.jobs) == 0 and len(names) > 0:
+            self.allTracksComplete.emit()
 
 
-        self.worker.taskComplete.connect(self.on_note_synthesized)
-        self.worker.finished.connect(self.on_track_synthesized)
-        self.worker.onError.connect(self.errorOccurred)
+    def on_worker_error(self, job, message):
+        job.failed = True
+        self.errorOccurred.emit(message)
 
-        self.sending_progress = True
-        self.worker.start()
 
+    def advance_stream(self, job):
+        ''' Pushes the blocks of the stream that no pending note can modify anymore '''
+        job.stream.advance(job.renderer.track_array, job.renderer.frontier())
 
-    def cancel(self):
-        if self.worker is not None:
-            self.sending_progress = False
-            self.worker.cancel()
-            self.worker.wait()
 
+    def on_note_synthesized(self, job, note_synth_packs):
+        self.on_notes_synthesized(job, [note_synth_packs])
 
-    def on_note_synthesized(self, note_synth_pack):
-        n0, wave_array = note_synth_pack
+
+    def on_notes_synthesized(self, job, results):
+        ''' Mixes the results of several worker tasks of a track (each one a list of (task_id, wave_array)) '''
+        if self.jobs.get(job.name) is not job:
+            return      # cancelled or restarted
         try:
-            if n0 + wave_array.size >= self.track_array.size:
-                # print("ERROR: Song too short or note too long. Adding more zeros to wave_array")
-                zeros_needed = n0 + wave_array.size - self.track_array.size + 1  # +1 to avoid off-by-one error
-                self.track_array = np.append(self.track_array, np.zeros(zeros_needed))
-                return
+            for note_synth_packs in results:
+                job.renderer.mix_results(note_synth_packs)
 
-            self.track_array[n0 : n0 + wave_array.size] += wave_array
+            if job.stream is not None:
+                self.advance_stream(job)
 
-            if self.sending_progress:
-                self.progressUpdate.emit(self.worker.progress())
+            self.update_progress(job)
 
         except Exception as e:
             print(__file__, '\t', e)
             self.errorOccurred.emit(str(e))
-            self.worker.cancel()
-            self.worker.wait()
+            self.cancel(job.name)
             return
 
 
-    def on_track_synthesized(self, track_name):
-        
-        self.synth_track_data["track_array"] = self.track_array
-        self.synthTrackComplete.emit(track_name, self.synth_track_data)
+    def update_progress(self, job):
+        progress = job.worker.progress()
+        if progress - job.last_progress >= self.progress_step:
+            job.last_progress = progress
+            self.trackProgressUpdate.emit(job.name, progress)
+
+        progress = self.progress()
+        if progress - self.last_progress >= self.progress_step:
+            self.last_progress = progress
+            self.progressUpdate.emit(progress)
+
+
+    def on_track_synthesized(self, job, track_name):
+        if self.jobs.get(job.name) is not job:
+            return      # cancelled or restarted
+
+        job.synth_track_data["track_array"] = job.renderer.finish()
+        job.synth_track_data["telemetry"] = job.renderer.telemetry.summary()
+        if job.stream is not None:
+            job.stream.finish(job.synth_track_data["track_array"])
+        # A track with failed notes can not be the base of the next render
+        self.rendered.pop(job.name, None)
+        if self.incremental and not job.failed:
+            job.renderer.tasks = []
+            self.rendered[job.name] = job.renderer
+        self.synthTrackComplete.emit(track_name, job.synth_track_data)
 
-        self.sending_progress = False
-        self.synth_track_data = None
-        self.track_array = None
-        self.worker = None
\ No newline at end of file
+        del self.jobs[job.name]
+        if len(self.jobs) == 0:
+            self.allTracksComplete.emit()
@@ -0,0 +1,40 @@
+"""
+Process-wide time axis of the synths.
+
+time_axis(n, sample_rate) returns the times of the first n samples of a note, arange(n) / sample_rate, as a
+read-only view of one precomputed buffer per sample rate, so notes do not allocate and fill their own time vector.
+The buffer grows (at least doubling) when a longer note needs it. Views handed out before keep the previous
+buffer alive, its values are the same.
+
+This module does not depend on Qt, so it can be used from headless tools.
+"""
+
+import threading
+import numpy as np
+
+
+MIN_SAMPLES = 1 << 18       # initial size of each buffer (~6 s at 44.1 kHz)
+
+_buffers = {}               # sample_rate -> read-only float64 buffer
+_lock = threading.Lock()
+
+
+def time_axis(n, sample_rate):
+    ''' Read-only float64 array with the times of n samples at sample_rate (a shared view: copy it before modifying) '''
+    n = max(int(n), 0)
+    buffer = _buffers.get(sample_rate)
+    if buffer is None or buffer.size < n:
+        with _lock:
+            buffer = _buffers.get(sample_rate)
+            if buffer is None or buffer.size < n:
+                size = max(n, MIN_SAMPLES, 2 * buffer.size if buffer is not None else 0)
+                buffer = np.arange(size) / sample_rate
+                buffer.flags.writeable = False
+                _buffers[sample_rate] = buffer
+    return buffer[:n]
+
+
+def clear():
+    ''' Frees the buffers (views in use stay valid) '''
+    with _lock:
+        _buffers.clear()
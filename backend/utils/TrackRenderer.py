@@ -0,0 +1,362 @@
+"""
+Core of the synthesis of a track, shared by the GUI (SynthTrackManager) and headless tools.
+
+TrackRenderer turns the notes of a track into batches of synthesis tasks and mixes their results:
+- identical notes are rendered once (or taken from the NoteRenderCache) and mixed at every start sample
+- if the amplitude is a pure output gain, notes are rendered at unit amplitude and scaled while mixing
+- notes of equal duration are batched so synths can render them in a single pass
+- the track array is sized exactly from the note lengths and effect tails
+- a re-render of a track can start from its previous render: only the notes that were added, removed or
+  moved are rendered, removed notes are subtracted from the previous track
+- notes of stochastic synths get a seed derived from (track seed, note index), so a seeded track is
+  reproducible bit by bit (and its notes can be cached) no matter which thread or process renders them
+
+Each task is (task_ids, notes, amplitudes, durations, seeds) and must be run with
+render_note_batch(*task, instrument, effect). Its result is given back to mix_results().
+Synchronous renders (render()) write the notes of synths that render note by note straight into the track
+buffer with render_into(), see render_into_track().
+The time spent in the instrument and in the effect of each note is recorded in a RenderTelemetry.
+
+This module does not depend on Qt, so it can be used from headless tools.
+"""
+
+import heapq
+import time
+import zlib
+from collections import Counter
+import numpy as np
+
+from backend.utils.ProcessPool import create_process_pool, submit_task
+from backend.utils.NoteRenderCache import NoteRenderCache
+from backend.utils.RenderTelemetry import RenderTelemetry
+from backend.utils import RenderConfig
+from backend.synths.SynthBaseClass import SynthBaseClass
+
+
+def track_seed(track_name):
+    ''' Seed of a track, stable across runs and processes (unlike hash()) '''
+    return zlib.crc32(str(track_name).encode())
+
+
+def render_note_batch(task_ids, notes, amplitudes, durations, seeds, instrument, effect=None):
+    '''
+    Renders a batch of notes, returns a list of (task_id, wave_array, (instrument_seconds, effect_seconds)).
+    The instrument time of the batch is split between its notes by their number of samples
+    '''
+    t0 = time.perf_counter()
+    wave_arrays = instrument.generate_batch(notes, amplitudes, durations, seeds)
+    instrument_seconds = time.perf_counter() - t0
+    batch_samples = max(sum(wave_array.size for wave_array in wave_arrays), 1)
+
+    results = []
+    for task_id, wave_array in zip(task_ids, wave_arrays):
+        note_seconds = instrument_seconds * wave_array.size / batch_samples
+        effect_seconds = 0.0
+        if effect is not None:
+            t0 = time.perf_counter()
+            wave_array = effect(wave_array)
+            effect_seconds = time.perf_counter() - t0
+        results.append((task_id, wave_array, (note_seconds, effect_seconds)))
+    return results
+
+
+class TrackRenderer():
+    def __init__(self, framerate, instrument, note_array, volume, effect=None, cache=None, batch_size=16, time_ordered=False, previous=None,
+                 seed=None):
+        '''
+        Plans the synthesis of a track and mixes the cached notes.
+        - cache: NoteRenderCache used to skip notes rendered before (None to disable)
+        - batch_size: max notes per task
+        - time_ordered: if True, batches are formed inside consecutive note windows so tasks follow the track in time
+        - previous: finished TrackRenderer of the same track. If it used the same instrument and effect parameters,
+                    the track starts from its result and only the notes that changed are rendered
+        - seed: seed of the track (see track_seed()), each note of a stochastic synth is rendered with (seed, note index).
+                None renders stochastic synths with unseeded generators
+        '''
+        self.framerate = framerate
+        self.instrument = instrument
+        self.effect = effect
+        self.cache = cache
+        self.seeded = seed is not None and instrument.stochastic
+        self.seed = seed
+        self.tools_key = self.get_tools_key(framerate, instrument, effect)
+        self.placements = Counter()     # (n0, gain, note, amplitude, duration, seed) of every note of the track
+        self.telemetry = RenderTelemetry(framerate, instrument.name, effect.name if effect is not None else "None")
+        self.incremental = False        # True if the track started from the previous render
+        self.rendered_notes = 0         # notes mixed by this render (added + removed ones if incremental)
+        self.tasks = []             # (task_ids, notes, amplitudes, durations) of each batch to render
+        self.note_keys = []         # cache key of each task_id (None if not cacheable)
+        self.note_slots = []        # list of (n0, gain) where the result of each task_id is mixed
+        self.task_notes = []        # (note, duration) of each task_id
+        self.pending_starts = []    # heap of (first n0, task_id) of the notes not mixed yet
+        self.done_tasks = set()
+        self.track_array = None
+        self.track_end = 0          # last sample written in track_array
+        self.amplitude_linear = False   # notes are rendered at unit amplitude and scaled by their gain while mixing
+        self.mix_buffer = None      # scratch buffer of mix_note() and render_into_track()
+        self.plan(note_array, volume, batch_size, time_ordered, previous)
+
+
+    @property
+    def shared_args(self):
+        ''' Arguments appended to every task '''
+        return (self.instrument, self.effect)
+
+
+    @staticmethod
+    def get_tools_key(framerate, instrument, effect):
+        ''' Hashable key of everything besides the notes that defines the rendered track '''
+        effect_key = None
+        if effect is not None:
+            effect_key = (effect.name, NoteRenderCache.params_key(effect.params))
+        return (framerate, instrument.name, NoteRenderCache.params_key(instrument.params), effect_key, RenderConfig.get_render_dtype().name)
+
+
+    def plan(self, note_array, volume, batch_size, time_ordered, previous):
+        instrument = self.instrument
+        effect = self.effect
+
+        # If the amplitude is a pure output gain, notes are rendered at unit amplitude and scaled while mixing
+        amplitude_linear = instrument.amplitude_linear and (effect is None or effect.amplitude_linear)
+        self.amplitude_linear = amplitude_linear
+
+        # Exact number of samples of each distinct (note, duration): synth length + effect tail
+        note_lengths = {}
+        total_song_frames = 0
+
+        timeLimiter = 9999.0
+        for index, note in enumerate(note_array):
+            if note.time_off is not None and note.time_off > timeLimiter:
+                print("Reached time limit!")
+                break
+
+            amp = note.amplitude * volume
+            gain = 1.0
+            if amplitude_linear:
+                amp, gain = 1.0, amp
+
+            # From the time of the note, not the sum of the truncated delays between notes: removing a note
+            # must not shift the notes after it by a sample (they could not be reused by the next render)
+            n0 = int(note.time_on * self.framerate)
+
+            event = (note.note, note.duration)
+            if event not in note_lengths:
+                n_samples = instrument.note_length(note.note, note.duration)
+                if effect is not None:
+                    n_samples += effect.tail_length(n_samples)
+                note_lengths[event] = n_samples
+            total_song_frames = max(total_song_frames, n0 + note_lengths[event])
+
+            note_seed = (self.seed, index) if self.seeded else None
+            self.placements[(n0, gain, note.note, amp, note.duration, note_seed)] += 1
+
+        placements = self.placements
+        base_array = None
+        if self.can_reuse(previous):
+            # Only the notes that are not in the previous render are added, and the ones that are not anymore are subtracted
+            added = self.placements - previous.placements
+            removed = previous.placements - self.placements
+            if sum(added.values()) + sum(removed.values()) < sum(self.placements.values()):
+                placements = added + Counter({(n0, -gain, *note): count for (n0, gain, *note), count in removed.items()})
+                base_array = previous.result()
+                self.incremental = True
+                self.telemetry.reused_notes = sum(self.placements.values()) - sum(added.values())
+
+        self.schedule(placements, total_song_frames, base_array, batch_size, time_ordered)
+
+
+    def can_reuse(self, previous):
+        ''' True if the previous render of the track can be the starting point of this one '''
+        # The notes of unseeded stochastic instruments change on every render, so they can not be subtracted
+        return previous is not None and previous.tools_key == self.tools_key and previous.seeded == self.seeded and (self.seeded or not self.instrument.stochastic)
+
+
+    def schedule(self, placements, total_song_frames, base_array, batch_size, time_ordered):
+        ''' Creates the tasks that render the (n0, gain, note, amplitude, duration, seed) placements and mixes the cached ones '''
+        instrument = self.instrument
+        effect = self.effect
+
+        # Identical notes are rendered once (or taken from the cache) and mixed at every n0
+        cached_notes = []
+        slot_by_key = {}
+        use_cache = self.cache is not None and (self.seeded or not instrument.stochastic)
+
+        # Distinct notes to render, grouped by duration so synths can render each batch in a single pass
+        pending = {}
+        time_window = batch_size * 4
+
+        for (n0, gain, note, amp, duration, note_seed), count in sorted(placements.items()):
+            self.rendered_notes += count
+            gain *= count
+
+            key = None
+            if use_cache:
+                key = self.cache.note_key(instrument, note, amp, duration, effect, note_seed)
+                if key in slot_by_key:
+                    self.cache.hits += 1
+                    self.telemetry.repeated_notes += count
+                    self.note_slots[slot_by_key[key]].append((n0, gain))
+                    continue
+                wave_array = self.cache.get(key)
+                if wave_array is not None:
+                    self.telemetry.cached_notes += count
+                    cached_notes.append((n0, gain, wave_array))
+                    continue
+                slot_by_key[key] = len(self.note_slots)
+
+            self.telemetry.repeated_notes += count - 1
+            task_id = len(self.note_slots)
+            self.note_keys.append(key)
+            self.task_notes.append((note, duration))
+            self.note_slots.append([(n0, gain)])
+            self.pending_starts.append((n0, task_id))
+            window = task_id // time_window if time_ordered else 0
+            pending.setdefault((window, duration), []).append((task_id, note, amp, note_seed))
+
+        for (_, duration), batch in pending.items():
+            for i in range(0, len(batch), batch_size):
+                task_ids, notes, amps, seeds = zip(*batch[i : i + batch_size])
+                self.tasks.append((task_ids, notes, amps, [duration] * len(task_ids), seeds))
+
+        heapq.heapify(self.pending_starts)
+
+        # print(f"Song Length (Samples): {total_song_frames}")
+
+        self.track_array = RenderConfig.zeros(total_song_frames)
+        self.track_end = total_song_frames
+        if base_array is not None:
+            # Removed notes of the previous track can end after the new one, they are subtracted and cut
+            self.track_array = RenderConfig.zeros(max(total_song_frames, base_array.size))
+            self.track_array[:base_array.size] = base_array
+
+        for n0, gain, wave_array in cached_notes:
+            self.mix_note(n0, wave_array, gain)
+
+
+    def reserve(self, n1):
+        ''' Makes sure the track buffer holds n1 samples '''
+        if n1 > self.track_array.size:
+            # The synth returned more samples than its note_length(). Grow with headroom so this happens rarely
+            grown = RenderConfig.zeros(max(n1, int(self.track_array.size * 1.25)))
+            grown[:self.track_array.size] = self.track_array
+            self.track_array = grown
+
+
+    def mix_note(self, n0, wave_array, gain=1.0):
+        n1 = n0 + wave_array.size
+        self.reserve(n1)
+        if gain > 0:
+            self.track_end = max(self.track_end, n1)   # removed notes do not extend the track
+
+        if gain == 1.0:
+            self.track_array[n0 : n1] += wave_array
+        else:
+            # The scaled note is written into a reused buffer instead of a new array per note
+            scaled = self.scratch(wave_array.size)
+            np.multiply(wave_array, gain, out=scaled)
+            self.track_array[n0 : n1] += scaled
+
+
+    def scratch(self, n_samples):
+        ''' View of n_samples of the reused scratch buffer (its content is undefined) '''
+        if self.mix_buffer is None or self.mix_buffer.size < n_samples:
+            self.mix_buffer = RenderConfig.zeros(max(n_samples, 2 * self.mix_buffer.size if self.mix_buffer is not None else 0))
+        return self.mix_buffer[:n_samples]
+
+
+    def mix_results(self, note_synth_packs):
+        ''' Mixes the (task_id, wave_array, timings) results of a task at every place the notes are played '''
+        for task_id, wave_array, (instrument_seconds, effect_seconds) in note_synth_packs:
+            key = self.note_keys[task_id]
+            if key is not None:
+                self.cache.put(key, wave_array)
+
+            note, duration = self.task_notes[task_id]
+            self.telemetry.add_note(note, duration, wave_array.size, instrument_seconds, effect_seconds)
+
+            for n0, gain in self.note_slots[task_id]:
+                self.mix_note(n0, wave_array, gain)
+            self.done_tasks.add(task_id)
+
+
+    def render_into_track(self, task):
+        '''
+        Renders the notes of a task straight into the track buffer with render_into(), without the wave arrays
+        of render_note_batch() and mix_results(). Returns False (and renders nothing) if the task does not qualify:
+        only notes that are not cached and are mixed at a single place, of synths that render note by note or
+        override render_into() (other synths with generate_group() are faster in batches)
+        '''
+        instrument, effect = self.shared_args
+        renders_into = type(instrument).render_into is not SynthBaseClass.render_into
+        if hasattr(instrument, "generate_group") and not instrument.stochastic and not renders_into:
+            return False
+        task_ids = task[0]
+        for task_id in task_ids:
+            if self.note_keys[task_id] is not None or len(self.note_slots[task_id]) != 1:
+                return False
+            if self.note_slots[task_id][0][1] != 1.0 and not self.amplitude_linear:
+                return False
+
+        for task_id, note, amp, duration, seed in zip(*task):
+            n0, gain = self.note_slots[task_id][0]
+            amp = amp * gain      # gain is 1 unless the amplitude is a pure output gain
+            n_samples = instrument.note_length(note, duration)
+            effect_seconds = 0.0
+            t0 = time.perf_counter()
+            if effect is None:
+                self.reserve(n0 + n_samples)
+                written = instrument.render_into(self.track_array[n0 : n0 + n_samples], note, amp, duration, seed)
+                instrument_seconds = time.perf_counter() - t0
+            else:
+                # The note is rendered into the scratch buffer and the effect adds it to the track
+                note_buffer = self.scratch(n_samples)
+                note_buffer.fill(0)
+                note_samples = instrument.render_into(note_buffer, note, amp, duration, seed)
+                instrument_seconds = time.perf_counter() - t0
+                t0 = time.perf_counter()
+                n_samples = note_samples + effect.tail_length(note_samples)
+                self.reserve(n0 + n_samples)
+                written = effect.render_into(self.track_array[n0 : n0 + n_samples], note_buffer[:note_samples])
+                effect_seconds = time.perf_counter() - t0
+
+            if gain > 0:
+                self.track_end = max(self.track_end, n0 + written)
+            self.telemetry.add_note(note, duration, written, instrument_seconds, effect_seconds)
+            self.done_tasks.add(task_id)
+        return True
+
+
+    def frontier(self):
+        ''' First sample that a note not mixed yet can modify (samples before it are final) '''
+        while self.pending_starts and self.pending_starts[0][1] in self.done_tasks:
+            heapq.heappop(self.pending_starts)
+        return self.pending_starts[0][0] if self.pending_starts else self.track_end
+
+
+    def result(self):
+        ''' Returns the rendered track '''
+        return self.track_array[:self.track_end]
+
+
+    def finish(self):
+        ''' Returns the rendered track and stops the telemetry clock '''
+        self.telemetry.finish(self.track_end)
+        return self.result()
+
+
+    def render(self, max_workers=1):
+        '''
+        Runs every task synchronously and returns the rendered track.
+        - max_workers: 1 renders in this process, otherwise a process pool is used (None: one process per core)
+        '''
+        if max_workers == 1:
+            for task in self.tasks:
+                if not self.render_into_track(task):
+                    self.mix_results(render_note_batch(*task, *self.shared_args))
+            return self.finish()
+
+        with create_process_pool(render_note_batch, self.shared_args, max_workers) as executor:
+            futures = [submit_task(executor, task) for task in self.tasks]
+            for future in futures:
+                self.mix_results(future.result())
+        return self.finish()
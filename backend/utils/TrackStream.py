@@ -0,0 +1,124 @@
+"""
+Block stream of a track that is still being synthesized.
+
+The track is split in fixed-size blocks. The renderer pushes each block once no pending
+note can touch it, and the player reads them while the rest of the track is rendered.
+
+TrackStream exposes the subset of the wave.Wave_read interface used by AudioPlaybackThread
+(16 bit mono frames), so it can be played like any other wave object. readframes() blocks
+until the requested frames are rendered.
+
+This module does not depend on Qt, so it can be used from headless tools.
+"""
+
+import threading
+from bisect import bisect_right
+import numpy as np
+
+
+class TrackStream():
+    def __init__(self, total_frames, framerate=44100, block_size=8192):
+        self.total_frames = int(total_frames)
+        self.framerate = framerate
+        self.block_size = int(block_size)
+        self.blocks = []            # int16 bytes of each finalized chunk
+        self.offsets = []           # first frame of each chunk
+        self.ready_frames = 0       # frames already finalized
+        self.closed = False         # no more blocks will be pushed
+        self.interrupted = False    # a blocked readframes() must return
+        self.pos = 0
+        self.condition = threading.Condition()
+
+    # # # # # # # # # # # #     WRITER SIDE     # # # # # # # # # # # #
+
+    def advance(self, track_array, frontier):
+        ''' Pushes every full block of track_array that ends before frontier (first sample a pending note can write) '''
+        frontier = min(frontier, self.total_frames)
+        n0 = self.ready_frames
+        n1 = n0 + ((frontier - n0) // self.block_size) * self.block_size
+        if n1 > n0:
+            self.push(track_array[n0:n1])
+
+    def finish(self, track_array):
+        ''' Pushes the remaining frames of the finished track and closes the stream '''
+        self.push(track_array[self.ready_frames:])
+        self.close()
+
+    def push(self, array):
+        ''' Appends frames after the last finalized one '''
+        if array.size == 0:
+            return
+        data = np.int16(np.clip(array, -1.0, 1.0) * 32767).tobytes()
+        with self.condition:
+            self.blocks.append(data)
+            self.offsets.append(self.ready_frames)
+            self.ready_frames += array.size
+            self.condition.notify_all()
+
+    def close(self):
+        ''' Marks the stream as complete (or aborted), waking up any blocked reader '''
+        with self.condition:
+            self.closed = True
+            self.total_frames = self.ready_frames
+            self.condition.notify_all()
+
+    def interrupt(self):
+        ''' Makes a blocked readframes() return what is available (used when playback is paused or stopped) '''
+        with self.condition:
+            self.interrupted = True
+            self.condition.notify_all()
+
+    def progress(self):
+        ''' Returns the rendered fraction of the track in percentage 0-100 '''
+        return (self.ready_frames * 100) // max(self.total_frames, 1)
+
+    # # # # # # # # # # # #     READER SIDE (wave.Wave_read)     # # # # # # # # # # # #
+
+    def getnchannels(self):
+        return 1
+
+    def getsampwidth(self):
+        return 2
+
+    def getframerate(self):
+        return self.framerate
+
+    def getnframes(self):
+        return self.total_frames
+
+    def tell(self):
+        return self.pos
+
+    def rewind(self):
+        self.pos = 0
+
+    def setpos(self, pos):
+        if pos < 0 or pos > self.total_frames:
+            raise Exception("position not in range")
+        with self.condition:
+            self.pos = pos
+            self.interrupted = False
+
+    def readframes(self, n):
+        ''' Returns up to n frames from the current position, waiting for them to be rendered '''
+        with self.condition:
+            end = min(self.pos + n, self.total_frames)
+            while self.ready_frames < end and not self.closed and not self.interrupted:
+                self.condition.wait()
+                end = min(self.pos + n, self.total_frames)
+            end = min(end, self.ready_frames)
+            data = self._read(self.pos, end)
+            self.pos = end
+            return data
+
+    def _read(self, n0, n1):
+        if n1 <= n0:
+            return b''
+        out = []
+        i = bisect_right(self.offsets, n0) - 1
+        while i < len(self.blocks) and self.offsets[i] < n1:
+            start = self.offsets[i]
+            stop = start + len(self.blocks[i]) // 2
+            out.append(self.blocks[i][2 * (max(n0, start) - start) : 2 * (min(n1, stop) - start)])
+            i += 1
+        return b''.join(out)
@@ -1,19 +1,96 @@
 from PyQt5.QtCore import QThread, pyqtSignal, QMutex, QMutexLocker, QObject
+from concurrent.futures import wait, FIRST_COMPLETED
+from collections import deque
+import itertools
+import threading
+import time
+import os
+import numpy as np
+
+from backend.utils.ProcessPool import create_process_pool, submit_context_task, render_context, needs_context, default_worker_count
+
+# Unique keys of the shared args sent to a shared process pool
+_context_keys = itertools.count()
         
 
-class Worker(QThread):
+def result_nbytes(out):
+    ''' Bytes of the numpy arrays of a result (an array, or lists and tuples holding them) '''
+    if isinstance(out, np.ndarray):
+        return out.nbytes
+    if isinstance(out, (list, tuple)):
+        return sum(result_nbytes(item) for item in out)
+    return 0
+
+
+class BatchedResults():
+    '''
+    Mixin of the workers to reduce the signal traffic towards the GUI thread.
+    - By default every result is emitted with taskComplete
+    - After set_batch_interval(seconds), results are collected and emitted as a list with resultsReady,
+      at most once per interval. Results held back are emitted by a timer at the end of the interval, when their
+      arrays add up to max_bytes, when the queue of tasks drains and before finished
+    '''
+    batch_interval = None
+
+    def set_batch_interval(self, interval, max_bytes=32 * 1024 * 1024):
+        ''' Sets the min time between resultsReady emits (None: emit each result with taskComplete) and the max bytes held back '''
+        self.batch_interval = interval
+        self.batch_max_bytes = max_bytes
+        self.batch_lock = threading.Lock()
+        self.batch = []
+        self.batch_bytes = 0
+        self.last_batch_time = 0.0
+        self.flush_timer = None
+
+    def deliver(self, out):
+        if self.batch_interval is None:
+            self.taskComplete.emit(out)
+            return
+        with self.batch_lock:
+            self.batch.append(out)
+            self.batch_bytes += result_nbytes(out)
+            remaining = self.last_batch_time + self.batch_interval - time.monotonic()
+            if remaining > 0 and self.batch_bytes < self.batch_max_bytes:
+                if self.flush_timer is None:
+                    self.flush_timer = threading.Timer(remaining, self.flush_results)
+                    self.flush_timer.daemon = True
+                    self.flush_timer.start()
+                return
+            self.emit_batch()
+
+    def flush_results(self):
+        ''' Emits the results held back '''
+        if self.batch_interval is None:
+            return
+        with self.batch_lock:
+            self.emit_batch()
+
+    def emit_batch(self):
+        # Emitted with batch_lock held, so a batch of the timer can not be emitted after finished
+        if self.flush_timer is not None:
+            self.flush_timer.cancel()
+            self.flush_timer = None
+        if len(self.batch) > 0:
+            batch, self.batch = self.batch, []
+            self.batch_bytes = 0
+            self.last_batch_time = time.monotonic()
+            self.resultsReady.emit(batch)
+
+
+class Worker(BatchedResults, QThread):
     ''' 
     - Takes a single function to be runned multiple times with different parameters.
     - Emits a signal with the result of each finished run
     - Emits a signal when all runs are done
     '''
     taskComplete = pyqtSignal(object)     # Signal when a task is done, returns: result
+    resultsReady = pyqtSignal(list)             # Signal with the results of several tasks (see set_batch_interval)
     finished = pyqtSignal(str)                  # Signal when all tasks are done, returns the task_key
     onError = pyqtSignal(str)                   # Signal when an error occurs
 
     def __init__(self, function, task_key=""):
         super().__init__()
-        self.tasks = []
+        self.tasks = deque()
         # self.task_memory = None
         self.total = 1
         self.current = 0
@@ -45,7 +122,7 @@ class Worker(QThread):
     def cancel(self):
         ''' Cancels all tasks '''
         with QMutexLocker(self.mutex):
-            self.tasks = []
+            self.tasks.clear()
         with QMutexLocker(self.infoMutex):
             self.total = 1
             self.current = 0
@@ -74,26 +151,211 @@ class Worker(QThread):
     def run(self):
         with QMutexLocker(self.infoMutex):
             self.current = 0
+
+        self.run_tasks()
+
+        with QMutexLocker(self.infoMutex):
+            self.current = self.total
+
+        self.flush_results()
+        self.finished.emit(self.task_key)
+
+    def run_tasks(self):
+        ''' Runs the tasks one by one in this thread '''
         while True:
             task_args = None
             with QMutexLocker(self.mutex):
                 if len(self.tasks) > 0:
-                    task_args = self.tasks.pop(0)
+                    task_args = self.tasks.popleft()
+                    drained = len(self.tasks) == 0
                 else:
                     break
+            if drained:
+                # The held results do not wait for the last task
+                self.flush_results()
             out = None
             try:
                 out = self.function(*task_args)
             except Exception as e:
                 self.onError.emit(str(e))
 
-            with QMutexLocker(self.infoMutex):
-                self.current += 1
+            self.task_done(out)
 
-            self.taskComplete.emit(out)
+    def task_done(self, out):
+        with QMutexLocker(self.infoMutex):
+            self.current += 1
 
+        self.deliver(out)
 
-        with QMutexLocker(self.infoMutex):
-            self.current = self.total
 
+
+class ProcessPoolWorker(Worker):
+    ''' 
+    Same interface as Worker, but the tasks are spread across a pool of processes.
+    - Takes a single picklable function to be runned multiple times with different parameters.
+    - shared_args are appended to every task and shipped once per process (not once per task),
+      together with the RenderConfig settings at the time the worker is created
+    - executor: optional pool created with create_process_pool(function) shared with other workers.
+                If None, a pool is created for this run and shut down at the end
+    - Emits a signal with the result of each finished run (in completion order)
+    - Emits a signal when all runs are done
+    '''
+
+    def __init__(self, function, task_key="", shared_args=(), max_workers=None, executor=None):
+        super().__init__(function, task_key)
+        self.context = render_context(shared_args)
+        self.max_workers = max_workers
+        self.executor = executor
+        self.context_key = next(_context_keys)
+        self.cancelled = False
+
+    def cancel(self):
+        ''' Cancels all pending tasks '''
+        super().cancel()
+        with QMutexLocker(self.mutex):
+            self.cancelled = True
+
+    def run_tasks(self):
+        with QMutexLocker(self.mutex):
+            tasks = list(self.tasks)
+            self.tasks.clear()
+            self.cancelled = False
+
+        executor = self.executor
+        try:
+            if executor is None:
+                executor = create_process_pool(self.function, max_workers=self.max_workers)
+            self.run_pool_tasks(executor, tasks)
+        except Exception as e:
+            self.onError.emit(str(e))
+        finally:
+            if executor is not None and self.executor is None:
+                executor.shutdown(wait=False, cancel_futures=True)
+
+    def run_pool_tasks(self, executor, tasks):
+        # The context is attached to the first tasks (about one per process),
+        # the other processes ask for it with NeedContext the first time they run a task of this worker
+        max_workers = self.max_workers or default_worker_count()
+        pending = {}
+        try:
+            for i, task_args in enumerate(tasks):
+                context = self.context if i < max_workers else None
+                pending[submit_context_task(executor, self.context_key, task_args, context)] = task_args
+
+            while len(pending) > 0:
+                done, _ = wait(pending.keys(), return_when=FIRST_COMPLETED)
+                with QMutexLocker(self.mutex):
+                    if self.cancelled:
+                        break
+                for future in done:
+                    task_args = pending.pop(future)
+                    if not future.cancelled() and future.exception() is None and needs_context(future.result()):
+                        pending[submit_context_task(executor, self.context_key, task_args, self.context)] = task_args
+                        continue
+                    out = None
+                    try:
+                        out = future.result()
+                    except Exception as e:
+                        self.onError.emit(str(e))
+                    self.task_done(out)
+        finally:
+            # The pool may be shared: only the tasks of this worker that did not start are cancelled
+            for future in pending:
+                future.cancel()
+
+
+
+
+class WorkerPool(BatchedResults, QThread):
+    ''' 
+    Same interface as Worker, but the tasks are consumed by several threads.
+    - Takes a single function to be runned multiple times with different parameters.
+    - Useful when the function spends its time in numpy calls that release the GIL (no pickling, unlike ProcessPoolWorker)
+    - slots: optional threading.Semaphore shared with other pools to limit the tasks running at the same time
+    - Emits a signal with the result of each finished run (in completion order, from the consumer threads)
+    - Emits a signal when all runs are done
+    '''
+    taskComplete = pyqtSignal(object)     # Signal when a task is done, returns: result
+    resultsReady = pyqtSignal(list)             # Signal with the results of several tasks (see set_batch_interval)
+    finished = pyqtSignal(str)                  # Signal when all tasks are done, returns the task_key
+    onError = pyqtSignal(str)                   # Signal when an error occurs
+
+    def __init__(self, function, task_key="", num_threads=None, slots=None):
+        super().__init__()
+        self.tasks = deque()        # popleft() and append() are atomic, consumers do not need a lock
+        self.total = 1
+        self.task_key = task_key
+        self.num_threads = num_threads or os.cpu_count() or 1
+        self.slots = slots
+        self.done_counts = [0]      # tasks done by each consumer thread (each one only writes its own slot)
+        if not callable(function):
+            raise Exception("Function must be callable")
+        self.function = function
+
+    @property
+    def current(self):
+        return sum(self.done_counts)
+
+    def progressBarString(self):
+        ''' Returns a string with a progress bar '''
+        progress = self.progress()
+        return f"[{'='*progress}{' '*(100-progress)}] {progress}% ({self.current}/{self.total})"
+
+    def progress(self):
+        ''' Returns the progress of the current task in percentage 0-100'''
+        return min((self.current * 100) // self.total, 100)
+
+    def cancel(self):
+        ''' Cancels all pending tasks (the ones already running will finish) '''
+        self.tasks.clear()
+
+    def disconnectAll(self):
+        try:
+            self.taskComplete.disconnect()
+            self.finished.disconnect()
+            self.onError.disconnect()
+        except:
+            pass
+
+    def add_task(self, task_args):
+        ''' Adds a task to the worker '''
+        if isinstance(task_args, list):
+            self.tasks.extend(task_args)
+        else:
+            self.tasks.append(task_args)
+        self.total = max(len(self.tasks), 1)
+
+    def consume(self, index):
+        while True:
+            try:
+                task_args = self.tasks.popleft()
+            except IndexError:
+                break
+            if len(self.tasks) == 0:
+                # The queue drained, the held results do not wait for the last tasks
+                self.flush_results()
+            out = None
+            try:
+                if self.slots is not None:
+                    with self.slots:
+                        out = self.function(*task_args)
+                else:
+                    out = self.function(*task_args)
+            except Exception as e:
+                self.onError.emit(str(e))
+
+            self.done_counts[index] += 1
+            self.deliver(out)
+
+    def run(self):
+        num_threads = max(1, min(self.num_threads, len(self.tasks)))
+        self.done_counts = [0] * num_threads
+        threads = [threading.Thread(target=self.consume, args=(i,), daemon=True) for i in range(num_threads)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.done_counts = [self.total]
+        self.flush_results()
         self.finished.emit(self.task_key)
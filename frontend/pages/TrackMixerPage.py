@@ -10,6 +10,7 @@ from frontend.widgets.CardWidgets import CardWidget, CardListWidget
 from frontend.widgets.WaveformViewerWidget import WaveformViewerWidget
 from frontend.widgets.AudioPlayerWidget import AudioPlayerWidget
 from frontend.widgets.DynamicSettingsWidget import DynamicSettingsWidget
+from backend.utils import RenderConfig
        
 import numpy as np
 
@@ -238,7 +239,7 @@ class TrackMixerPage(BaseClassPage):
     # Callback for when a MIDI file is selected from the dropdown
     def display_mix(self, _=None):
 
-        self.mix_array = np.zeros(1000)
+        self.mix_array = RenderConfig.zeros(1000)
 
         for trackCard in self.trackCardList:
             track = trackCard.track
@@ -246,7 +247,7 @@ class TrackMixerPage(BaseClassPage):
 
             if len(self.mix_array) < len(array):
                 size_needed = len(array) - len(self.mix_array)
-                self.mix_array = np.append(self.mix_array, np.zeros(size_needed + 1))
+                self.mix_array = np.append(self.mix_array, RenderConfig.zeros(size_needed + 1))
 
             if not track.muted:
                 self.mix_array[:len(array)] += array * track.volume
@@ -20,9 +20,24 @@ class TracksPage(BaseClassPage):
         self.availableMIDIs = QLabel("Available MIDI files: 0")
         self.dropDown = DropDownMenu("Select MIDI File", onChoose=self.on_midi_selected)
         self.trackList = CardListWidget()
+        self.channels = []      # (title, notes, view) of each channel of the selected MIDI file
+
+        # Render every channel at once with the same instrument and effect
+        self.instrumentSelector = DropDownMenu("Select Instrument", onChoose=lambda name, obj: None)
+        self.effectSelector = DropDownMenu("Select Effect", onChoose=lambda name, obj: None)
+        self.load_options(self.instrumentSelector, self.model.synthesizers)
+        self.load_options(self.effectSelector, self.model.effects)
+        self.backendSelector = DropDownMenu("Select Backend", onChoose=self.on_backend_selected)
+        self.load_backend_options()
+        renderAllBtn = Button("Sintetizar todos los canales", background_color="lightgreen", on_click=self.render_all_channels)
+        cancelAllBtn = Button("Detener", background_color="lightcoral", on_click=self.cancel_all_channels)
+        self.renderAllProgress = QProgressBar()
+        self.renderAllProgress.setRange(0, 100)
+        self.renderAllProgress.hide()
 
         # Local widgets (used only in the initUI method)
         topHLayout = QHBoxLayout()
+        renderAllHLayout = QHBoxLayout()
 
         # Setup top layout
         topHLayout.addWidget(self.dropDown)
@@ -30,10 +45,62 @@ class TracksPage(BaseClassPage):
         topHLayout.addWidget(self.availableMIDIs)
         topHLayout.addStretch(1)
 
+        renderAllHLayout.addWidget(self.instrumentSelector)
+        renderAllHLayout.addWidget(self.effectSelector)
+        renderAllHLayout.addWidget(self.backendSelector)
+        renderAllHLayout.addWidget(renderAllBtn)
+        renderAllHLayout.addWidget(cancelAllBtn)
+        renderAllHLayout.addWidget(self.renderAllProgress)
+        renderAllHLayout.addStretch(1)
+
         # Add widgets to page layout
         layout.addLayout(topHLayout)
+        layout.addLayout(renderAllHLayout)
         layout.addWidget(self.trackList)
 
+        self.model.synthTrackManager.progressUpdate.connect(self.renderAllProgress.setValue)
+        self.model.synthTrackManager.allTracksComplete.connect(self.renderAllProgress.hide)
+
+
+    def load_options(self, selector, elements):
+        options = {}
+        for e in elements:
+            options[e.name] = e
+        selector.set_options(options, firstSelected=True)
+
+
+    # Execution backend of every render (see SynthTrackManager.backends), the selected one is listed first
+    def load_backend_options(self):
+        manager = self.model.synthTrackManager
+        options = {manager.backend: manager.backend}
+        for backend in manager.backends:
+            options[backend] = backend
+        self.backendSelector.set_options(options, firstSelected=True)
+
+    def on_backend_selected(self, name, backend):
+        try:
+            self.model.synthTrackManager.set_backend(backend)
+        except Exception as e:
+            QMessageBox.critical(self, 'Error', str(e))
+            self.load_backend_options()
+
+
+    # Synthesize every channel of the selected MIDI file, all of them share the worker pool
+    def render_all_channels(self):
+        instrument = self.instrumentSelector.selected
+        effect = self.effectSelector.selected
+        if instrument is None or len(self.channels) == 0:
+            return
+        self.renderAllProgress.setValue(0)
+        self.renderAllProgress.show()
+        for title, notes, view in self.channels:
+            volume = view.popup.volume.value()      # the volume set in the channel's own popup
+            self.model.synthTrackManager.synthesize_track(title, instrument, notes, volume, effect)
+
+
+    def cancel_all_channels(self):
+        self.model.synthTrackManager.cancel()
+
 
     # Refresh dropdown options looking for newly imported MIDI files
     def refresh_midi_options(self):
@@ -49,6 +116,7 @@ class TracksPage(BaseClassPage):
         midi_data = self.model.midi_handler.parseMidiNotes(path)
 
         self.trackList.clear()
+        self.channels = []
         
         for channel in midi_data.channels():
             channelData = midi_data.getChannelData(channel)
@@ -60,8 +128,8 @@ class TracksPage(BaseClassPage):
 
             notes = channelData["notes"]
 
-
             midiNotesView = MidiNotesViewerWidget(title, self.model, notes)
+            self.channels.append((title, notes, midiNotesView))
             # midiNotesView.clicked.connect(synthPopup.exec)
 
             midiNotesView.plotNotes(notes)
@@ -1,4 +1,4 @@
-from PyQt5.QtWidgets import QVBoxLayout, QHBoxLayout, QWidget, QDialog, QLabel, QProgressBar, QMessageBox
+from PyQt5.QtWidgets import QVBoxLayout, QHBoxLayout, QWidget, QDialog, QLabel, QProgressBar, QMessageBox, QCheckBox
 from PyQt5.QtGui import QFont
 from PyQt5.QtCore import pyqtSignal, Qt
 
@@ -8,6 +8,7 @@ import numpy as np
 from scipy import signal
 
 from .BasicWidgets import DropDownMenu, Button, TextInput, Slider
+from backend.utils.RenderTelemetry import format_summary
 # from .DynamicSettingsWidget import DynamicSettingsWidget
 # from backend.utils.ParamObject import ParameterList, NumParam, TextParam, BoolParam, ChoiceParam
 
@@ -79,28 +80,56 @@ class SynthTrackPopup(QDialog):
     def begin_synth(self):
         instrument = self.instrumentSelector.selected
         effect = self.effectSelector.selected
-        self.model.synthTrackManager.synthesize_track(self.track_name, instrument, self.notes, self.volume.value(), effect)
-        self.model.synthTrackManager.progressUpdate.connect(self.update_progress)
+        stream = self.streamCheckBox.isChecked()
+        self.model.synthTrackManager.trackProgressUpdate.connect(self.update_progress)
         self.model.synthTrackManager.synthTrackComplete.connect(self.synth_complete)
+        if stream:
+            self.model.synthTrackManager.synthTrackStreamStarted.connect(self.stream_started)
+        self.model.synthTrackManager.synthesize_track(self.track_name, instrument, self.notes, self.volume.value(), effect, stream=stream)
+        self.telemetryLabel.hide()
         self.progressBar.show()
 
+    def stream_started(self, trackName, track_stream):
+        if trackName != self.track_name:
+            return
+        try:
+            self.model.synthTrackManager.synthTrackStreamStarted.disconnect(self.stream_started)
+        except:
+            pass
+        self.model.audioPlayer.set_stream(track_stream)
+        self.model.audioPlayer.play()
+
     def synth_complete(self, trackName, track_data):
+        if trackName != self.track_name:
+            return
         try:
-            self.model.synthTrackManager.progressUpdate.disconnect(self.update_progress)
+            self.model.synthTrackManager.trackProgressUpdate.disconnect(self.update_progress)
             self.model.synthTrackManager.synthTrackComplete.disconnect(self.synth_complete)
         except:
             pass
-        self.model.audioPlayer.set_array(track_data["track_array"])
+        # Only this track's own stream is already loaded in the player
+        stream = self.model.synthTrackManager.get_stream(trackName)
+        if stream is None or not self.model.audioPlayer.isStreaming(stream):
+            self.model.audioPlayer.set_array(track_data["track_array"])
         self.progressBar.hide()
-        self.accept()
 
-    def update_progress(self, value):
+        # The popup stays open with the telemetry of the render
+        if track_data.get("telemetry") is not None:
+            self.telemetryLabel.setText(format_summary(track_data["telemetry"]))
+            self.telemetryLabel.show()
+            self.adjustSize()
+        else:
+            self.accept()
+
+    def update_progress(self, trackName, value):
+        if trackName != self.track_name:
+            return
         self.progressBar.setValue(value)
         self.progress = value
 
     def cancel_synth(self):
         print("Cancelling synth")
-        self.model.synthTrackManager.cancel()
+        self.model.synthTrackManager.cancel(self.track_name)
         self.progressBar.hide()
         self.close()
 
@@ -123,6 +152,9 @@ class SynthTrackPopup(QDialog):
         layout.addLayout(synth_tools)
         layout.addWidget(self.volume)
 
+        self.streamCheckBox = QCheckBox("Reproducir mientras se sintetiza")
+        layout.addWidget(self.streamCheckBox)
+
         layout.addSpacing(20)
 
         beginBtn = Button("Comenzar", background_color="lightgreen")
@@ -138,10 +170,16 @@ class SynthTrackPopup(QDialog):
         self.progressBar.setValue(0)
         self.progressBar.hide()
 
+        self.telemetryLabel = QLabel("")
+        self.telemetryLabel.setFont(QFont("Courier New", 9))
+        self.telemetryLabel.setTextInteractionFlags(Qt.TextSelectableByMouse)
+        self.telemetryLabel.hide()
+
         layout.addWidget(beginBtn)
         layout.addWidget(cancelBtn)
         layout.addSpacing(20)
         layout.addWidget(self.progressBar)
+        layout.addWidget(self.telemetryLabel)
 
 
 
@@ -180,7 +218,7 @@ class MidiNotesViewerWidget(QWidget):
         pass
 
     def on_click(self):
-        if not self.model.synthTrackManager.is_busy():
+        if not self.model.synthTrackManager.is_busy(self.popup.track_name):
             self.popup.show()
             self.popup.move(self.mapToGlobal(self.rect().center()))
         self.clicked.emit()
@@ -1,25 +1,28 @@
 # main.py
 import sys
-from PyQt5.QtWidgets import QApplication
-
-print("Running main.py")
-
-from frontend.MainWindow import *
-# from frontend.pages.TestPage import *
-from frontend.pages.FilesPage import *
-from frontend.pages.TracksPage import *
-from frontend.pages.SynthesizedTracks import *
-from frontend.pages.TrackMixerPage import *
-# from frontend.pages.ChordPage import *
-from frontend.pages.MidiViewerPage import *
-# from frontend.pages.MidiPlayerPage import *
-from frontend.pages.InstrumentPage import *
-from frontend.pages.SoundPlayerPage import *
-# from frontend.pages.TracksMetadataPage import *
-    
-from backend.MainModel import *
 
+# Worker processes of the "process" backend are spawned and import this module as __mp_main__,
+# so Qt and the GUI are only imported by the app itself
 if __name__ == '__main__':
+    from PyQt5.QtWidgets import QApplication
+
+    print("Running main.py")
+
+    from frontend.MainWindow import *
+    # from frontend.pages.TestPage import *
+    from frontend.pages.FilesPage import *
+    from frontend.pages.TracksPage import *
+    from frontend.pages.SynthesizedTracks import *
+    from frontend.pages.TrackMixerPage import *
+    # from frontend.pages.ChordPage import *
+    from frontend.pages.MidiViewerPage import *
+    # from frontend.pages.MidiPlayerPage import *
+    from frontend.pages.InstrumentPage import *
+    from frontend.pages.SoundPlayerPage import *
+    # from frontend.pages.TracksMetadataPage import *
+
+    from backend.MainModel import *
+
     app = QApplication(sys.argv)
     app.setWindowIcon(QIcon('frontend/assets/icon.png'))
 
@@ -0,0 +1,63 @@
+import numpy as np
+import pytest
+
+from backend.Catalog import create_synthesizers
+from backend.effects.Effects import ReverbEffect
+from backend.synths.FMSynths import FMSynth, DFM_OBOE
+from backend.utils.NoteRenderCache import NoteRenderCache
+from backend.utils.TrackRenderer import TrackRenderer
+
+from test_render_into import Note
+
+
+def linear_synths():
+    return [synth for synth in create_synthesizers() if synth.amplitude_linear]
+
+
+@pytest.mark.parametrize("synth", linear_synths(), ids=lambda synth: synth.name)
+def test_amplitude_linear_synths_scale_with_amp(synth):
+    # Notes of these synths are rendered at unit amplitude and scaled while mixing
+    quiet = np.float64(synth(60, 0.3, 0.3, seed=(1,)))
+    loud = np.float64(synth(60, 1.0, 0.3, seed=(1,)))
+    assert np.abs(quiet - 0.3 * loud).max() <= 1e-6 * np.abs(loud).max()
+
+
+def mixed_by_hand(synth, notes, volume, effect=None):
+    waves = []
+    for note in notes:
+        wave_array = synth(note.note, note.amplitude * volume, note.duration)
+        if effect is not None:
+            wave_array = effect(wave_array)
+        waves.append((int(note.time_on * 44100), np.float64(wave_array)))
+    track = np.zeros(max(n0 + wave_array.size for n0, wave_array in waves))
+    for n0, wave_array in waves:
+        track[n0 : n0 + wave_array.size] += wave_array
+    return track
+
+
+@pytest.mark.parametrize("with_effect", [False, True], ids=["dry", "reverb"])
+def test_scaled_notes_are_rendered_once(with_effect):
+    effect = None
+    if with_effect:
+        effect = ReverbEffect()
+        effect.params["active"] = True
+        effect.params["delay"] = 0.05
+    # The same note at four amplitudes: one render, mixed with four gains
+    notes = [Note(60, 0.2 * i, 0.3, 0.2 + 0.2 * i) for i in range(4)] + [Note(67, 0.1, 0.5, 0.9)]
+    renderer = TrackRenderer(44100, FMSynth(), notes, 0.6, effect=effect, cache=NoteRenderCache())
+    assert renderer.amplitude_linear
+    assert len(renderer.note_slots) == 2
+
+    expected = mixed_by_hand(FMSynth(), notes, 0.6, effect)
+    track = renderer.render()
+    assert track.size == expected.size
+    assert np.abs(track - expected).max() < 1e-5
+
+
+def test_non_linear_synths_render_every_amplitude():
+    notes = [Note(60, 0.2 * i, 0.3, 0.2 + 0.2 * i) for i in range(4)]
+    renderer = TrackRenderer(44100, DFM_OBOE(), notes, 0.6, cache=NoteRenderCache())
+    assert not renderer.amplitude_linear
+    assert len(renderer.note_slots) == 4
+    expected = mixed_by_hand(DFM_OBOE(), notes, 0.6)
+    assert np.abs(renderer.render() - expected).max() < 1e-5
@@ -0,0 +1,68 @@
+import numpy as np
+import pytest
+
+from backend.effects.Effects import DelayEffect, SimpleEchoEffect, ReverbEffect, COMB_LFILTER_MAX_DELAY
+
+
+# The per-sample loops the comb effects replaced, their output must not change
+
+def delay_loop(sound, delay_time, feedback, sample_rate):
+    sound = np.append(sound, np.zeros(int(5 * delay_time * sample_rate * (1/(1 - feedback*0.9)))))
+    delay_samples = int(delay_time * sample_rate)
+    delayed_sound = np.zeros(len(sound) + delay_samples)
+    for i in range(len(sound)):
+        delayed_sound[i + delay_samples] += sound[i] + feedback * delayed_sound[i]
+    return delayed_sound
+
+
+def echo_loop(sound, delay_samples, atenuation, duratio):
+    new_sound = np.append(np.zeros(delay_samples), sound)
+    new_sound = np.append(new_sound, np.zeros(int(duratio*delay_samples)))
+    sound_out = np.zeros(len(new_sound) + delay_samples)
+    for i in range(delay_samples, len(sound_out)):
+        sound_out[i] = new_sound[i-delay_samples] + sound_out[i - delay_samples]*atenuation
+    return sound_out[(2*delay_samples):]
+
+
+def active(effect, **params):
+    effect.params["active"] = True
+    for name, value in params.items():
+        effect.params[name] = value
+    return effect
+
+
+def noise(n_samples):
+    return np.random.default_rng(n_samples).uniform(-1, 1, n_samples).astype(np.float32)
+
+
+def check(effect, sound, expected):
+    output = effect.process(sound)
+    assert output.size == sound.size + effect.tail_length(sound.size)
+    assert np.array_equal(output, expected)
+
+
+@pytest.mark.parametrize("delay_time", [0.001, 0.012, 0.1])
+@pytest.mark.parametrize("feedback", [0.5, 0.99])
+def test_delay(delay_time, feedback):
+    effect = active(DelayEffect(), delay=delay_time, feedback=feedback)
+    sound = noise(3000)
+    check(effect, sound, delay_loop(sound, delay_time, feedback, effect.sample_rate))
+
+
+@pytest.mark.parametrize("n_samples", [20, COMB_LFILTER_MAX_DELAY - 1, COMB_LFILTER_MAX_DELAY, 3000])
+@pytest.mark.parametrize("duration", [1, 3.5])
+def test_echo(n_samples, duration):
+    # The delay of the echo is the length of the sound + 1
+    effect = active(SimpleEchoEffect(), Duration=duration, atenuation=0.9)
+    sound = noise(n_samples)
+    check(effect, sound, echo_loop(sound, n_samples + 1, 0.9, duration))
+
+
+@pytest.mark.parametrize("delay_time", [0.0, 0.001, 0.05])
+@pytest.mark.parametrize("duration", [1, 3.5])
+def test_reverb(delay_time, duration):
+    effect = active(ReverbEffect(), delay=delay_time, Duration=duration, atenuation=0.7)
+    delay_samples = int(delay_time * effect.sample_rate) + 1
+    assert (delay_samples < COMB_LFILTER_MAX_DELAY) == (delay_time < 0.05)
+    sound = noise(3000)
+    check(effect, sound, echo_loop(sound, delay_samples, 0.7, duration))
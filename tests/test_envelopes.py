@@ -0,0 +1,47 @@
+import numpy as np
+
+from backend.synths.EnvelopeModulators import LinearADSR
+from backend.synths.AdditiveSynths import PureToneSynth
+
+
+def reference_envelope(k, A, D, R, tone_duration, sample_rate=44100):
+    ''' Envelope of a note from its definition: the release starts at max(tone_duration, A + D) '''
+    release_time = max(tone_duration, A + D)
+    t = np.arange(int((tone_duration + R) * sample_rate)) / sample_rate
+    x = np.clip(t / A, 0, 1) if A > 0 else np.ones_like(t)
+    envelope = k * (1 - (1 - x)**3)
+    x = np.clip((t - A) / D, 0, 1) if D > 0 else np.ones_like(t)
+    envelope = np.where(t < A, envelope, k + (1 - k) * (1 - (1 - x)**3))
+    x = np.clip((t - release_time) / R, 0, 1)
+    return np.where(t < release_time, envelope, (1 - x)**3)
+
+
+def test_short_note_decays_before_release():
+    # Note shorter than A + D: the decay reaches 1 before the release starts
+    adsr = LinearADSR(2, 0.03, 0.1, 0.6)
+    adsr.set_tone_duration(0.1)
+    envelope = adsr.envelope()
+
+    # No jump after the attack (the note ends at sample 4410, in the middle of the decay)
+    attack_end = int(np.ceil(0.03 * 44100))
+    assert np.abs(np.diff(envelope[attack_end:])).max() < 1e-3
+    release_start = int(np.ceil(0.13 * 44100))
+    assert abs(envelope[release_start - 1] - 1.0) < 1e-3
+    assert np.allclose(envelope, reference_envelope(2, 0.03, 0.1, 0.6, 0.1), atol=1e-3)
+
+
+def test_apply_matches_envelope():
+    for tone_duration in [0.0, 0.05, 0.1, 0.13, 0.5]:
+        adsr = LinearADSR(2, 0.03, 0.1, 0.6)
+        adsr.set_tone_duration(tone_duration)
+        wave = np.ones(adsr.time().size, dtype=np.float32)
+        assert np.array_equal(adsr.apply(wave), adsr.envelope())
+
+
+def test_pure_tone_short_note():
+    synth = PureToneSynth()
+    synth.set_sample_rate(44100)
+    wave = np.asarray(synth(60, 1.0, 0.1), dtype=np.float64)
+    t = np.arange(wave.size) / 44100
+    expected = reference_envelope(2, 0.03, 0.1, 0.6, 0.1) * np.sin(2 * np.pi * 440 * 2**((60 - 69) / 12) * t)
+    assert np.abs(wave - expected).max() < 1e-3
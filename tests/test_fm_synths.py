@@ -0,0 +1,50 @@
+import numpy as np
+import pytest
+
+from backend.Catalog import create_synthesizers
+from backend.synths.FMSynths import DFM_sum, DFM_1
+from backend.utils import RenderConfig
+
+
+def exact_sum(t, freq, components):
+    return sum(DFM_1(t, N1 * freq, N2 * freq, amplitude, I1, I2) for amplitude, N1, N2, I1, I2 in components)
+
+
+@pytest.mark.parametrize("components", [
+    [(1.0, 1.0, 2.0, 1.5, 0.8)],
+    [(1.0, 1 / 7, 1.0, 2.0, 1.0)],
+    [(0.6, 3 / 8, 1.0, 1.0, 2.0), (0.4, 1 / 5, 2.0, 1.5, 0.5)],
+    [(0.5, 1 / 7, 1.0, 1.0, 1.0), (0.5, 1 / 5, 1.0, 1.0, 1.0)],
+])
+def test_period_tiling_accuracy(components):
+    # Tiled float32 sum against the exact float64 sum, at a high note where the table is stretched the most
+    t = np.arange(44100) / 44100
+    freq = 440 * 2**((96 - 69) / 12)
+    dtype = RenderConfig.get_render_dtype()
+    try:
+        RenderConfig.set_render_dtype("float64")
+        expected = exact_sum(t, freq, components)
+        RenderConfig.set_render_dtype("float32")
+        tiled = DFM_sum(t, freq, components)
+    finally:
+        RenderConfig.set_render_dtype(dtype)
+    assert tiled.dtype == np.float32
+    assert np.abs(tiled - expected).max() < 2e-6
+
+
+def control_rate_synths():
+    return [synth for synth in create_synthesizers() if "Control Rate" in synth.params.keys()]
+
+
+@pytest.mark.parametrize("synth", control_rate_synths(), ids=lambda synth: synth.name)
+def test_control_rate_is_opt_in(synth):
+    # Audio rate by default. Decimated curves stay within 2% of the peak, also on short notes
+    assert synth.params["Control Rate"] == 1
+    for duration in (0.05, 0.25, 2.0):
+        reference = synth(60, 0.8, duration)
+        synth.params["Control Rate"] = 32
+        try:
+            output = synth(60, 0.8, duration)
+        finally:
+            synth.params["Control Rate"] = 1
+        assert np.abs(output - reference).max() < 2e-2 * np.abs(reference).max()
@@ -0,0 +1,28 @@
+import numpy as np
+import pytest
+
+from backend.Catalog import create_synthesizers
+
+
+# Mixed pitches (and a note name), amplitudes and durations: several groups of equal duration, out of order
+NOTES = [60, 64, "A4", 60, 45, 72, 52]
+AMPS = [0.5, 0.8, 0.3, 0.5, 1.0, 0.2, 0.7]
+DURATIONS = [0.3, 0.6, 0.3, 0.6, 0.05, 0.3, 1.0]
+SEEDS = [(1, i) for i in range(len(NOTES))]
+
+
+def synth_names():
+    return [synth.name for synth in create_synthesizers()]
+
+
+@pytest.mark.parametrize("name", synth_names())
+def test_batch_matches_single_notes(name):
+    # A 2-D pass of generate_group() must give every row exactly the note generated on its own
+    synth = next(synth for synth in create_synthesizers() if synth.name == name)
+    batch = synth.generate_batch(NOTES, AMPS, DURATIONS, SEEDS)
+    assert len(batch) == len(NOTES)
+    for wave_array, note, amp, duration, seed in zip(batch, NOTES, AMPS, DURATIONS, SEEDS):
+        expected = synth(note, amp, duration, seed)
+        assert wave_array.dtype == expected.dtype
+        assert wave_array.size == synth.note_length(note, duration)
+        assert np.array_equal(wave_array, expected)
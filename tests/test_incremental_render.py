@@ -0,0 +1,106 @@
+import numpy as np
+import pytest
+
+from backend.effects.Effects import ReverbEffect
+from backend.synths.FMSynths import FMSynth
+from backend.synths.PhysicModelSynths import KSGuitar
+from backend.utils.NoteRenderCache import NoteRenderCache
+from backend.utils.TrackRenderer import TrackRenderer, track_seed
+
+from test_render_into import Note
+
+
+SEED = track_seed("track")
+
+
+def song():
+    return [Note(48 + (5 * i) % 17, 0.15 * i, 0.2 + 0.1 * (i % 4), 0.5 + 0.05 * (i % 5)) for i in range(12)]
+
+
+def render(instrument, notes, effect=None, previous=None, cache=None):
+    renderer = TrackRenderer(44100, instrument, notes, 0.7, effect=effect, cache=cache, previous=previous, seed=SEED)
+    renderer.render()
+    return renderer
+
+
+def assert_same_track(renderer, expected):
+    track = renderer.result()
+    assert track.size == expected.size
+    # Subtracting removed notes leaves float32 rounding residues
+    assert np.abs(track - expected).max() < 1e-5
+
+
+def added(notes):
+    return notes + [Note(70, 0.4, 0.5)]
+
+
+def removed(notes):
+    return notes[:3] + notes[4:]
+
+
+def moved(notes):
+    moved_note = notes[5]
+    return notes[:5] + [Note(moved_note.note, moved_note.time_on + 0.07, moved_note.duration, moved_note.amplitude)] + notes[6:]
+
+
+def last_removed(notes):
+    # The track gets shorter: the previous tail is subtracted and cut
+    return notes[:-1]
+
+
+@pytest.mark.parametrize("edit", [added, removed, moved, last_removed])
+@pytest.mark.parametrize("make_synth", [FMSynth, KSGuitar], ids=["fm", "ks-seeded"])
+@pytest.mark.parametrize("with_effect", [False, True], ids=["dry", "reverb"])
+def test_edited_notes_match_a_full_render(edit, make_synth, with_effect):
+    effect = None
+    if with_effect:
+        effect = ReverbEffect()
+        effect.params["active"] = True
+        effect.params["delay"] = 0.05
+    previous = render(make_synth(), song(), effect)
+    notes = edit(song())
+
+    incremental = render(make_synth(), notes, effect, previous=previous)
+    # Stochastic notes are seeded with their index: removing a note in the middle reseeds every note after it
+    if not (edit is removed and make_synth is KSGuitar):
+        assert incremental.incremental
+        assert incremental.rendered_notes < len(notes)
+    assert_same_track(incremental, render(make_synth(), notes, effect).result())
+
+
+def test_parameter_change_renders_every_note():
+    previous = render(FMSynth(), song())
+    synth = FMSynth()
+    synth.params["Control Rate"] = 8
+    renderer = render(synth, added(song()), previous=previous)
+    assert not renderer.incremental
+    assert np.array_equal(renderer.result(), render(synth, added(song())).result())
+
+
+def test_effect_change_renders_every_note():
+    effect = ReverbEffect()
+    effect.params["active"] = True
+    previous = render(FMSynth(), song(), effect)
+
+    changed = ReverbEffect()
+    changed.params["active"] = True
+    changed.params["atenuation"] = 0.3
+    for new_effect in (changed, None):
+        renderer = render(FMSynth(), song(), new_effect, previous=previous)
+        assert not renderer.incremental
+        assert np.array_equal(renderer.result(), render(FMSynth(), song(), new_effect).result())
+
+
+def test_unseeded_stochastic_synths_are_not_reused():
+    previous = TrackRenderer(44100, KSGuitar(), song(), 0.7)
+    previous.render()
+    renderer = TrackRenderer(44100, KSGuitar(), added(song()), 0.7, previous=previous)
+    assert not renderer.incremental
+
+
+def test_incremental_render_with_cache():
+    cache = NoteRenderCache()
+    previous = render(KSGuitar(), song(), cache=cache)
+    renderer = render(KSGuitar(), moved(song()), previous=previous, cache=cache)
+    assert renderer.incremental
+    assert_same_track(renderer, render(KSGuitar(), moved(song())).result())
@@ -0,0 +1,42 @@
+import numpy as np
+import pytest
+
+from backend.synths.PhysicModelSynths import karplus_strong, KS_MIN_STEP, KS_MAX_STEP
+
+
+def reference_loop(wavetable, stretches, signs=None):
+    # The original sample loop of the guitar (signs=None) and the drum
+    table = list(wavetable)
+    output = np.empty(stretches.size)
+    previous = 0.0
+    for k, stretch in enumerate(stretches):
+        position = k % len(table)
+        if stretch:
+            previous = table[position]
+        else:
+            sign = 1.0 if signs is None else signs[k]
+            previous = sign * 0.5 * (table[position] + previous)
+            table[position] = previous
+        output[k] = previous
+    return output
+
+
+# Wavetable sizes around the sample loop and step limits of karplus_strong()
+SIZES = [7, KS_MIN_STEP - 1, KS_MIN_STEP, 101, KS_MAX_STEP, KS_MAX_STEP + 1, 2 * KS_MAX_STEP + 37]
+
+
+@pytest.mark.parametrize("size", SIZES)
+@pytest.mark.parametrize("drum", [False, True], ids=["guitar", "drum"])
+@pytest.mark.parametrize("stretch_probability", [0.0, 1 - 1 / 1.03, 0.5])
+def test_matches_reference_loop(size, drum, stretch_probability):
+    rng = np.random.default_rng(size)
+    n = 3 * size + 2 * KS_MAX_STEP + 5
+    wavetable = rng.normal(0, 1, size)
+    wavetable -= wavetable.mean()
+    stretches = rng.random(n) < stretch_probability
+    signs = np.where(rng.random(n) < 0.5, 1.0, -1.0) if drum else None
+
+    expected = reference_loop(wavetable, stretches, signs)
+    output = karplus_strong(wavetable, stretches, signs)
+    assert output.shape == expected.shape
+    assert np.abs(output - expected).max() <= 1e-12 * np.abs(expected).max()
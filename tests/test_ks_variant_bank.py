@@ -0,0 +1,36 @@
+import copy
+import pickle
+
+import numpy as np
+
+from backend.synths.PhysicModelSynths import KSGuitar, KSDrum, KSVariantBank
+
+
+def test_render_copies_share_the_bank():
+    synth = KSGuitar()
+    render_copy = copy.copy(synth)
+    render_copy(60, 0.8, 0.3, seed=(1,))
+    assert len(synth.variant_bank) == 1
+    assert copy.copy(synth).variant_bank is synth.variant_bank
+
+    synth.clear_bank()
+    assert len(render_copy.variant_bank) == 0
+
+
+def test_pickled_synths_start_an_empty_bank():
+    synth = KSGuitar()
+    synth(60, 0.8, 0.3, seed=(1,))
+    unpickled = pickle.loads(pickle.dumps(synth))
+    assert unpickled.variant_bank is not synth.variant_bank
+    assert len(unpickled.variant_bank) == 0
+    assert (unpickled(60, 0.8, 0.3, seed=(1,)) == synth(60, 0.8, 0.3, seed=(1,))).all()
+
+
+def test_drum_is_rendered_note_by_note():
+    # The drum only sounds through the rounding of its zero mean wavetable, a bank string at unit amplitude is silent
+    drum = KSDrum()
+    assert not isinstance(drum, KSVariantBank)
+    for note in (40, 72):
+        output = drum(note, 0.8, 0.5, seed=(7,))
+        assert np.abs(output).max() > 1.0
+        assert np.array_equal(output, KSDrum()(note, 0.8, 0.5, seed=(7,)))
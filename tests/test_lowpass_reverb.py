@@ -0,0 +1,52 @@
+import numpy as np
+import pytest
+from scipy import signal
+
+from backend.effects.Effects import LowPass_ReverbEffect
+
+
+def reverb(fb, delay=0.05, atenuation=0.6):
+    effect = LowPass_ReverbEffect()
+    effect.params["active"] = True
+    effect.params["Fb"] = fb
+    effect.params["delay"] = delay
+    effect.params["Duration"] = 3
+    effect.params["atenuation"] = atenuation
+    return effect
+
+
+def gain(ba, frequencies, sample_rate):
+    b, a = ba
+    _, response = signal.freqz(b, a, worN=np.asarray(frequencies, dtype=float), fs=sample_rate)
+    return np.abs(response)
+
+
+@pytest.mark.parametrize("fb", [25, 500, 1000])
+def test_loop_filter_response(fb):
+    effect = reverb(fb)
+    sample_rate = effect.sample_rate
+    frequencies = np.linspace(0, sample_rate / 2, 512)
+    response = gain(effect.low_pass_filter(fb), frequencies, sample_rate)
+    assert response[0] == pytest.approx(1.0)
+    assert response[-1] == pytest.approx(0.0, abs=1e-9)
+    assert np.all(np.diff(response) <= 1e-12)
+    assert gain(effect.low_pass_filter(fb), [fb], sample_rate)[0] == pytest.approx(1 / np.sqrt(2), rel=1e-6)
+
+
+@pytest.mark.parametrize("fb", [200, 1000])
+def test_each_echo_is_darker(fb):
+    # The k-th echo of an impulse is atenuation^k times k passes through the loop filter
+    effect = reverb(fb)
+    sample_rate = effect.sample_rate
+    delay_samples = int(effect.params["delay"] * sample_rate) + 1
+    output = np.float64(effect(np.array([1.0], dtype=np.float32)))
+    assert output.size == 1 + effect.tail_length(1)
+    assert output[0] == pytest.approx(1.0)
+
+    frequencies = [0, fb / 2, fb, 4 * fb]
+    loop_response = gain(effect.low_pass_filter(fb), frequencies, sample_rate)
+    for k in (1, 2):
+        echo = output[k * delay_samples : (k + 1) * delay_samples]
+        echo_response = gain((echo, [1.0]), frequencies, sample_rate)
+        expected = 0.6**k * loop_response**k
+        assert echo_response == pytest.approx(expected, rel=1e-3, abs=1e-6)
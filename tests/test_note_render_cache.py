@@ -0,0 +1,66 @@
+import numpy as np
+
+from backend.synths.FMSynths import FMSynth
+from backend.effects.Effects import ReverbEffect
+from backend.utils.NoteRenderCache import NoteRenderCache
+
+
+def wave(n_samples):
+    return np.zeros(n_samples, dtype=np.float32)
+
+
+def test_byte_budget_evicts_the_least_recently_used():
+    cache = NoteRenderCache(max_bytes=3 * 400)
+    for key in "abc":
+        cache.put(key, wave(100))
+    assert cache.size_bytes == 1200
+
+    cache.get("a")                  # "b" is now the least recently used
+    cache.put("d", wave(100))
+    assert list(cache.entries) == ["c", "a", "d"]
+    assert cache.size_bytes == 1200
+
+    # A larger note evicts as many as needed, a note over the whole budget is not stored
+    cache.put("e", wave(200))
+    assert list(cache.entries) == ["d", "e"]
+    cache.put("f", wave(301))
+    assert "f" not in cache and cache.size_bytes == 1200
+
+    cache.set_max_bytes(800)
+    assert list(cache.entries) == ["e"] and cache.size_bytes == 800
+
+
+def test_replacing_a_key_keeps_the_size():
+    cache = NoteRenderCache(max_bytes=1000)
+    cache.put("a", wave(100))
+    cache.put("a", wave(50))
+    assert len(cache) == 1 and cache.size_bytes == 200
+
+
+def test_counters_and_read_only_entries():
+    cache = NoteRenderCache()
+    cache.put("a", wave(10))
+    assert cache.get("a") is not None and cache.get("b") is None
+    assert (cache.hits, cache.misses) == (1, 1)
+    assert not cache.get("a").flags.writeable
+
+
+def test_parameter_changes_change_the_key():
+    cache = NoteRenderCache()
+    synth = FMSynth()
+    effect = ReverbEffect()
+    key = cache.note_key(synth, 60, 0.5, 1.0, effect)
+    assert cache.note_key(synth, 60, 0.5, 1.0, effect) == key
+
+    synth.params["Control Rate"] = 4
+    synth_key = cache.note_key(synth, 60, 0.5, 1.0, effect)
+    assert synth_key != key
+
+    effect.params["active"] = True
+    assert cache.note_key(synth, 60, 0.5, 1.0, effect) != synth_key
+
+    # Restoring the values restores the key
+    synth.params["Control Rate"] = 1
+    effect.params["active"] = False
+    assert cache.note_key(synth, 60, 0.5, 1.0, effect) == key
+    assert cache.note_key(synth, 60, 0.5, 1.0, None) != key
@@ -0,0 +1,86 @@
+import numpy as np
+import pytest
+
+from backend.Catalog import create_synthesizers, create_effects
+from backend.effects.Effects import DelayEffect, ReverbEffect
+from backend.synths.FMSynths import FMSynth
+from backend.utils import RenderConfig
+from backend.utils.TrackRenderer import TrackRenderer, render_note_batch
+
+
+class Note():
+    def __init__(self, note, time_on, duration, amplitude=0.8):
+        self.note = note
+        self.time_on = time_on
+        self.time_off = time_on + duration
+        self.duration = duration
+        self.amplitude = amplitude
+
+
+def synth_names():
+    return [synth.name for synth in create_synthesizers()]
+
+
+def effects():
+    # Every effect of the catalog, active, and the delay effect that is not in it
+    result = []
+    for effect in create_effects() + [DelayEffect()]:
+        if "active" in effect.params:
+            effect.params["active"] = True
+        result.append(effect)
+    return result
+
+
+@pytest.fixture(params=["float32", "float64"])
+def dtype(request):
+    previous = RenderConfig.get_render_dtype()
+    RenderConfig.set_render_dtype(request.param)
+    yield RenderConfig.get_render_dtype()
+    RenderConfig.set_render_dtype(previous)
+
+
+@pytest.mark.parametrize("name", synth_names())
+def test_synth_render_into_adds_call(name, dtype):
+    synth = next(synth for synth in create_synthesizers() if synth.name == name)
+    for note, amp, duration in [(60, 0.7, 0.05), (84, 0.5, 0.6)]:
+        expected = synth(note, amp, duration, seed=(3,))
+        out = np.full(synth.note_length(note, duration) + 5, 0.25, dtype=dtype)
+        prefill = out.copy()
+        written = synth.render_into(out, note, amp, duration, seed=(3,))
+        prefill[:expected.size] += expected
+        assert written == expected.size
+        assert np.array_equal(out, prefill)
+
+
+@pytest.mark.parametrize("effect", effects(), ids=lambda effect: effect.name)
+def test_effect_render_into_adds_call(effect, dtype):
+    sound = np.random.default_rng(1).uniform(-1, 1, 9000).astype(dtype)
+    expected = effect(sound)
+    out = np.full(sound.size + effect.tail_length(sound.size) + 5, 0.25, dtype=dtype)
+    prefill = out.copy()
+    written = effect.render_into(out, sound)
+    prefill[:expected.size] += expected
+    assert written == expected.size
+    assert np.array_equal(out, prefill)
+
+
+def test_effect_render_into_checks_length():
+    effect = DelayEffect()
+    effect.params["active"] = True
+    sound = np.ones(1000, dtype=RenderConfig.get_render_dtype())
+    with pytest.raises(ValueError):
+        effect.render_into(np.zeros(sound.size), sound)
+
+
+def test_track_render_into_matches_batches():
+    # Synchronous renders mix FM notes with render_into(), the process pool with the batches of render_note_batch()
+    synth = FMSynth()
+    effect = ReverbEffect()
+    effect.params["active"] = True
+    notes = [Note(48 + 3 * i, 0.1 * i, 0.3 + 0.1 * (i % 3)) for i in range(8)]
+    direct = TrackRenderer(44100, synth, notes, 0.5, effect=effect).render()
+    batched = TrackRenderer(44100, synth, notes, 0.5, effect=effect)
+    for task in batched.tasks:
+        batched.mix_results(render_note_batch(*task, *batched.shared_args))
+    assert np.allclose(direct, batched.finish(), atol=1e-6)
+
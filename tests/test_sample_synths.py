@@ -0,0 +1,15 @@
+import copy
+
+from backend.synths.SampleSynths import SaxoTenorSampleSynth
+
+
+def test_note_length_does_not_load_samples():
+    synth = SaxoTenorSampleSynth()
+    events = [(note, duration) for note in (50, 57, 63) for duration in (0.001, 0.4, 1.5)]
+    lengths = [synth.note_length(note, duration) for note, duration in events]
+    assert len(synth.samples) == 0
+
+    # Render copies load and pitch shift the samples into the dict of the synth
+    render_copy = copy.copy(synth)
+    assert [render_copy(note, 0.5, duration).size for note, duration in events] == lengths
+    assert len(synth.samples) > 0
@@ -0,0 +1,178 @@
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+import pytest
+from PyQt5.QtCore import QCoreApplication
+
+from backend.synths.FMSynths import FMSynth
+from backend.synths.PhysicModelSynths import KSGuitar
+from backend.utils import RenderConfig
+from backend.utils.SynthTrackManager import SynthTrackManager
+from backend.utils.TrackRenderer import TrackRenderer, track_seed
+from backend.utils.Worker import Worker
+
+from test_render_into import Note
+
+
+@pytest.fixture(scope="module")
+def app():
+    return QCoreApplication.instance() or QCoreApplication([])
+
+
+def notes():
+    return [Note(48 + i, 0.1 * i, 0.4) for i in range(16)]
+
+
+def wait_for(app, condition, timeout=60):
+    end = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < end, "timed out"
+        app.processEvents()
+        time.sleep(0.001)
+
+
+def synthesize(app, manager, name):
+    return synthesize_with(app, manager, name, FMSynth())
+
+
+def synthesize_with(app, manager, name, instrument):
+    results = {}
+    manager.synthTrackComplete.connect(lambda track_name, data: results.__setitem__(track_name, data))
+    manager.synthesize_track(name, instrument, notes(), 0.5)
+    wait_for(app, lambda: name in results)
+    return results[name]["track_array"]
+
+
+@pytest.mark.parametrize("backend", SynthTrackManager.backends)
+def test_backends_render_like_the_track_renderer(app, backend):
+    manager = SynthTrackManager(44100, backend=backend, max_workers=2)
+    try:
+        track = synthesize(app, manager, "track")
+    finally:
+        manager.shutdown()
+    expected = TrackRenderer(44100, FMSynth(), notes(), 0.5).render()
+    assert np.allclose(track, expected, atol=1e-6)
+
+
+def test_shared_pool_follows_the_render_dtype(app):
+    # The process pool is created in float32, the second render must still run in float64
+    manager = SynthTrackManager(44100, backend="process", max_workers=2)
+    previous = RenderConfig.get_render_dtype()
+    try:
+        synthesize(app, manager, "first")
+        RenderConfig.set_render_dtype("float64")
+        track = synthesize(app, manager, "second")
+        expected = TrackRenderer(44100, FMSynth(), notes(), 0.5).render()
+    finally:
+        RenderConfig.set_render_dtype(previous)
+        manager.shutdown()
+    assert track.dtype == np.float64
+    assert np.allclose(track, expected, rtol=0, atol=1e-12)
+
+
+def test_restart_does_not_report_completion(app):
+    manager = SynthTrackManager(44100, backend="thread")
+    events = []
+    manager.allTracksComplete.connect(lambda: events.append("all"))
+    manager.synthTrackComplete.connect(lambda name, data: events.append(name))
+    try:
+        manager.synthesize_track("track", FMSynth(), notes(), 0.5)
+        manager.synthesize_track("track", FMSynth(), notes(), 0.5)
+        assert events == []
+        wait_for(app, lambda: "all" in events)
+    finally:
+        manager.shutdown()
+    assert events == ["track", "all"]
+
+
+def test_batched_results_are_not_held_back(app):
+    worker = Worker(function=lambda: None)
+    worker.set_batch_interval(0.05, max_bytes=1000)
+    batches = []
+    worker.resultsReady.connect(batches.append)
+
+    worker.deliver("first")
+    worker.deliver("held")
+    app.processEvents()
+    assert batches == [["first"]]
+    # No other result comes, the timer emits the held one at the end of the interval
+    wait_for(app, lambda: len(batches) == 2, timeout=5)
+    assert batches[1] == ["held"]
+
+    # Held results never add up to more than max_bytes
+    big = np.zeros(100)
+    worker.deliver(big)
+    worker.deliver(big)
+    app.processEvents()
+    assert len(batches) == 3 and len(batches[2]) == 2
+
+
+def test_deterministic_incremental_rerender(app):
+    manager = SynthTrackManager(44100, backend="threads", deterministic=True)
+    fresh = SynthTrackManager(44100, backend="threads", deterministic=True)
+    edited = notes() + [Note(75, 0.5, 0.3)]
+    results = {}
+    for m in (manager, fresh):
+        m.synthTrackComplete.connect(lambda name, data, m=m: results.__setitem__((id(m), name), data["track_array"]))
+    try:
+        manager.synthesize_track("track", KSGuitar(), notes(), 0.5)
+        wait_for(app, lambda: (id(manager), "track") in results)
+        del results[(id(manager), "track")]
+        manager.synthesize_track("track", KSGuitar(), edited, 0.5)
+        fresh.synthesize_track("track", KSGuitar(), edited, 0.5)
+        wait_for(app, lambda: len(results) == 2)
+    finally:
+        manager.shutdown()
+        fresh.shutdown()
+    assert manager.rendered["track"].incremental
+    assert np.abs(results[(id(manager), "track")] - results[(id(fresh), "track")]).max() < 1e-5
+
+
+def test_seeded_tracks_match_across_backends(app):
+    # Stochastic notes are seeded from (track name, note index), not from the thread or process that renders them.
+    # Overlapping notes may be mixed in another order, so float32 sums can differ by a rounding
+    tracks = []
+    for backend in SynthTrackManager.backends:
+        manager = SynthTrackManager(44100, backend=backend, max_workers=2, deterministic=True)
+        try:
+            tracks.append(synthesize_with(app, manager, "track", KSGuitar()))
+        finally:
+            manager.shutdown()
+    tracks.append(TrackRenderer(44100, KSGuitar(), notes(), 0.5, seed=track_seed("track")).render())
+    tracks.append(TrackRenderer(44100, KSGuitar(), notes(), 0.5, seed=track_seed("track")).render(max_workers=2))
+    for track in tracks[1:]:
+        assert track.size == tracks[0].size
+        assert np.abs(track - tracks[0]).max() < 1e-6
+
+    unseeded = SynthTrackManager(44100, backend="thread", deterministic=False)
+    try:
+        track = synthesize_with(app, unseeded, "track", KSGuitar())
+    finally:
+        unseeded.shutdown()
+    assert np.abs(track - tracks[0]).max() > 1e-3
+
+
+def test_backend_is_not_changed_while_synthesizing(app):
+    manager = SynthTrackManager(44100, backend="thread")
+    try:
+        manager.synthesize_track("track", FMSynth(), notes(), 0.5)
+        with pytest.raises(Exception):
+            manager.set_backend("process")
+        assert manager.backend == "thread" and manager.process_pool is None
+        manager.cancel()
+        manager.set_backend("threads")
+        assert manager.backend == "threads"
+    finally:
+        manager.shutdown()
+
+
+def test_worker_processes_do_not_import_the_gui():
+    # Spawned workers import main.py as __mp_main__, and then the modules of the synths and effects they unpickle
+    code = ("import sys, main, backend.utils.TrackRenderer, backend.Catalog; "
+            "print([name for name in ('PyQt5', 'frontend', 'sympy') if name in sys.modules])")
+    root = Path(__file__).resolve().parent.parent
+    result = subprocess.run([sys.executable, "-c", code], cwd=root, capture_output=True, text=True, check=True)
+    assert result.stdout.strip() == "[]"